@@ -0,0 +1,144 @@
+"""
+Benchmark aggregate query latency of the SQLite and DuckDB/Parquet analytics backends.
+
+Synthetic retail_data tables are generated at each size from the dimension values of the
+bundled CSV, written both as an indexed SQLite table (as ingestion does) and as a Parquet
+dataset, and queried through the same engines the agent uses.
+
+Usage (from the backend directory; requires duckdb and duckdb-engine):
+    python -m benchmarks.analytics_backends --rows 1000000 10000000 50000000
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from database.connection import create_duckdb_engine, create_sqlite_engine
+from database.ingest import (
+    COLUMN_TYPES, DEFAULT_CSV_PATH, DIMENSION_COLUMNS, TABLE_NAME, _create_table_sql, create_indexes, read_csv_chunks,
+)
+from database.parquet_store import PARQUET_TYPES, ParquetDataset
+
+# Months covered by the synthetic data
+MONTHS = 120
+
+QUERIES = {
+    "period_city_manufacturer": (
+        'SELECT Period, City, Manufacturer, SUM(Sales_Value) FROM retail_data '
+        'GROUP BY Period, City, Manufacturer'
+    ),
+    "manufacturer_by_period": (
+        "SELECT Period, SUM(Sales_Value), SUM(\"Sales_Volume(KG_LTRS)\") FROM retail_data "
+        "WHERE Manufacturer = 'CAPRA' GROUP BY Period"
+    ),
+    "top_brands": (
+        "SELECT Brand, SUM(Sales_Value) AS total FROM retail_data GROUP BY Brand ORDER BY total DESC LIMIT 5"
+    ),
+}
+
+def dimension_values() -> Dict[str, List[str]]:
+    values = {column: set() for column in DIMENSION_COLUMNS}
+    for chunk in read_csv_chunks(DEFAULT_CSV_PATH, 50_000):
+        for column in DIMENSION_COLUMNS:
+            values[column].update(value for value in chunk[column] if value is not None)
+    return {column: sorted(found) for column, found in values.items()}
+
+def _sql_list(values: List[str]) -> str:
+    return "[" + ", ".join("'" + value.replace("'", "''") + "'" for value in values) + "]"
+
+def _generated_columns(values: Dict[str, List[str]], index: str, pick) -> List[str]:
+    # Each dimension cycles through its values with a different stride so combinations vary
+    expressions = [f"date '2015-01-01' + to_months(CAST({index} % {MONTHS} AS INTEGER))"]
+    for stride, column in enumerate(DIMENSION_COLUMNS, start=3):
+        expressions.append(pick(values[column], f"({index} * {stride} + {index} // 7) % {len(values[column])}"))
+    expressions += [f"50 + {index} % 2500", f"({index} * 13) % 100000 / 10.0", f"({index} * 17) % 10000000 / 10.0"]
+    return expressions
+
+def build_parquet(values: Dict[str, List[str]], rows: int, directory: str) -> ParquetDataset:
+    import duckdb
+
+    dataset = ParquetDataset(TABLE_NAME, directory)
+    os.makedirs(dataset.directory, exist_ok=True)
+    expressions = _generated_columns(values, "i", lambda options, position: f"{_sql_list(options)}[1 + {position}]")
+    columns = ", ".join(
+        f'CAST({expression} AS {PARQUET_TYPES[sql_type]}) AS "{column}"'
+        for expression, (column, sql_type) in zip(expressions, COLUMN_TYPES.items())
+    )
+    conn = duckdb.connect()
+    try:
+        conn.execute(
+            f"COPY (SELECT {columns} FROM range({rows}) t(i) ORDER BY \"Period\") "
+            f"TO '{os.path.join(dataset.directory, 'part-bench.parquet')}' (FORMAT PARQUET, COMPRESSION ZSTD)"
+        )
+    finally:
+        conn.close()
+    dataset.commit(f"bench-{rows}", ["part-bench.parquet"], rows)
+    return dataset
+
+def build_sqlite(values: Dict[str, List[str]], rows: int, path: str):
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("BEGIN")
+        conn.execute(_create_table_sql(TABLE_NAME))
+        for column in DIMENSION_COLUMNS:
+            conn.execute(f'CREATE TEMP TABLE "dim_{column}" (k INTEGER PRIMARY KEY, v TEXT)')
+            conn.executemany(f'INSERT INTO "dim_{column}" VALUES (?, ?)', enumerate(values[column]))
+        joins = " ".join(
+            f'JOIN "dim_{column}" d{n} ON d{n}.k = (i * {n + 3} + i / 7) % {len(values[column])}'
+            for n, column in enumerate(DIMENSION_COLUMNS)
+        )
+        dimensions = ", ".join(f"d{n}.v" for n in range(len(DIMENSION_COLUMNS)))
+        conn.execute(
+            f"INSERT INTO {TABLE_NAME} "
+            f"WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i < {rows - 1}) "
+            f"SELECT strftime('%Y-%m-%d %H:%M:%S', '2015-01-01', '+' || (i % {MONTHS}) || ' months'), {dimensions}, "
+            f"50 + i % 2500, (i * 13) % 100000 / 10.0, (i * 17) % 10000000 / 10.0 FROM seq {joins}"
+        )
+        create_indexes(conn)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def time_queries(engine, repeat: int) -> Dict[str, float]:
+    timings = {}
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.exec_driver_sql(sql).fetchall()
+                samples.append(time.perf_counter() - started)
+            timings[name] = statistics.median(samples)
+    return timings
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark SQLite and DuckDB/Parquet aggregate latency.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000, 50_000_000])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query; the median is reported")
+    parser.add_argument("--workdir", default=None, help="Directory for the generated data (a temporary one by default)")
+    args = parser.parse_args(argv)
+
+    values = dimension_values()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="analytics-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    print(f"{'rows':>12} {'query':<26} {'sqlite (s)':>11} {'duckdb (s)':>11} {'speedup':>8}")
+    for rows in args.rows:
+        started = time.perf_counter()
+        sqlite_path = os.path.join(workdir, f"retail_{rows}.db")
+        if not os.path.exists(sqlite_path):
+            build_sqlite(values, rows, sqlite_path)
+        dataset = build_parquet(values, rows, os.path.join(workdir, f"parquet_{rows}"))
+        print(f"# generated {rows:,} rows in {time.perf_counter() - started:.1f}s")
+
+        sqlite_timings = time_queries(create_sqlite_engine(sqlite_path, read_only=True), args.repeat)
+        duckdb_timings = time_queries(create_duckdb_engine(dataset), args.repeat)
+        for name in QUERIES:
+            sqlite_s, duckdb_s = sqlite_timings[name], duckdb_timings[name]
+            print(f"{rows:>12,} {name:<26} {sqlite_s:>11.3f} {duckdb_s:>11.3f} {sqlite_s / duckdb_s:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compare the wall-clock time of answering a report's questions one /query call at a time
+with a single /query/batch call.
+
+Start the API with caching disabled so both runs do the same work:
+    CACHE_TYPE=NullCache PROMPT_CACHE_ENABLED=false python run.py
+
+Then, from the backend directory:
+    python -m benchmarks.batch_queries --url http://127.0.0.1:8000 --questions report.txt
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+# Questions of a typical weekly market report, used when no file is given
+DEFAULT_QUESTIONS = [
+    "What are the monthly sales values in Abidjan over the last 12 months?",
+    "Which 5 brands have the highest sales value?",
+    "Compare the sales volume of each channel by city.",
+    "How did CAPRA's market share evolve by quarter?",
+    "What is the average unit price by segment?",
+    "Which manufacturers grew their sales value the most year over year?",
+    "What share of sales comes from each packaging type?",
+    "Which items have the highest sales volume in Bouake?",
+]
+
+def run_sequential(client: httpx.Client, url: str, questions: List[str]) -> Dict[str, Any]:
+    tokens, cost, failed = 0, 0.0, 0
+    started = time.perf_counter()
+    for question in questions:
+        response = client.post(f"{url}/query", json={"input": question})
+        if response.status_code != 200:
+            failed += 1
+            continue
+        body = response.json()
+        tokens += body["tokens_used"]
+        cost += body["cost"]
+    return {"seconds": time.perf_counter() - started, "tokens_used": tokens, "cost": cost, "failed": failed}
+
+def run_batch(client: httpx.Client, url: str, questions: List[str], concurrency: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    first_result = None
+    summary = {}
+    with client.stream("POST", f"{url}/query/batch", json={"questions": questions, "max_concurrency": concurrency}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            item = json.loads(line)
+            if "summary" in item:
+                summary = item["summary"]
+            elif first_result is None:
+                first_result = time.perf_counter() - started
+    return {
+        "seconds": time.perf_counter() - started,
+        "first_result_seconds": first_result,
+        "tokens_used": summary.get("tokens_used"),
+        "cost": summary.get("cost"),
+        "failed": summary.get("failed"),
+    }
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark /query/batch against sequential /query calls.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the running API")
+    parser.add_argument("--questions", default=None, help="File with one question per line")
+    parser.add_argument("--concurrency", type=int, default=4, help="max_concurrency sent with the batch")
+    args = parser.parse_args(argv)
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    with httpx.Client(timeout=None) as client:
+        sequential = run_sequential(client, args.url, questions)
+        batch = run_batch(client, args.url, questions, args.concurrency)
+
+    print(f"{len(questions)} questions")
+    print(f"sequential /query: {sequential}")
+    print(f"/query/batch:      {batch}")
+    print(f"speedup: {sequential['seconds'] / batch['seconds']:.1f}x")
+
+if __name__ == "__main__":
+    main()
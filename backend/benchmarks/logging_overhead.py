@@ -0,0 +1,94 @@
+"""
+Measure the time /query spends logging a request on the request path, with the previous
+setup (handlers attached twice, writing synchronously, full chat history at INFO) and with
+the queue-based pipeline of utils.setup_logging (capped fields, history sampled at DEBUG).
+
+Logs are written under a temporary directory. From the backend directory:
+    python -m benchmarks.logging_overhead --requests 2000 --history-turns 6
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Callable, List
+
+QUESTION = "What are the monthly sales values of the top 5 brands in Abidjan over the last 12 months?"
+
+def make_history(turns: int, rows: int) -> List[str]:
+    # Answers of the chatbot carry HTML tables, which makes histories long
+    table = "<table>" + "".join(
+        f"<tr><td>Brand {i}</td><td>2023-{i % 12 + 1:02d}</td><td>{i * 1234.5:.2f}</td></tr>" for i in range(rows)
+    ) + "</table>"
+    history = []
+    for turn in range(turns):
+        history.append(f"Human: {QUESTION} (follow-up {turn})")
+        history.append(f"AI: Here are the results.\n{table}")
+    return history
+
+def legacy_logger(log_dir: str) -> logging.Logger:
+    # The previous setup_logging, called at import in utils.py and again in main.py
+    logger = logging.getLogger("benchmark.legacy")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    for _ in range(2):
+        c_handler = logging.StreamHandler()
+        f_handler = RotatingFileHandler(os.path.join(log_dir, "legacy.log"), maxBytes=10*1024*1024, backupCount=5)
+        c_handler.setLevel(logging.INFO)
+        f_handler.setLevel(logging.DEBUG)
+        for handler in (c_handler, f_handler):
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            logger.addHandler(handler)
+    return logger
+
+def run(log_request: Callable[[], None], requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        log_request()
+    return (time.perf_counter() - started) / requests
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the per-request cost of request logging.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--history-turns", type=int, default=6, help="Question/answer pairs in the chat history")
+    parser.add_argument("--table-rows", type=int, default=50, help="Rows of the HTML table in each answer")
+    args = parser.parse_args(argv)
+
+    history = make_history(args.history_turns, args.table_rows)
+    workdir = tempfile.mkdtemp(prefix="logging_overhead_")
+    os.chdir(workdir)
+    # Console output goes to a file, as it would to a container log pipe
+    sys.stderr = open(os.path.join(workdir, "console.log"), "w")
+
+    legacy = legacy_logger(workdir)
+
+    def log_legacy():
+        legacy.info(f"Received query: {QUESTION}")
+        legacy.info(f"Chat history: {history}")
+
+    from utils import setup_logging, shutdown_logging
+    from structured_logging import query_fields, log_sampled_payload
+    pipeline = setup_logging()
+
+    def log_pipeline():
+        pipeline.info("Received query", extra=query_fields(QUESTION, history))
+        log_sampled_payload(pipeline, "Chat history", history)
+
+    legacy_seconds = run(log_legacy, args.requests)
+    pipeline_seconds = run(log_pipeline, args.requests)
+    # Time for the listener to write what is still queued
+    drain_started = time.perf_counter()
+    shutdown_logging()
+    drain_seconds = time.perf_counter() - drain_started
+
+    sys.stderr = sys.__stderr__
+    history_chars = sum(len(entry) for entry in history)
+    print(f"{args.requests} requests, chat history of {len(history)} entries ({history_chars} chars), logs in {workdir}")
+    print(f"previous setup:   {legacy_seconds * 1e6:8.1f} us/request on the request path")
+    print(f"queued pipeline:  {pipeline_seconds * 1e6:8.1f} us/request on the request path "
+          f"(+{drain_seconds * 1e3:.1f} ms to drain the queue at the end)")
+
+if __name__ == "__main__":
+    main()
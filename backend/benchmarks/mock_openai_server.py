@@ -0,0 +1,90 @@
+"""
+Local mock of the OpenAI chat completions API, to exercise the LLM client layer
+(connection reuse, rate limiting, retries and failover) without calling a provider.
+
+Every request is answered with a fixed message after `--latency` seconds; every
+`--rate-limit-every`-th request gets a 429 with a Retry-After header instead.
+
+Usage (from the backend directory):
+    python -m benchmarks.mock_openai_server --port 8100 --latency 0.2 --rate-limit-every 5
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 python run.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+def create_app(latency: float, rate_limit_every: int, answer: str) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI API")
+    counter = itertools.count(1)
+    stats = {"requests": 0, "rate_limited": 0, "connections": set()}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        number = next(counter)
+        stats["requests"] += 1
+        stats["connections"].add(f"{request.client.host}:{request.client.port}")
+        if rate_limit_every and number % rate_limit_every == 0:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                headers={"retry-after": "1"},
+            )
+        await asyncio.sleep(latency)
+        created = int(time.time())
+        completion_id = f"chatcmpl-mock-{number}"
+        model = body.get("model", "gpt-4o")
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(answer.split()), "total_tokens": 100 + len(answer.split())},
+            }
+
+        def chunk(delta, finish_reason=None):
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for word in answer.split(" "):
+                yield chunk({"content": word + " "})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    def read_stats():
+        return {"requests": stats["requests"], "rate_limited": stats["rate_limited"], "connections": len(stats["connections"])}
+
+    return app
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI-compatible chat completions server.")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before each answer")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with a 429 (0 disables)")
+    parser.add_argument("--answer", default="This is a mock answer from the local OpenAI-compatible server.")
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(args.latency, args.rate_limit_every, args.answer), port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
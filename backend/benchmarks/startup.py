@@ -0,0 +1,96 @@
+"""
+Measure the import time of the API and the cold start of a worker: the time until
+/healthz answers (the server is listening) and until /readyz answers 200 (warm-up done).
+
+From the backend directory, with the data already ingested (python -m database.ingest):
+    python -m benchmarks.startup --runs 5
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+def measure_import(module: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    :param module: Module to import.
+    :return: Tuple of the total import seconds and (module, seconds) of its slowest direct imports.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    total = 0.0
+    direct = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)", line)
+        if not match:
+            continue
+        seconds, depth, name = int(match.group(1)) / 1e6, len(match.group(2)), match.group(3)
+        if depth == 0 and name == module:
+            total = seconds
+        elif depth == 2:
+            # Cumulative time of a module imported by the measured one (including what it imports first)
+            direct.append((name, seconds))
+    return total, sorted(direct, key=lambda item: -item[1])[:10]
+
+def measure_cold_start(port: int, timeout: float) -> Dict[str, float]:
+    """
+    Start one uvicorn worker and poll the health endpoints.
+
+    :param port: Port to listen on.
+    :param timeout: Seconds to wait for readiness.
+    :return: Dictionary with the seconds until /healthz and /readyz answered, and the warm-up steps.
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    timings = {}
+    try:
+        with httpx.Client(timeout=1.0) as client:
+            while time.perf_counter() - started < timeout:
+                try:
+                    if "healthz_seconds" not in timings:
+                        client.get(f"http://127.0.0.1:{port}/healthz").raise_for_status()
+                        timings["healthz_seconds"] = time.perf_counter() - started
+                    response = client.get(f"http://127.0.0.1:{port}/readyz")
+                    if response.status_code == 200:
+                        timings["readyz_seconds"] = time.perf_counter() - started
+                        for name, step in response.json()["steps"].items():
+                            timings[f"{name}_seconds"] = step["seconds"]
+                        return timings
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.02)
+        raise TimeoutError(f"Worker not ready after {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark API import time and worker cold start.")
+    parser.add_argument("--runs", type=int, default=5, help="Measurements per metric (medians are reported)")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for a worker to be ready")
+    args = parser.parse_args(argv)
+
+    imports = [measure_import("main") for _ in range(args.runs)]
+    print(f"import main: {statistics.median(total for total, _ in imports):.3f}s (median of {args.runs})")
+    for name, seconds in imports[-1][1]:
+        print(f"  {name:<28} {seconds:.3f}s")
+
+    runs = [measure_cold_start(args.port, args.timeout) for _ in range(args.runs)]
+    print(f"cold start (median of {args.runs}):")
+    for key in runs[0]:
+        print(f"  {key:<28} {statistics.median(run[key] for run in runs):.3f}s")
+
+if __name__ == "__main__":
+    main()
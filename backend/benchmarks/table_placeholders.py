@@ -0,0 +1,153 @@
+"""
+Compare final answers that type their tables as HTML (HTML_TABLE_INSTRUCTIONS) with answers
+that cite query results as [table:<handle>] placeholders rendered server-side.
+
+For typical table questions, the query runs on the ingested data and both answers are built:
+the typed answer as the old prompt asks for it, the placeholder answer as the new one does.
+Output tokens are counted with the model's tokenizer, and answer latency is the decode time
+at --tokens-per-second plus the measured server-side expansion.
+
+With --live, the agent LLM writes both answers from the query result instead, and the
+completion tokens and wall-clock time of each call are measured. From the backend directory:
+    python -m benchmarks.table_placeholders
+    PROMPT_CACHE_ENABLED=false python -m benchmarks.table_placeholders --live --model gpt-4o
+"""
+import argparse
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+# Table questions and the queries answering them
+QUESTIONS = [
+    ("Which 10 brands have the highest sales value?",
+     "SELECT Brand, SUM(Sales_Value) AS Sales_Value FROM retail_data GROUP BY Brand ORDER BY Sales_Value DESC LIMIT 10"),
+    ("Show the monthly sales value and volume in Abidjan.",
+     "SELECT Period, SUM(Sales_Value) AS Sales_Value, SUM(`Sales_Volume(KG_LTRS)`) AS Sales_Volume "
+     "FROM retail_data WHERE City = 'Abidjan' GROUP BY Period ORDER BY Period"),
+    ("Compare the sales value of each channel by city.",
+     "SELECT City, Channel, SUM(Sales_Value) AS Sales_Value FROM retail_data GROUP BY City, Channel ORDER BY City, Channel"),
+    ("What is the average unit price of the 20 most sold items?",
+     "SELECT `Item Name`, AVG(Unit_Price) AS Avg_Unit_Price, SUM(`Sales_Volume(KG_LTRS)`) AS Sales_Volume "
+     "FROM retail_data GROUP BY `Item Name` ORDER BY Sales_Volume DESC LIMIT 20"),
+]
+
+INTRO = "Here are the results for your question. Key findings are summarized below.\n\n"
+
+def typed_table(columns: List[str], rows: List[list]) -> str:
+    # The table markup the old prompt asks the model to write, cell by cell
+    from tools.result_tables import format_cell
+
+    header = "".join(f"      <th>{column}</th>\n" for column in columns)
+    body = "".join(
+        "    <tr>\n" + "".join(f"      <td>{format_cell(value)}</td>\n" for value in row) + "    </tr>\n"
+        for row in rows
+    )
+    return f"<table>\n  <thead>\n    <tr>\n{header}    </tr>\n  </thead>\n  <tbody>\n{body}  </tbody>\n</table>"
+
+def run_query(sql: str) -> Tuple[str, str]:
+    """
+    Run a query like the agent's sql_db_query tool.
+
+    :param sql: SQL query.
+    :return: Tuple of the result handle and the tool output.
+    """
+    from database.result_store import split_result_handle
+    from database.sql_db_langchain import get_sql_database
+
+    output = get_sql_database().run(sql)
+    handle, _ = split_result_handle(output)
+    return handle, output
+
+def median_seconds(function, repeat: int = 20) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def offline(model: str, tokens_per_second: float) -> List[Dict[str, Any]]:
+    from context_budget import context_budget
+    from database.result_store import result_store
+    from tools.result_tables import result_tables
+
+    measurements = []
+    for question, sql in QUESTIONS:
+        handle, _ = run_query(sql)
+        page = result_store.page(handle, 0, result_tables.max_rows)
+        typed = INTRO + typed_table(page["columns"], page["rows"])
+        placeholder = INTRO + f"[table:{handle}]"
+        typed_tokens = context_budget.count_tokens(typed, model)
+        placeholder_tokens = context_budget.count_tokens(placeholder, model)
+        expand_seconds = median_seconds(lambda: result_tables.expand(placeholder))
+        measurements.append({
+            "question": question,
+            "rows": len(page["rows"]),
+            "before_tokens": typed_tokens,
+            "after_tokens": placeholder_tokens,
+            "before_seconds": typed_tokens / tokens_per_second,
+            "after_seconds": placeholder_tokens / tokens_per_second + expand_seconds,
+        })
+    return measurements
+
+def live(model: str) -> List[Dict[str, Any]]:
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    from context_budget import context_budget
+    from sql_agent.agent import count_result_rows
+    from sql_agent.agent_constants import HTML_TABLE_INSTRUCTIONS, TABLE_PLACEHOLDER_INSTRUCTIONS
+    from tools.result_tables import result_tables
+    from utils import get_chat_model
+
+    llm = get_chat_model(model)
+
+    def answer(instructions: str, question: str, tool_output: str, expand: bool) -> Tuple[int, float]:
+        messages = [
+            SystemMessage(content="You are NoodifyGPT, a retail insights chatbot. Present insights as follows:\n" + instructions),
+            HumanMessage(content=f"Question: {question}\n\nsql_db_query result:\n{tool_output}\n\nWrite the final answer."),
+        ]
+        started = time.perf_counter()
+        message = llm.invoke(messages)
+        if expand:
+            result_tables.expand(message.content)
+        elapsed = time.perf_counter() - started
+        usage = getattr(message, "usage_metadata", None) or {}
+        return usage.get("output_tokens") or context_budget.count_tokens(message.content, model), elapsed
+
+    measurements = []
+    for question, sql in QUESTIONS:
+        handle, tool_output = run_query(sql)
+        _, rows = tool_output.split("\n", 1)
+        before_tokens, before_seconds = answer(HTML_TABLE_INSTRUCTIONS, question, rows, expand=False)
+        after_tokens, after_seconds = answer(TABLE_PLACEHOLDER_INSTRUCTIONS, question, tool_output, expand=True)
+        measurements.append({
+            "question": question,
+            "rows": count_result_rows(tool_output),
+            "before_tokens": before_tokens,
+            "after_tokens": after_tokens,
+            "before_seconds": before_seconds,
+            "after_seconds": after_seconds,
+        })
+    return measurements
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Measure output tokens and latency of typed vs server-rendered tables.")
+    parser.add_argument("--model", default="gpt-4o", help="Model whose tokenizer (or API with --live) is used")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Decode rate assumed offline")
+    parser.add_argument("--live", action="store_true", help="Have the LLM write both answers")
+    args = parser.parse_args(argv)
+
+    measurements = live(args.model) if args.live else offline(args.model, args.tokens_per_second)
+    mode = "live" if args.live else f"offline, {args.tokens_per_second:g} tokens/s"
+    print(f"{'question':<62} {'rows':>4} {'tokens before':>13} {'after':>6} {'seconds before':>14} {'after':>6}")
+    for m in measurements:
+        print(f"{m['question'][:62]:<62} {m['rows']:>4} {m['before_tokens']:>13} {m['after_tokens']:>6} "
+              f"{m['before_seconds']:>14.2f} {m['after_seconds']:>6.2f}")
+    before = sum(m["before_tokens"] for m in measurements)
+    after = sum(m["after_tokens"] for m in measurements)
+    print(f"total output tokens ({mode}): {before} -> {after} ({1 - after / before:.0%} fewer)")
+    print(f"total answer seconds: {sum(m['before_seconds'] for m in measurements):.2f} -> "
+          f"{sum(m['after_seconds'] for m in measurements):.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+import asyncio
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from config import (
+    MAX_CONCURRENT_QUERIES, MAX_QUEUED_QUERIES, QUEUE_TIMEOUT, OPENAI_MAX_CONCURRENCY, GOOGLE_MAX_CONCURRENCY,
+)
+from metrics import observe_stage
+
+class OverloadedError(Exception):
+    """
+    Raised when a request cannot be admitted; carries the HTTP status and Retry-After hint.
+    """
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class QueueFullError(OverloadedError):
+    """
+    Raised immediately when all slots are busy and the wait queue is full.
+    """
+    status_code = 429
+
+class QueueTimeoutError(OverloadedError):
+    """
+    Raised when a queued request waited longer than the queue timeout.
+    """
+    status_code = 503
+
+class Slot:
+    """
+    An admitted request slot. Releasing it more than once is a no-op.
+    """
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self._limiter = limiter
+        self._started = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(time.perf_counter() - self._started)
+
+class ConcurrencyLimiter:
+    """
+    Per-worker admission control for agent runs.
+    At most `max_concurrency` runs execute at once, at most `max_queue` wait for a slot,
+    and waiting longer than `queue_timeout` seconds fails with QueueTimeoutError.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_QUERIES, max_queue: int = MAX_QUEUED_QUERIES,
+                 queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._service_seconds_avg = None
+
+    def _retry_after(self) -> int:
+        """
+        Estimate how long a rejected client should wait before retrying.
+
+        :return: Seconds to send in the Retry-After header.
+        """
+        service_seconds = self._service_seconds_avg or 1.0
+        return max(1, math.ceil(service_seconds * (self.waiting + 1) / self.max_concurrency))
+
+    async def acquire(self) -> Slot:
+        """
+        Wait for a free slot, rejecting immediately when the wait queue is full.
+
+        :return: Slot that must be released when the run finishes.
+        """
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected_full += 1
+            raise QueueFullError("Too many queued queries, please retry later", self._retry_after())
+
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise QueueTimeoutError("Timed out waiting for a free query slot", self._retry_after())
+        finally:
+            self.waiting -= 1
+            waited = time.perf_counter() - started
+            with self._lock:
+                self.waits += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            observe_stage("queue_wait", waited)
+
+        self.active += 1
+        self.admitted += 1
+        return Slot(self)
+
+    def _release(self, service_seconds: float):
+        self.active -= 1
+        with self._lock:
+            # Exponentially weighted average of run time, used for Retry-After estimates
+            if self._service_seconds_avg is None:
+                self._service_seconds_avg = service_seconds
+            else:
+                self._service_seconds_avg = 0.8 * self._service_seconds_avg + 0.2 * service_seconds
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Async context manager holding a slot for the duration of the block.
+        """
+        slot = await self.acquire()
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get admission statistics.
+
+        :return: Dictionary with limits, queue depth, in-flight runs, rejections and wait times.
+        """
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "queue_depth": self.waiting,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_full,
+                "rejected_timeout": self.rejected_timeout,
+                "wait_seconds_avg": self.wait_seconds_total / self.waits if self.waits else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+            }
+
+# Function to get the provider serving a model
+def llm_provider(model_name: str) -> str:
+    """
+    Get the provider of an LLM, used to apply per-provider limits.
+
+    :param model_name: Name of the LLM.
+    :return: "google" for Gemini models, "openai" otherwise.
+    """
+    return "google" if model_name.startswith("gemini") else "openai"
+
+def is_rate_limited(error: Exception) -> bool:
+    """
+    Check whether an error is a provider rate limit (HTTP 429) response.
+
+    :param error: Exception raised by an LLM call or an agent run.
+    :return: Whether the call may succeed if retried later.
+    """
+    status_code = (
+        getattr(error, "status_code", None)
+        or getattr(getattr(error, "response", None), "status_code", None)
+        or getattr(error, "code", None)
+    )
+    message = str(error).lower()
+    return (
+        status_code == 429
+        or type(error).__name__ in ("RateLimitError", "ResourceExhausted")
+        or "rate limit" in message
+        or "resource exhausted" in message
+    )
+
+class ProviderLimiter:
+    """
+    Per-worker concurrency limits for each LLM provider.
+    Runs calling a provider hold one of its slots. When a provider rate-limits a call,
+    `backoff` pauses new runs and the LLM calls of running ones (see llm_clients) for that
+    provider, so retries do not hit the limit again.
+    """
+
+    def __init__(self, limits: Dict[str, int] = None):
+        limits = limits or {"openai": OPENAI_MAX_CONCURRENCY, "google": GOOGLE_MAX_CONCURRENCY}
+        self.limits = dict(limits)
+        self._semaphores = {provider: asyncio.Semaphore(limit) for provider, limit in self.limits.items()}
+        self._paused_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.active: Dict[str, int] = {provider: 0 for provider in self.limits}
+        self.rate_limited: Dict[str, int] = {provider: 0 for provider in self.limits}
+
+    @asynccontextmanager
+    async def slot(self, provider: str):
+        """
+        Async context manager holding a provider slot for the duration of the block.
+        Waits while the provider is paused after a rate limit.
+
+        :param provider: Provider name from llm_provider.
+        """
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            yield
+            return
+        async with semaphore:
+            pause = self.paused_for(provider)
+            if pause > 0:
+                await asyncio.sleep(pause)
+            self.active[provider] += 1
+            try:
+                yield
+            finally:
+                self.active[provider] -= 1
+
+    def paused_for(self, provider: str) -> float:
+        """
+        Get the time left of a provider's rate-limit pause.
+
+        :param provider: Provider name from llm_provider.
+        :return: Seconds until calls to the provider may resume (0 when not paused).
+        """
+        return max(0.0, self._paused_until.get(provider, 0.0) - time.monotonic())
+
+    def backoff(self, provider: str, seconds: float):
+        """
+        Pause calls to a provider after it rate-limited one.
+
+        :param provider: Provider name from llm_provider.
+        :param seconds: How long to pause.
+        """
+        with self._lock:
+            self._paused_until[provider] = max(self._paused_until.get(provider, 0.0), time.monotonic() + seconds)
+            if provider in self.rate_limited:
+                self.rate_limited[provider] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get provider limit statistics.
+
+        :return: Dictionary with the limit, active runs and rate-limit backoffs per provider.
+        """
+        with self._lock:
+            return {
+                provider: {
+                    "limit": limit,
+                    "active": self.active[provider],
+                    "rate_limited": self.rate_limited[provider],
+                    "paused": self.paused_for(provider) > 0,
+                }
+                for provider, limit in self.limits.items()
+            }
+
+class SingleFlight:
+    """
+    Per-worker deduplication of identical in-flight work.
+    The first caller for a key starts the work in its own task; callers arriving with the
+    same key while it runs wait for that task and share its result or exception. The work
+    is shielded from cancellation, so a disconnecting caller does not fail the others.
+    Keys are dropped as soon as the work finishes; later callers start a new run.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.tokens_saved = 0
+        self.cost_saved = 0.0
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run the work for a key, or join the run already in flight for it.
+
+        :param key: Identity of the work (e.g. the response cache key of a query).
+        :param work: Coroutine function performing the work.
+        :return: Tuple of the result and whether it was shared from another caller's run.
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            with self._lock:
+                self.coalesced += 1
+        else:
+            task = asyncio.get_running_loop().create_task(work())
+            self._inflight[key] = task
+            task.add_done_callback(lambda finished: self._finished(key, finished))
+            with self._lock:
+                self.leaders += 1
+        return await asyncio.shield(task), shared
+
+    def record_saved(self, tokens: int, cost: float):
+        """
+        Record the tokens and cost a coalesced caller did not spend.
+
+        :param tokens: Tokens used by the shared run.
+        :param cost: Cost of the shared run.
+        """
+        with self._lock:
+            self.tokens_saved += tokens
+            self.cost_saved += cost
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing statistics.
+
+        :return: Dictionary with in-flight keys, runs started, coalesced callers and the tokens and cost saved.
+        """
+        with self._lock:
+            return {
+                "in_flight": len(self._inflight),
+                "runs": self.leaders,
+                "coalesced": self.coalesced,
+                "tokens_saved": self.tokens_saved,
+                "cost_saved": self.cost_saved,
+            }
+
+# Shared limiter for agent runs in this worker
+query_limiter = ConcurrencyLimiter()
+
+# Shared per-provider limits for agent runs in this worker
+provider_limiter = ProviderLimiter()
+
+# Shared coalescer of identical in-flight agent runs in this worker
+query_flights = SingleFlight()
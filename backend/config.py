@@ -12,9 +12,106 @@ AGENT_LLM_NAME = os.getenv("AGENT_LLM_NAME")  # Name of the agent language model
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # API key for accessing OpenAI services
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")  # API key for accessing Google services
 
+# LLM Client Configuration
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # OpenAI-compatible endpoint (e.g. a local mock server); the OpenAI API if unset
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))  # HTTP connections to the OpenAI endpoint per worker
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "20"))  # Idle connections kept alive for reuse
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))  # Seconds an LLM call may take
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))  # Retries of rate-limited or failed LLM calls
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))  # Seconds of the first retry backoff, doubled each attempt
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))  # Maximum seconds between retries
+LLM_MAX_WAIT = float(os.getenv("LLM_MAX_WAIT", "10"))  # Seconds a call may wait for rate budget before failing over
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "gpt-4o=500:30000,gemini-pro=360:120000")  # model=requests:tokens per minute
+LLM_FALLBACKS = os.getenv("LLM_FALLBACKS", "gpt-4o=gemini-pro,gemini-pro=gpt-4o")  # model=fallback, used when the other key is set
+
 # Database Configuration
 DB_PATH = os.getenv("DB_PATH")  # Path to the database
+DATA_CSV_PATH = os.getenv("DATA_CSV_PATH")  # Source CSV for ingestion (defaults to database/retail_data.csv)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # Bytes of the database file memory-mapped per connection
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))  # Page cache per connection
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "40"))  # Read-only connections pooled for agent queries; more concurrent queries wait for one
+SQL_MAX_VM_STEPS = int(os.getenv("SQL_MAX_VM_STEPS", "200000000"))  # SQLite VM steps an agent statement may take (0 disables)
+
+# Analytics Backend Configuration
+ANALYTICS_BACKEND = os.getenv("ANALYTICS_BACKEND", "sqlite")  # sqlite, or duckdb (columnar, over Parquet; needs duckdb and duckdb-engine)
+PARQUET_DIR = os.getenv("PARQUET_DIR", "parquet")  # Directory of the Parquet copy written by ingestion
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "4"))  # Threads per DuckDB query
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "1GB")  # Memory limit per DuckDB connection
+
+# Query Result Configuration
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "50"))  # Rows of a query result shown to the LLM
+RESULT_TOP_K = int(os.getenv("RESULT_TOP_K", "5"))  # Most frequent values per column in result summaries
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", "results.db")  # SQLite file holding full results
+RESULT_TTL = int(os.getenv("RESULT_TTL", "3600"))  # Seconds a stored result can be paged or exported
+SQL_AUTO_LIMIT = int(os.getenv("SQL_AUTO_LIMIT", "10000"))  # LIMIT added to agent queries without one when results are not stored (0 disables)
+RESULT_TABLE_PLACEHOLDERS = os.getenv("RESULT_TABLE_PLACEHOLDERS", "true").lower() == "true"  # Agent cites result handles; tables are rendered server-side
+RESULT_TABLE_MAX_ROWS = int(os.getenv("RESULT_TABLE_MAX_ROWS", "100"))  # Rows of a result rendered in an answer table
+
+# Query Plan Advisor Configuration
+PLAN_SCAN_ROW_THRESHOLD = int(os.getenv("PLAN_SCAN_ROW_THRESHOLD", "100000"))  # Flag full scans of tables larger than this
+PLAN_HOT_PATTERN_THRESHOLD = int(os.getenv("PLAN_HOT_PATTERN_THRESHOLD", "5"))  # Uses of a predicate pattern before suggesting an index
+PLAN_AUTO_CREATE_INDEXES = os.getenv("PLAN_AUTO_CREATE_INDEXES", "false").lower() == "true"  # Create suggested indexes automatically
+
+# Cache Configuration
+CACHE_TYPE = os.getenv("CACHE_TYPE")  # Overrides constants.CACHE_TYPE (SimpleCache, RedisCache or NullCache)
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")  # Redis URL used when CACHE_TYPE is RedisCache
+
+# Session Configuration
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))  # Seconds an idle conversation session is kept
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))  # Sessions kept when not stored in Redis
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.db")  # SQLite file sharing sessions between workers when not stored in Redis
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "3"))  # Latest turns kept verbatim; older ones are folded into the summary (0 folds every turn)
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "300"))  # Maximum length of a session's rolling summary
+
+# Concurrency Configuration (per worker)
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "8"))  # Agent runs executing at once
+MAX_QUEUED_QUERIES = int(os.getenv("MAX_QUEUED_QUERIES", "32"))  # Requests allowed to wait for a slot
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "30"))  # Seconds a request may wait before a 503
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))  # Agent runs calling OpenAI at once
+GOOGLE_MAX_CONCURRENCY = int(os.getenv("GOOGLE_MAX_CONCURRENCY", "4"))  # Agent runs calling Google at once
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))  # Questions of a /query/batch request answered at once
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "200"))  # Questions accepted in one /query/batch request
+
+# Chart Configuration
+CHART_FORMAT = os.getenv("CHART_FORMAT", "png")  # png, svg or webp
+CHART_DPI = int(os.getenv("CHART_DPI", "100"))  # Resolution of raster charts
+CHART_DELIVERY = os.getenv("CHART_DELIVERY", "inline")  # inline (data URI) or url (/charts/{chart_id})
+CHART_STORE_DIR = os.getenv("CHART_STORE_DIR", "charts")  # Directory shared by workers for url delivery
+CHART_RENDER_PROCESSES = int(os.getenv("CHART_RENDER_PROCESSES", "0"))  # Render in a process pool when > 0
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")  # Base URL of this API used in chart links
+
+# Prompt Cache Configuration
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"  # Cache identical LLM calls
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "1000"))  # Entries kept in memory (and on disk)
+PROMPT_CACHE_PATH = os.getenv("PROMPT_CACHE_PATH")  # SQLite file to persist cached calls; memory only if unset
+
+# Few-shot Retriever Configuration
+FEW_SHOT_RETRIEVER_ENABLED = os.getenv("FEW_SHOT_RETRIEVER_ENABLED", "false").lower() == "true"  # Give the agent the sql_get_few_shot tool
+FEW_SHOT_EMBEDDINGS = os.getenv("FEW_SHOT_EMBEDDINGS", "hashing")  # hashing (local, offline) or openai
+FEW_SHOT_INDEX_DIR = os.getenv("FEW_SHOT_INDEX_DIR", "indexes")  # Directory holding the persisted FAISS index
+FEW_SHOT_K = int(os.getenv("FEW_SHOT_K", "2"))  # Examples returned per lookup
+
+# Entity Index Configuration
+ENTITY_RESOLUTION_ENABLED = os.getenv("ENTITY_RESOLUTION_ENABLED", "true").lower() == "true"  # Note matched values in the question before the first LLM call
+ENTITY_MATCH_THRESHOLD = float(os.getenv("ENTITY_MATCH_THRESHOLD", "0.7"))  # Minimum trigram similarity for a misspelled value to resolve
+
+# Context Budget Configuration (tokens)
+CONTEXT_HISTORY_TOKENS = int(os.getenv("CONTEXT_HISTORY_TOKENS", "1000"))  # Chat history kept in the prompt
+CONTEXT_SCHEMA_TOKENS = int(os.getenv("CONTEXT_SCHEMA_TOKENS", "2000"))  # Per schema tool observation
+CONTEXT_TOOL_TOKENS = int(os.getenv("CONTEXT_TOOL_TOKENS", "1500"))  # Per observation of other tools (e.g. query results)
+
+# Server Configuration
+RUN_MODE = os.getenv("RUN_MODE", "dev")  # dev (one worker, reload on code changes) or prod (preload shared state, several workers)
+WORKERS = int(os.getenv("WORKERS", "4"))  # Worker processes in prod mode
+
+# Logging Configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # Level of console logs
+LOG_FILE_LEVEL = os.getenv("LOG_FILE_LEVEL", "DEBUG")  # Level of logs/retail_insights.log
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # Console format: text or json (the log file is always JSON lines)
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "500"))  # Characters of a question or history entry kept in a log record
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.05"))  # Fraction of requests whose chat history is logged at DEBUG
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE", "false").lower() == "true"  # Print every agent step to stdout (debugging only)
 
 # Other Configuration
-MAX_RETRIES = 2  # Maximum number of retries for certain operations
-TIMEOUT = 60  # Timeout duration in seconds
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "2"))  # Retries of agent queries when the database is busy
+TIMEOUT = float(os.getenv("TIMEOUT", "60"))  # Seconds an agent SQL statement may run, and the SQLite busy timeout
@@ -15,3 +15,5 @@ langchain_chat_kwargs = {
 # Cache configuration settings
 CACHE_TYPE = "SimpleCache"  # Type of cache to use (SimpleCache for in-memory caching)
 CACHE_DEFAULT_TIMEOUT = 3000  # Default timeout for cache entries in seconds
+CACHE_THRESHOLD = 500  # Maximum number of entries kept by the in-memory cache before LRU eviction
+CACHE_KEY_PREFIX = "retail_insights:"  # Prefix for keys stored in shared cache backends
@@ -0,0 +1,298 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from config import CONTEXT_HISTORY_TOKENS, CONTEXT_SCHEMA_TOKENS, CONTEXT_TOOL_TOKENS
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# Tools whose observations describe the schema and count against the schema budget
+SCHEMA_TOOLS = {"sql_db_list_tables", "sql_db_schema", "get_columns_descriptions"}
+
+# Chat format overhead per message and per reply, as documented for OpenAI chat models
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+@lru_cache(maxsize=8)
+def get_encoding(model_name: str):
+    """
+    Get the tiktoken encoding for a model.
+    Models unknown to tiktoken (e.g. Gemini) use cl100k_base as an approximation.
+
+    :param model_name: Name of the LLM.
+    :return: tiktoken Encoding, or None if no encoding could be loaded.
+    """
+    import tiktoken
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer for {model_name}, using an approximate count: {str(e)}")
+        return None
+
+def load_encodings(model_names: List[str]):
+    """
+    Load the tokenizers of the given models, so no request waits for tiktoken to read or
+    download its BPE files.
+
+    :param model_names: Names of the LLMs.
+    """
+    for model_name in dict.fromkeys(filter(None, model_names)):
+        get_encoding(model_name)
+
+class ContextBudget:
+    """
+    Token accounting for everything the agent puts in its prompt.
+    Counts use the model's tokenizer and are cached per (model, text), so repeated
+    history messages and tool observations are only tokenized once. Chat history,
+    schema observations and other tool observations each have their own budget.
+    """
+
+    def __init__(self, history_tokens: int = CONTEXT_HISTORY_TOKENS, schema_tokens: int = CONTEXT_SCHEMA_TOKENS,
+                 tool_tokens: int = CONTEXT_TOOL_TOKENS, max_cached: int = 4096):
+        self.history_tokens = history_tokens
+        self.schema_tokens = schema_tokens
+        self.tool_tokens = tool_tokens
+        self._max_cached = max_cached
+        self._counts: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.count_hits = 0
+        self.count_misses = 0
+        self.messages_dropped = 0
+        self.observations_trimmed = 0
+        self.tokens_trimmed = 0
+
+    def count_tokens(self, text: str, model_name: str) -> int:
+        """
+        Count the tokens of a text for a model, using the per-message cache.
+
+        :param text: Text to count.
+        :param model_name: Name of the LLM.
+        :return: Number of tokens.
+        """
+        key = (model_name, text)
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                self.count_hits += 1
+                return count
+            self.count_misses += 1
+
+        encoding = get_encoding(model_name)
+        if encoding is not None:
+            count = len(encoding.encode(text, disallowed_special=()))
+        else:
+            count = (len(text) + 3) // 4
+
+        with self._lock:
+            self._counts[key] = count
+            while len(self._counts) > self._max_cached:
+                self._counts.popitem(last=False)
+        return count
+
+    def truncate_history(self, history: List[str], model_name: str, max_tokens: int = None) -> List[str]:
+        """
+        Keep the most recent chat history messages that fit in the history budget.
+
+        :param history: List of chat history messages, oldest first.
+        :param model_name: Name of the agent LLM.
+        :param max_tokens: Token budget; defaults to the history budget.
+        :return: The kept messages, oldest first.
+        """
+        max_tokens = self.history_tokens if max_tokens is None else max_tokens
+        kept = []
+        current_tokens = 0
+        for message in reversed(history):
+            message_tokens = self.count_tokens(message, model_name) + TOKENS_PER_MESSAGE
+            if current_tokens + message_tokens > max_tokens:
+                break
+            kept.append(message)
+            current_tokens += message_tokens
+        kept.reverse()
+
+        if len(kept) < len(history):
+            with self._lock:
+                self.messages_dropped += len(history) - len(kept)
+        return kept
+
+    def truncate_text(self, text: str, model_name: str, max_tokens: int) -> str:
+        """
+        Cut a text down to a token budget, marking how much was removed.
+
+        :param text: Text to truncate.
+        :param model_name: Name of the LLM.
+        :param max_tokens: Token budget.
+        :return: The text, or its leading part followed by a truncation note.
+        """
+        total = self.count_tokens(text, model_name)
+        if total <= max_tokens:
+            return text
+
+        encoding = get_encoding(model_name)
+        if encoding is not None:
+            head = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+        else:
+            head = text[:max_tokens * 4]
+        with self._lock:
+            self.observations_trimmed += 1
+            self.tokens_trimmed += total - max_tokens
+        return f"{head}\n... [truncated {total - max_tokens} tokens]"
+
+    def step_trimmer(self, model_name: str) -> Callable[[List[Tuple[Any, Any]]], List[Tuple[Any, Any]]]:
+        """
+        Build a trim_intermediate_steps callable for an AgentExecutor.
+        Only the prompt sent to the LLM is trimmed; the steps themselves are left intact.
+
+        :param model_name: Name of the agent LLM.
+        :return: Function applying the schema and tool budgets to each observation.
+        """
+        def trim(intermediate_steps):
+            trimmed = []
+            for action, observation in intermediate_steps:
+                if isinstance(observation, str):
+                    budget = self.schema_tokens if getattr(action, "tool", None) in SCHEMA_TOOLS else self.tool_tokens
+                    observation = self.truncate_text(observation, model_name, budget)
+                trimmed.append((action, observation))
+            return trimmed
+
+        return trim
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get context budget statistics.
+
+        :return: Dictionary with the budgets, token count cache and trimming counters.
+        """
+        with self._lock:
+            lookups = self.count_hits + self.count_misses
+            return {
+                "history_tokens": self.history_tokens,
+                "schema_tokens": self.schema_tokens,
+                "tool_tokens": self.tool_tokens,
+                "count_cache_hit_rate": self.count_hits / lookups if lookups else 0.0,
+                "messages_dropped": self.messages_dropped,
+                "observations_trimmed": self.observations_trimmed,
+                "tokens_trimmed": self.tokens_trimmed,
+            }
+
+# Shared context budget used by the API and the agents
+context_budget = ContextBudget()
+
+class TokenUsageTracker(BaseCallbackHandler):
+    """
+    Callback handler recording the prompt and completion tokens of every LLM call in a run.
+    Provider-reported usage is used when available; streamed calls report none, so their
+    tokens are counted locally from the messages, function definitions and generations.
+    """
+
+    def __init__(self, budget: ContextBudget = None):
+        self.budget = budget or context_budget
+        self.steps: List[Dict[str, Any]] = []
+        self._pending: Dict[Any, Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count_message(self, message, model_name: str) -> int:
+        tokens = TOKENS_PER_MESSAGE
+        if isinstance(message.content, str):
+            tokens += self.budget.count_tokens(message.content, model_name)
+        function_call = message.additional_kwargs.get("function_call")
+        if function_call:
+            tokens += self.budget.count_tokens(json.dumps(function_call), model_name)
+        return tokens
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model_name = params.get("model_name") or params.get("model") or "unknown"
+        prompt_tokens = TOKENS_PER_REPLY + sum(self._count_message(message, model_name) for message in messages[0])
+        if params.get("functions"):
+            prompt_tokens += self.budget.count_tokens(json.dumps(params["functions"]), model_name)
+        with self._lock:
+            self._pending[run_id] = (model_name, prompt_tokens)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        with self._lock:
+            model_name, prompt_tokens = self._pending.pop(run_id, ("unknown", 0))
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        cached = bool(response.generations) and all(
+            (generation.generation_info or {}).get("prompt_cache")
+            for generations in response.generations for generation in generations
+        )
+        if cached:
+            # Served by the prompt cache, nothing was sent to the provider
+            prompt_tokens = completion_tokens = 0
+        elif usage.get("prompt_tokens"):
+            prompt_tokens = usage["prompt_tokens"]
+            completion_tokens = usage.get("completion_tokens", 0)
+        else:
+            completion_tokens = 0
+            for generations in response.generations:
+                for generation in generations:
+                    completion_tokens += self.budget.count_tokens(generation.text, model_name)
+                    message = getattr(generation, "message", None)
+                    function_call = message.additional_kwargs.get("function_call") if message is not None else None
+                    if function_call:
+                        completion_tokens += self.budget.count_tokens(json.dumps(function_call), model_name)
+
+        with self._lock:
+            self.steps.append({
+                "step": len(self.steps) + 1,
+                "model": model_name,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cached": cached,
+            })
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(step["prompt_tokens"] + step["completion_tokens"] for step in self.steps)
+
+    @property
+    def total_cost(self) -> float:
+        from langchain_community.callbacks.openai_info import get_openai_token_cost_for_model
+
+        cost = 0.0
+        for step in self.steps:
+            try:
+                cost += get_openai_token_cost_for_model(step["model"], step["prompt_tokens"])
+                cost += get_openai_token_cost_for_model(step["model"], step["completion_tokens"], is_completion=True)
+            except ValueError:
+                # No price known for this model (e.g. Gemini)
+                pass
+        return cost
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Summarize the run's token usage.
+
+        :return: Dictionary with per-step token counts and their totals.
+        """
+        return {
+            "steps": list(self.steps),
+            "prompt_tokens": sum(step["prompt_tokens"] for step in self.steps),
+            "completion_tokens": sum(step["completion_tokens"] for step in self.steps),
+        }
+
+def resolve_usage(cb, tracker: TokenUsageTracker) -> Tuple[int, float]:
+    """
+    Pick the token total and cost for a run.
+    Uses the OpenAI callback totals when the provider reported usage, otherwise the tracker's counts.
+
+    :param cb: OpenAICallbackHandler from get_openai_callback.
+    :param tracker: TokenUsageTracker attached to the same run.
+    :return: Tuple of total tokens and cost.
+    """
+    if cb.total_tokens:
+        return cb.total_tokens, cb.total_cost
+    return tracker.total_tokens, tracker.total_cost
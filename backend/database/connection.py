@@ -0,0 +1,217 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+
+from config import (
+    SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_POOL_SIZE, SQL_MAX_VM_STEPS, TIMEOUT,
+    DUCKDB_THREADS, DUCKDB_MEMORY_LIMIT,
+)
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# SQLite virtual machine instructions between two progress handler calls
+PROGRESS_INTERVAL = 10_000
+
+class QueryBudgetExceeded(SQLAlchemyError):
+    """
+    Raised when a statement is interrupted for exceeding its time or VM-step budget.
+    Derives from SQLAlchemyError so SQLDatabase.run_no_throw returns it to the agent as an error message.
+    """
+
+def apply_pragmas(dbapi_conn: sqlite3.Connection, read_only: bool):
+    """
+    Apply the performance PRAGMAs to a new SQLite connection.
+
+    :param dbapi_conn: sqlite3 connection.
+    :param read_only: Whether the connection only serves queries.
+    """
+    cursor = dbapi_conn.cursor()
+    try:
+        if not read_only:
+            # WAL is persistent in the file; readers then never block the ingestion writer
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+def _cancel_timer(state: Dict[str, Any]):
+    if state.get("timer") is not None:
+        state["timer"].cancel()
+        state["timer"] = None
+
+class StatementBudget:
+    """
+    Per-statement time and VM-step limits, enforced with SQLite's progress handler.
+    The budget is armed when a statement starts and covers fetching its rows; the handler
+    interrupts the statement once either limit is exceeded, and the interruption is
+    reported as QueryBudgetExceeded with a message the agent can act on. DuckDB has no
+    progress handler, so on DuckDB engines only the time limit applies, through a timer
+    that interrupts the connection.
+    """
+
+    def __init__(self, timeout: float = TIMEOUT, max_steps: int = SQL_MAX_VM_STEPS):
+        self.timeout = timeout
+        self.max_steps = max_steps
+        self._lock = threading.Lock()
+        self.interrupted = {"time": 0, "steps": 0}
+
+    def _progress_handler(self, state: Dict[str, Any]):
+        def handler():
+            if state["deadline"] is None:
+                return 0
+            state["steps"] += PROGRESS_INTERVAL
+            if self.max_steps and state["steps"] > self.max_steps:
+                state["reason"] = "steps"
+                return 1
+            if time.monotonic() > state["deadline"]:
+                state["reason"] = "time"
+                return 1
+            return 0
+        return handler
+
+    def install(self, engine: Engine):
+        """
+        Attach the budget to every connection of an engine.
+
+        :param engine: SQLAlchemy engine over SQLite or DuckDB.
+        """
+        uses_timer = engine.dialect.name != "sqlite"
+
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_conn, connection_record):
+            state = {"deadline": None, "steps": 0, "reason": None, "timer": None}
+            connection_record.info["budget"] = state
+            if not uses_timer:
+                dbapi_conn.set_progress_handler(self._progress_handler(state), PROGRESS_INTERVAL)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            state = conn.info.get("budget")
+            if state is None:
+                return
+            state.update(deadline=time.monotonic() + self.timeout if self.timeout else None, steps=0, reason=None)
+            if uses_timer and self.timeout:
+                _cancel_timer(state)
+                dbapi_conn = conn.connection.dbapi_connection
+
+                def interrupt():
+                    state["reason"] = "time"
+                    dbapi_conn.interrupt()
+
+                state["timer"] = threading.Timer(self.timeout, interrupt)
+                state["timer"].daemon = True
+                state["timer"].start()
+
+        @event.listens_for(engine, "checkin")
+        def on_checkin(dbapi_conn, connection_record):
+            state = connection_record.info.get("budget")
+            if state is not None:
+                state["deadline"] = None
+                _cancel_timer(state)
+
+        @event.listens_for(engine, "handle_error")
+        def on_error(context):
+            connection = context.connection
+            state = connection.info.get("budget") if connection is not None else None
+            if state is None or state["reason"] is None or "interrupt" not in str(context.original_exception).lower():
+                return
+            reason = state["reason"]
+            with self._lock:
+                self.interrupted[reason] += 1
+            if reason == "time":
+                message = f"Query stopped after exceeding the {self.timeout:g}s time limit."
+            else:
+                message = f"Query stopped after exceeding the limit of {self.max_steps:,} SQLite VM steps."
+            logger.warning(f"{message} SQL: {context.statement}")
+            raise QueryBudgetExceeded(
+                f"{message} It scans too much data; filter with WHERE, aggregate with GROUP BY, "
+                "avoid self-joins and add a LIMIT, then try again."
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get budget statistics.
+
+        :return: Dictionary with the limits and the number of interrupted statements per limit.
+        """
+        with self._lock:
+            return {"timeout": self.timeout, "max_vm_steps": self.max_steps, "interrupted": dict(self.interrupted)}
+
+def create_sqlite_engine(path: str, read_only: bool = False, budget: StatementBudget = None) -> Engine:
+    """
+    Create a SQLAlchemy engine over a SQLite file with tuned connections.
+    Read-only engines open the file with mode=ro and keep up to SQLITE_POOL_SIZE connections,
+    each reused with its warm page cache and memory map; when all are checked out, callers
+    wait for one to be returned.
+
+    :param path: Absolute path to the SQLite file.
+    :param read_only: Open connections read-only (for agent queries).
+    :param budget: Statement budget to enforce on the engine's connections.
+    :return: SQLAlchemy engine.
+    """
+    def connect():
+        if read_only:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=TIMEOUT, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(path, timeout=TIMEOUT, check_same_thread=False)
+        apply_pragmas(conn, read_only)
+        return conn
+
+    if read_only:
+        # Sized for the threads running tools (the default executor has at most 32); no overflow,
+        # so extra callers wait instead of opening cold connections
+        engine = create_engine(f"sqlite:///{path}", creator=connect, poolclass=QueuePool,
+                               pool_size=SQLITE_POOL_SIZE, max_overflow=0, pool_timeout=TIMEOUT)
+    else:
+        engine = create_engine(f"sqlite:///{path}", creator=connect)
+    if budget is not None:
+        budget.install(engine)
+    return engine
+
+def create_duckdb_engine(dataset, budget: StatementBudget = None) -> Engine:
+    """
+    Create a SQLAlchemy engine over an in-memory DuckDB database exposing a Parquet dataset as a view.
+    Connections are pooled like the read-only SQLite ones; each one (re)creates the view
+    when the dataset's manifest has changed since it was last checked out. Requires duckdb and duckdb-engine.
+
+    :param dataset: ParquetDataset written by the ingestion step.
+    :param budget: Statement budget to enforce on the engine's connections.
+    :return: SQLAlchemy engine.
+    """
+    engine = create_engine(
+        "duckdb:///:memory:",
+        connect_args={"config": {"threads": DUCKDB_THREADS, "memory_limit": DUCKDB_MEMORY_LIMIT}},
+        poolclass=QueuePool,
+        pool_size=SQLITE_POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=TIMEOUT,
+    )
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_conn, connection_record, connection_proxy):
+        version = dataset.version()
+        if version is None or connection_record.info.get("dataset_version") == version:
+            return
+        files = ", ".join("'" + path.replace("'", "''") + "'" for path in dataset.part_paths())
+        cursor = dbapi_conn.cursor()
+        try:
+            cursor.execute(f'CREATE OR REPLACE VIEW "{dataset.table}" AS SELECT * FROM read_parquet([{files}])')
+        finally:
+            cursor.close()
+        connection_record.info["dataset_version"] = version
+
+    if budget is not None:
+        budget.install(engine)
+    return engine
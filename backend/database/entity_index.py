@@ -0,0 +1,268 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from config import ENTITY_MATCH_THRESHOLD
+from database.ingest import DIMENSION_COLUMNS, INGEST_LOG_TABLE, TABLE_NAME
+from database.sql_db_langchain import get_engine, get_data_version
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# Longest mention, in tokens, tried when scanning a question for values
+MAX_MENTION_TOKENS = 8
+
+def _stem(token: str) -> str:
+    # Plural mentions ("boutiques", "sachets") match singular values and vice versa
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def normalize_tokens(value: str) -> List[str]:
+    """
+    Split a value or mention into normalized tokens: lowercase, no quotes,
+    punctuation and underscores as separators, plurals reduced to the singular.
+
+    :param value: Text to normalize.
+    :return: List of tokens.
+    """
+    value = re.sub(r"[\"'`]", "", str(value).lower())
+    return [_stem(token) for token in re.findall(r"[a-z0-9]+(?:\.[0-9]+)?", value)]
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def trigrams(key: str) -> Set[str]:
+    """
+    Get the character trigrams of a normalized key, each token padded as in pg_trgm.
+
+    :param key: Normalized key (tokens joined by spaces).
+    :return: Set of trigrams.
+    """
+    grams = set()
+    for token in key.split():
+        padded = f"  {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class EntityIndex:
+    """
+    In-memory index of the distinct values of the retail_data dimension columns.
+    Values are looked up by their normalized tokens or, for misspellings, by trigram
+    similarity through an inverted trigram index. The index follows the ingestion log:
+    appended periods only add their new values, a full reload rebuilds it.
+    """
+
+    def __init__(self, columns: List[str] = None, threshold: float = ENTITY_MATCH_THRESHOLD):
+        self.columns = columns or DIMENSION_COLUMNS
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._version = None
+        self._log_rowid = 0
+        # (column, value) entries and their trigram counts, with indexes by normalized key and trigram
+        self._entries: List[Tuple[str, str]] = []
+        self._known: Set[Tuple[str, str]] = set()
+        self._gram_counts: List[int] = []
+        self._by_key: Dict[str, List[int]] = defaultdict(list)
+        self._by_gram: Dict[str, List[int]] = defaultdict(list)
+        self.builds = 0
+        self.incremental_updates = 0
+        self.lookups = 0
+        self.questions_resolved = 0
+
+    def _reset(self):
+        self._entries, self._known, self._gram_counts = [], set(), []
+        self._by_key, self._by_gram = defaultdict(list), defaultdict(list)
+
+    def _add(self, column: str, value: Any):
+        if value is None or (column, str(value)) in self._known:
+            return
+        key = " ".join(normalize_tokens(value))
+        if not key:
+            return
+        entry_id = len(self._entries)
+        grams = trigrams(key)
+        self._entries.append((column, str(value)))
+        self._known.add((column, str(value)))
+        self._gram_counts.append(len(grams))
+        self._by_key[key].append(entry_id)
+        for gram in grams:
+            self._by_gram[gram].append(entry_id)
+
+    def _load_values(self, conn, periods: Optional[List[str]] = None):
+        for column in self.columns:
+            sql = f'SELECT DISTINCT "{column}" FROM {TABLE_NAME}'
+            if periods is None:
+                rows = conn.execute(text(sql))
+            else:
+                placeholders = ", ".join(f":p{i}" for i in range(len(periods)))
+                rows = conn.execute(
+                    text(f"{sql} WHERE Period IN ({placeholders})"),
+                    {f"p{i}": period for i, period in enumerate(periods)},
+                )
+            for (value,) in rows:
+                self._add(column, value)
+
+    def refresh(self):
+        """
+        Bring the index up to date with the ingestion log.
+        Runs of append loads only scan the newly loaded periods; anything else rebuilds the index.
+        """
+        version = get_data_version()
+        if version == self._version and self._entries:
+            return
+        with self._lock:
+            if version == self._version and self._entries:
+                return
+            started = time.perf_counter()
+            with get_engine().connect() as conn:
+                try:
+                    log = conn.execute(
+                        text(f"SELECT rowid, mode, periods FROM {INGEST_LOG_TABLE} WHERE rowid > :rowid ORDER BY rowid"),
+                        {"rowid": self._log_rowid},
+                    ).fetchall()
+                except Exception:
+                    log = []
+                incremental = bool(self._entries) and bool(log) and all(mode == "append" for _, mode, _ in log)
+                if incremental:
+                    before = len(self._entries)
+                    periods = sorted({period for _, _, loaded in log for period in json.loads(loaded or "[]")})
+                    if periods:
+                        self._load_values(conn, periods)
+                    self.incremental_updates += 1
+                    logger.info(f"Entity index updated with {len(self._entries) - before} new values "
+                                f"from {len(periods)} periods in {time.perf_counter() - started:.3f}s")
+                else:
+                    self._reset()
+                    self._load_values(conn)
+                    self.builds += 1
+                    logger.info(f"Built entity index with {len(self._entries)} values "
+                                f"in {time.perf_counter() - started:.3f}s")
+            if log:
+                self._log_rowid = log[-1][0]
+            self._version = version
+
+    def _similar(self, key: str, columns: Optional[Iterable[str]] = None) -> List[Tuple[float, int]]:
+        grams = trigrams(key)
+        shared = Counter(entry_id for gram in grams for entry_id in self._by_gram.get(gram, ()))
+        scored = []
+        for entry_id, count in shared.items():
+            if columns is not None and self._entries[entry_id][0] not in columns:
+                continue
+            score = count / (len(grams) + self._gram_counts[entry_id] - count)
+            scored.append((score, entry_id))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return scored
+
+    def lookup(self, mention: str, column: str = None, k: int = 5, min_score: float = 0.3) -> List[Dict[str, Any]]:
+        """
+        Find the stored values closest to a mention.
+
+        :param mention: Text mentioned by the user.
+        :param column: Restrict the lookup to one column.
+        :param k: Maximum number of matches.
+        :param min_score: Minimum trigram similarity.
+        :return: List of matches with column, value and score, best first.
+        """
+        self.refresh()
+        key = " ".join(normalize_tokens(mention))
+        columns = {column} if column else None
+        with self._lock:
+            self.lookups += 1
+            exact = [entry_id for entry_id in self._by_key.get(key, ()) if columns is None or self._entries[entry_id][0] in columns]
+            matches = [(1.0, entry_id) for entry_id in exact]
+            if len(matches) < k:
+                matches += [(score, entry_id) for score, entry_id in self._similar(key, columns)
+                            if score >= min_score and entry_id not in exact]
+            return [
+                {"column": self._entries[entry_id][0], "value": self._entries[entry_id][1], "score": round(score, 3)}
+                for score, entry_id in matches[:k]
+            ]
+
+    def resolve(self, column: str, mention: str) -> Optional[str]:
+        """
+        Resolve a mention to the value stored in a column.
+
+        :param column: retail_data column name.
+        :param mention: Text mentioned by the user.
+        :return: Stored value, or None if no value is similar enough.
+        """
+        matches = self.lookup(mention, column=column, k=1, min_score=self.threshold)
+        return matches[0]["value"] if matches else None
+
+    def resolve_question(self, question: str) -> List[Dict[str, Any]]:
+        """
+        Find the stored values mentioned in a question.
+        The question is scanned left to right for the longest token sequences equal to a
+        normalized value; single remaining words are matched by trigram similarity.
+
+        :param question: The user question.
+        :return: List of matches with the mention, column, value and score.
+        """
+        self.refresh()
+        tokens = normalize_tokens(question)
+        found = []
+        with self._lock:
+            i = 0
+            while i < len(tokens):
+                for n in range(min(MAX_MENTION_TOKENS, len(tokens) - i), 0, -1):
+                    key = " ".join(tokens[i:i + n])
+                    entry_ids = [(1.0, entry_id) for entry_id in self._by_key.get(key, ())]
+                    if not entry_ids and n == 1 and len(key) >= 4:
+                        similar = self._similar(key)
+                        best = similar[0][0] if similar else 0.0
+                        entry_ids = [item for item in similar if item[0] >= self.threshold and item[0] == best]
+                    if entry_ids:
+                        for score, entry_id in entry_ids:
+                            column, value = self._entries[entry_id]
+                            found.append({"mention": key, "column": column, "value": value, "score": round(score, 3)})
+                        i += n
+                        break
+                else:
+                    i += 1
+            if found:
+                self.questions_resolved += 1
+        return found
+
+    def annotate(self, question: str) -> str:
+        """
+        Append the values resolved in a question, so the agent filters on exact literals
+        without a lookup round trip.
+
+        :param question: The user question.
+        :return: The question, followed by a note listing the resolved values if any.
+        """
+        try:
+            matches = self.resolve_question(question)
+        except Exception as e:
+            logger.error(f"Error resolving entities: {str(e)}")
+            return question
+        if not matches:
+            return question
+        values = "; ".join(f"{match['column']} = {_sql_literal(match['value'])}" for match in matches)
+        return f"{question}\n\n(Values in retail_data matching this question: {values})"
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get entity index statistics.
+
+        :return: Dictionary with the number of values, builds, incremental updates and lookups.
+        """
+        with self._lock:
+            return {
+                "data_version": self._version,
+                "values": len(self._entries),
+                "builds": self.builds,
+                "incremental_updates": self.incremental_updates,
+                "lookups": self.lookups,
+                "questions_resolved": self.questions_resolved,
+            }
+
+# Shared entity index used by the agent tools, the agents and the intent router
+entity_index = EntityIndex()
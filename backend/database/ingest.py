@@ -0,0 +1,305 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List
+
+from config import DATA_CSV_PATH, ANALYTICS_BACKEND
+from database.sql_db_langchain import get_database_file
+from database.parquet_store import ParquetDataset
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# Default source file shipped with the repository
+DEFAULT_CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retail_data.csv")
+
+TABLE_NAME = "retail_data"
+STAGING_TABLE_NAME = "retail_data_staging"
+INGEST_LOG_TABLE = "ingest_log"
+
+# Column names and SQLite types of retail_data, in source order
+DIMENSION_COLUMNS = [
+    "City", "Channel", "Category", "Segment", "Manufacturer",
+    "Brand", "Item Name", "Pack_Size", "Packaging",
+]
+NUMERIC_COLUMNS = ["Unit_Price", "Sales_Volume(KG_LTRS)", "Sales_Value"]
+COLUMN_TYPES = {
+    "Period": "TIMESTAMP",
+    **{column: "TEXT" for column in DIMENSION_COLUMNS},
+    **{column: "REAL" for column in NUMERIC_COLUMNS},
+}
+
+# Covering indexes: each dimension leads, followed by Period and the measures, so filters,
+# GROUP BYs and aggregates over one dimension (optionally per period) are served from the index
+INDEXED_DIMENSIONS = ["Period", "City", "Channel", "Category", "Segment", "Manufacturer", "Brand"]
+INDEXES = {
+    f"idx_retail_data_{column.lower()}": [column] + (["Period"] if column != "Period" else []) + NUMERIC_COLUMNS
+    for column in INDEXED_DIMENSIONS
+}
+
+def file_checksum(path: str) -> str:
+    """
+    Compute the SHA-256 checksum of a file without loading it into memory.
+
+    :param path: Path to the file.
+    :return: Hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_csv_chunks(path: str, chunksize: int) -> Iterator["pd.DataFrame"]:
+    """
+    Read the retail CSV in chunks with explicit dtypes.
+    Thousands separators are parsed by the reader and Period is normalized to the
+    timestamp text format used in the database.
+
+    :param path: Path to the CSV file.
+    :param chunksize: Number of rows per chunk.
+    :yield: Cleaned DataFrame chunks with columns in COLUMN_TYPES order.
+    """
+    import pandas as pd
+
+    reader = pd.read_csv(
+        path,
+        encoding="utf-8-sig",
+        dtype={"Period": str, **{column: str for column in DIMENSION_COLUMNS}},
+        thousands=",",
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        chunk["Period"] = pd.to_datetime(chunk["Period"], format="%b-%y").dt.strftime("%Y-%m-%d %H:%M:%S")
+        for column in NUMERIC_COLUMNS:
+            chunk[column] = pd.to_numeric(chunk[column], errors="coerce").astype(float)
+        chunk = chunk[list(COLUMN_TYPES)]
+        # Store missing values as NULL
+        yield chunk.astype(object).where(chunk.notna(), None)
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+def _create_table_sql(table: str) -> str:
+    columns = ", ".join(f"{_quote(column)} {sql_type}" for column, sql_type in COLUMN_TYPES.items())
+    return f"CREATE TABLE {_quote(table)} ({columns})"
+
+def _insert_sql(table: str) -> str:
+    placeholders = ", ".join("?" for _ in COLUMN_TYPES)
+    return f"INSERT INTO {_quote(table)} VALUES ({placeholders})"
+
+def create_indexes(conn: sqlite3.Connection):
+    """
+    Create the covering indexes on retail_data and refresh planner statistics.
+
+    :param conn: Open SQLite connection (inside the ingestion transaction).
+    """
+    for name, columns in INDEXES.items():
+        column_list = ", ".join(_quote(column) for column in columns)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {TABLE_NAME} ({column_list})")
+    conn.execute(f"ANALYZE {TABLE_NAME}")
+
+def _ensure_ingest_log(conn: sqlite3.Connection):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {INGEST_LOG_TABLE} ("
+        "version TEXT NOT NULL, checksum TEXT NOT NULL, source TEXT, mode TEXT NOT NULL, "
+        "rows_loaded INTEGER NOT NULL, row_count INTEGER NOT NULL, periods TEXT, loaded_at TEXT NOT NULL)"
+    )
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+def read_data_version(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """
+    Read the most recent ingestion record.
+
+    :param conn: Open SQLite connection.
+    :return: Dictionary describing the loaded data, or None if nothing was ingested.
+    """
+    if not _table_exists(conn, INGEST_LOG_TABLE):
+        return None
+    row = conn.execute(
+        f"SELECT version, checksum, source, mode, rows_loaded, row_count, loaded_at "
+        f"FROM {INGEST_LOG_TABLE} ORDER BY rowid DESC LIMIT 1"
+    ).fetchone()
+    if row is None:
+        return None
+    keys = ["version", "checksum", "source", "mode", "rows_loaded", "row_count", "loaded_at"]
+    return dict(zip(keys, row))
+
+def export_parquet(conn: sqlite3.Connection, dataset: ParquetDataset, version: str, chunksize: int) -> int:
+    """
+    Write the whole retail_data table to a Parquet dataset, e.g. when switching to the DuckDB backend.
+
+    :param conn: Open SQLite connection.
+    :param dataset: Parquet dataset to replace.
+    :param version: Data version of the table.
+    :param chunksize: Number of rows per part file.
+    :return: Number of rows written.
+    """
+    import pandas as pd
+
+    parts = []
+    row_count = 0
+    try:
+        for chunk in pd.read_sql_query(f"SELECT * FROM {TABLE_NAME}", conn, chunksize=chunksize):
+            parts.append(dataset.write_part(chunk, COLUMN_TYPES))
+            row_count += len(chunk)
+    except Exception:
+        dataset.discard(parts)
+        raise
+    dataset.commit(version, parts, row_count)
+    return row_count
+
+def connect(db_file: str = None) -> sqlite3.Connection:
+    """
+    Open a writer connection in autocommit mode so transactions are managed explicitly.
+
+    :param db_file: Path to the SQLite database file. Defaults to the configured database.
+    :return: sqlite3 connection.
+    """
+    conn = sqlite3.connect(db_file or get_database_file(), timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def ingest(csv_path: str = None, db_file: str = None, append: bool = False,
+           force: bool = False, chunksize: int = 50_000, parquet: bool = None) -> Dict[str, Any]:
+    """
+    Load the retail CSV into the database.
+
+    A full load writes a staging table and swaps it in place of retail_data in one
+    transaction. An append load inserts only rows for periods not already present.
+    Both then (re)create the covering indexes and run ANALYZE. The load is skipped
+    when a file with the same checksum was already ingested (unless `force` is set). The whole operation holds SQLite's write lock,
+    so concurrent callers (e.g. several workers starting at once) run one at a time
+    and the later ones find the data already loaded. When `parquet` is set, the loaded
+    rows are also written as Parquet parts for the DuckDB backend.
+
+    :param csv_path: Path to the source CSV. Defaults to DATA_CSV_PATH or the bundled file.
+    :param db_file: Path to the SQLite database file. Defaults to the configured database.
+    :param append: Append new periods instead of replacing the table.
+    :param force: Reload even if the source checksum is unchanged.
+    :param chunksize: Number of CSV rows read and inserted per batch.
+    :param parquet: Also write Parquet parts. Defaults to true when ANALYTICS_BACKEND is duckdb.
+    :return: Dictionary describing the outcome and the resulting data version.
+    """
+    csv_path = csv_path or DATA_CSV_PATH or DEFAULT_CSV_PATH
+    checksum = file_checksum(csv_path)
+    if parquet is None:
+        parquet = ANALYTICS_BACKEND == "duckdb"
+    dataset = ParquetDataset(TABLE_NAME) if parquet else None
+    parts = []
+    conn = connect(db_file)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        _ensure_ingest_log(conn)
+        current = read_data_version(conn)
+        has_table = _table_exists(conn, TABLE_NAME)
+
+        already_loaded = conn.execute(
+            f"SELECT 1 FROM {INGEST_LOG_TABLE} WHERE checksum = ? LIMIT 1", (checksum,)
+        ).fetchone() is not None
+        if has_table and already_loaded and not force:
+            conn.execute("COMMIT")
+            logger.info(f"Skipping ingestion of {csv_path}: checksum unchanged")
+            if dataset is not None and dataset.version() != current["version"]:
+                rows = export_parquet(conn, dataset, current["version"], chunksize)
+                logger.info(f"Exported {rows} rows to Parquet for data version {current['version']}")
+            return {"status": "skipped", **current}
+
+        append = append and has_table
+        insert_sql = _insert_sql(TABLE_NAME if append else STAGING_TABLE_NAME)
+        if append:
+            existing_periods = {row[0] for row in conn.execute(f"SELECT DISTINCT Period FROM {TABLE_NAME}")}
+        else:
+            conn.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE_NAME}")
+            conn.execute(_create_table_sql(STAGING_TABLE_NAME))
+            existing_periods = set()
+
+        rows_loaded = 0
+        new_periods = set()
+        for chunk in read_csv_chunks(csv_path, chunksize):
+            if existing_periods:
+                chunk = chunk[~chunk["Period"].isin(existing_periods)]
+            conn.executemany(insert_sql, chunk.itertuples(index=False, name=None))
+            if dataset is not None and len(chunk):
+                parts.append(dataset.write_part(chunk, COLUMN_TYPES))
+            rows_loaded += len(chunk)
+            new_periods.update(chunk["Period"].unique())
+
+        if not append:
+            # Atomic swap: readers see either the old or the new table, never a partial load
+            conn.execute(f"DROP TABLE IF EXISTS {TABLE_NAME}")
+            conn.execute(f"ALTER TABLE {STAGING_TABLE_NAME} RENAME TO {TABLE_NAME}")
+        create_indexes(conn)
+
+        row_count = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
+        base = current["version"] if append and current else ""
+        version = hashlib.sha256((base + checksum).encode("utf-8")).hexdigest()[:16]
+        mode = "append" if append else "replace"
+        conn.execute(
+            f"INSERT INTO {INGEST_LOG_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (version, checksum, os.path.abspath(csv_path), mode, rows_loaded, row_count,
+             json.dumps(sorted(new_periods)), datetime.now(timezone.utc).isoformat()),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        if dataset is not None:
+            dataset.discard(parts)
+        raise
+    finally:
+        conn.close()
+
+    if dataset is not None:
+        if append and dataset.version() != (current or {}).get("version"):
+            # The Parquet copy is not in sync with the base data, rewrite it whole
+            dataset.discard(parts)
+            export_conn = connect(db_file)
+            try:
+                export_parquet(export_conn, dataset, version, chunksize)
+            finally:
+                export_conn.close()
+        else:
+            dataset.commit(version, parts, row_count, append=append)
+
+    logger.info(f"Ingested {rows_loaded} rows from {csv_path} ({mode}), data version {version}")
+    return {
+        "status": "appended" if append else "loaded",
+        "version": version,
+        "checksum": checksum,
+        "rows_loaded": rows_loaded,
+        "row_count": row_count,
+        "periods": sorted(new_periods),
+    }
+
+def main(argv: List[str] = None):
+    """
+    Command-line entry point: python -m database.ingest [--csv PATH] [--append] [--force] [--parquet]
+    """
+    parser = argparse.ArgumentParser(description="Load retail data into the SQLite database.")
+    parser.add_argument("--csv", dest="csv_path", help="Source CSV file (defaults to DATA_CSV_PATH or the bundled file)")
+    parser.add_argument("--db", dest="db_file", help="SQLite database file (defaults to DB_PATH)")
+    parser.add_argument("--append", action="store_true", help="Append rows for new periods instead of replacing the table")
+    parser.add_argument("--force", action="store_true", help="Reload even if the source checksum is unchanged")
+    parser.add_argument("--chunksize", type=int, default=50_000, help="Rows per batch")
+    parser.add_argument("--parquet", action="store_true", default=None,
+                        help="Also write Parquet parts for the DuckDB backend (default when ANALYTICS_BACKEND=duckdb)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    result = ingest(args.csv_path, args.db_file, append=args.append, force=args.force,
+                    chunksize=args.chunksize, parquet=args.parquet)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
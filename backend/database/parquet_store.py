@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from config import PARQUET_DIR
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# DuckDB types of the Parquet columns, by SQLite type
+PARQUET_TYPES = {"TIMESTAMP": "TIMESTAMP", "TEXT": "VARCHAR", "REAL": "DOUBLE"}
+
+class ParquetDataset:
+    """
+    Parquet copy of a table, written by the ingestion step for the DuckDB backend.
+    Each load writes new part files; a manifest listing the current parts is then
+    replaced atomically, so readers see either the old or the new data. Parts of the
+    previous manifest are kept one generation longer for queries still reading them.
+    Requires the optional duckdb package.
+    """
+
+    def __init__(self, table: str = "retail_data", directory: str = PARQUET_DIR):
+        self.table = table
+        self.directory = os.path.abspath(os.path.join(directory, table))
+        self._lock = threading.Lock()
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._manifest_stamp = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    def manifest(self) -> Optional[Dict[str, Any]]:
+        """
+        Read the current manifest, cached until the file changes.
+
+        :return: Dictionary with the data version, part file names and row count, or None if nothing was written.
+        """
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stamp != self._manifest_stamp:
+                with open(self.manifest_path) as f:
+                    self._manifest = json.load(f)
+                self._manifest_stamp = stamp
+            return self._manifest
+
+    def version(self) -> Optional[str]:
+        manifest = self.manifest()
+        return manifest["version"] if manifest else None
+
+    def part_paths(self) -> List[str]:
+        """
+        Get the paths of the current part files.
+
+        :return: List of absolute paths.
+        """
+        manifest = self.manifest()
+        return [os.path.join(self.directory, part) for part in manifest["parts"]] if manifest else []
+
+    def write_part(self, chunk: "pd.DataFrame", column_types: Dict[str, str]) -> str:
+        """
+        Write a chunk of rows as a new part file, sorted by Period for row group pruning.
+
+        :param chunk: Cleaned rows with columns in column_types order.
+        :param column_types: SQLite type of each column.
+        :return: File name of the part.
+        """
+        import duckdb
+
+        os.makedirs(self.directory, exist_ok=True)
+        part = f"part-{uuid.uuid4().hex}.parquet"
+        columns = ", ".join(
+            f'CAST("{column}" AS {PARQUET_TYPES[sql_type]}) AS "{column}"' for column, sql_type in column_types.items()
+        )
+        conn = duckdb.connect()
+        try:
+            conn.register("chunk", chunk)
+            conn.execute(
+                f"COPY (SELECT {columns} FROM chunk ORDER BY \"Period\") "
+                f"TO '{os.path.join(self.directory, part)}' (FORMAT PARQUET, COMPRESSION ZSTD)"
+            )
+        finally:
+            conn.close()
+        return part
+
+    def commit(self, version: str, parts: List[str], row_count: int, append: bool = False):
+        """
+        Publish a load by replacing the manifest.
+
+        :param version: Data version of the load.
+        :param parts: Part files written by the load.
+        :param row_count: Total number of rows after the load.
+        :param append: Keep the current parts and add the new ones.
+        """
+        previous = self.manifest() or {"parts": []}
+        current = (previous["parts"] if append else []) + parts
+        manifest = {"version": version, "parts": current, "previous": previous["parts"], "row_count": row_count}
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+        # Remove parts no longer referenced by the current or the previous manifest
+        keep = set(current) | set(previous["parts"])
+        for name in os.listdir(self.directory):
+            if name.endswith(".parquet") and name not in keep:
+                os.remove(os.path.join(self.directory, name))
+        logger.info(f"Published {len(current)} Parquet parts for {self.table}, data version {version}")
+
+    def discard(self, parts: List[str]):
+        """
+        Delete the parts of a failed load.
+
+        :param parts: Part files written by the load.
+        """
+        for part in parts:
+            try:
+                os.remove(os.path.join(self.directory, part))
+            except FileNotFoundError:
+                pass
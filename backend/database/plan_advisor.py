@@ -0,0 +1,170 @@
+import logging
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from config import PLAN_SCAN_ROW_THRESHOLD, PLAN_HOT_PATTERN_THRESHOLD, PLAN_AUTO_CREATE_INDEXES
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# Matches a column reference followed by a comparison, e.g. `City = `, "Period" IN, Segment LIKE
+PREDICATE_PATTERN = re.compile(
+    r"(`[^`]+`|\"[^\"]+\"|\[[^\]]+\]|[A-Za-z_][\w()]*)\s*(?:=|==|!=|<>|<=|>=|<|>|\bIN\b|\bLIKE\b|\bBETWEEN\b)",
+    re.IGNORECASE,
+)
+CLAUSE_PATTERN = re.compile(
+    r"\b(WHERE|GROUP\s+BY)\b(.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bHAVING\b|\bLIMIT\b|\bUNION\b|\)|;|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+class QueryPlanAdvisor:
+    """
+    Inspects agent-generated SQL with EXPLAIN QUERY PLAN.
+    Logs the plan, flags full scans of large tables and counts the column patterns used
+    in WHERE and GROUP BY clauses. Patterns seen often enough without a supporting index
+    produce an index suggestion, which is created automatically when enabled.
+    """
+
+    def __init__(self, engine: Engine, table: str = "retail_data",
+                 scan_row_threshold: int = PLAN_SCAN_ROW_THRESHOLD,
+                 hot_pattern_threshold: int = PLAN_HOT_PATTERN_THRESHOLD,
+                 auto_create: bool = PLAN_AUTO_CREATE_INDEXES):
+        self._engine = engine
+        self._table = table
+        self.scan_row_threshold = scan_row_threshold
+        self.hot_pattern_threshold = hot_pattern_threshold
+        self.auto_create = auto_create
+        self._lock = threading.Lock()
+        self._patterns: Counter = Counter()
+        self.inspected = 0
+        self.large_scans = 0
+        self.suggestions: Dict[Tuple[str, ...], str] = {}
+        self.created_indexes: List[str] = []
+
+    def _table_metadata(self, conn) -> Tuple[List[str], int]:
+        columns = [row[1] for row in conn.execute(text(f"PRAGMA table_info({self._table})"))]
+        # MAX(rowid) is an index lookup and a close estimate of the row count for an append-only table
+        row_count = conn.execute(text(f"SELECT MAX(rowid) FROM {self._table}")).scalar() or 0
+        return columns, row_count
+
+    def _indexed_leading_columns(self, conn) -> set:
+        leading = set()
+        for index in conn.execute(text(f"PRAGMA index_list({self._table})")):
+            columns = list(conn.execute(text(f"PRAGMA index_info(\"{index[1]}\")")))
+            if columns:
+                leading.add(columns[0][2])
+        return leading
+
+    def predicate_columns(self, sql: str, columns: List[str]) -> Tuple[str, ...]:
+        """
+        Extract the table columns used in WHERE and GROUP BY clauses.
+
+        :param sql: SQL statement.
+        :param columns: Column names of the inspected table.
+        :return: Sorted tuple of column names forming the predicate pattern.
+        """
+        known = {column.lower(): column for column in columns}
+        found = set()
+        for clause, body in CLAUSE_PATTERN.findall(sql):
+            if clause.upper() == "WHERE":
+                candidates = [match for match in PREDICATE_PATTERN.findall(body)]
+            else:
+                candidates = [part.strip() for part in body.split(",")]
+            for candidate in candidates:
+                name = candidate.strip("`\"[]").strip().lower()
+                if name in known:
+                    found.add(known[name])
+        return tuple(sorted(found))
+
+    def inspect(self, sql: str) -> Optional[Dict[str, Any]]:
+        """
+        Explain a query, log its plan and update pattern statistics.
+
+        :param sql: SQL statement generated by the agent.
+        :return: Dictionary with the plan, scan flags and any index suggestion, or None
+            if the statement is not a query against the table or cannot be explained.
+        """
+        if not re.match(r"\s*(SELECT|WITH)\b", sql, re.IGNORECASE) or self._table not in sql:
+            return None
+        try:
+            with self._engine.connect() as conn:
+                plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+                columns, row_count = self._table_metadata(conn)
+                with self._lock:
+                    pattern = self.predicate_columns(sql, columns)
+                    self.inspected += 1
+                    if pattern:
+                        self._patterns[pattern] += 1
+                    pattern_count = self._patterns[pattern] if pattern else 0
+                indexed = self._indexed_leading_columns(conn)
+        except Exception as e:
+            logger.debug(f"Could not explain query: {str(e)}")
+            return None
+
+        logger.info(f"Query plan for {sql!r}: {' | '.join(plan)}")
+        full_scans = [
+            detail for detail in plan
+            if re.match(rf"SCAN (TABLE )?{self._table}\b", detail) and "INDEX" not in detail
+        ]
+        large_scan = bool(full_scans) and row_count > self.scan_row_threshold
+        if large_scan:
+            with self._lock:
+                self.large_scans += 1
+            logger.warning(f"Full scan of {self._table} ({row_count} rows) for query: {sql}")
+
+        suggestion = None
+        if pattern and full_scans and pattern_count >= self.hot_pattern_threshold and pattern[0] not in indexed:
+            suggestion = self._suggest(pattern)
+
+        return {"plan": plan, "full_scan": bool(full_scans), "large_scan": large_scan,
+                "pattern": list(pattern), "suggestion": suggestion}
+
+    def _suggest(self, pattern: Tuple[str, ...]) -> str:
+        """
+        Record (and optionally create) an index for a hot predicate pattern.
+
+        :param pattern: Tuple of column names.
+        :return: CREATE INDEX statement.
+        """
+        name = "idx_auto_" + "_".join(re.sub(r"\W+", "_", column).strip("_").lower() for column in pattern)
+        column_list = ", ".join('"' + column + '"' for column in pattern)
+        statement = f"CREATE INDEX IF NOT EXISTS {name} ON {self._table} ({column_list})"
+        with self._lock:
+            is_new = pattern not in self.suggestions
+            self.suggestions[pattern] = statement
+        if is_new:
+            logger.warning(f"Hot predicate pattern {list(pattern)} has no index, suggested: {statement}")
+        if self.auto_create and name not in self.created_indexes:
+            try:
+                with self._engine.begin() as conn:
+                    conn.execute(text(statement))
+                    conn.execute(text(f"ANALYZE {self._table}"))
+                with self._lock:
+                    self.created_indexes.append(name)
+                logger.info(f"Created index {name}")
+            except Exception as e:
+                logger.error(f"Could not create index {name}: {str(e)}")
+        return statement
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get advisor statistics.
+
+        :return: Dictionary with inspected queries, large scans, hot patterns and suggestions.
+        """
+        with self._lock:
+            return {
+                "inspected": self.inspected,
+                "large_scans": self.large_scans,
+                "hot_patterns": [
+                    {"columns": list(pattern), "count": count}
+                    for pattern, count in self._patterns.most_common(10)
+                ],
+                "suggestions": list(self.suggestions.values()),
+                "created_indexes": list(self.created_indexes),
+            }
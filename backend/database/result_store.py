@@ -0,0 +1,408 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import RESULT_STORE_PATH, RESULT_TTL, RESULT_TOP_K
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# Distinct values tracked per text column before top-k counts become approximate
+MAX_TRACKED_VALUES = 10_000
+
+# Matches the truncation note appended to capped query results
+TRUNCATION_PATTERN = re.compile(r"Result truncated: showing \d+ of (\d+) rows\. Full result handle: (\w+)")
+# Matches the handle line put before query results the agent can show as tables
+RESULT_HANDLE_PATTERN = re.compile(r"^Result handle: (\w+)\n")
+
+class ResultSummary:
+    """
+    Incremental statistical summary of a query result.
+    Numeric columns get min/max/mean, other columns get the number of distinct values
+    and the most frequent ones.
+    """
+
+    def __init__(self, columns: List[str], top_k: int = RESULT_TOP_K):
+        self.columns = columns
+        self.top_k = top_k
+        self.row_count = 0
+        self._non_null = [0] * len(columns)
+        self._min: List[Any] = [None] * len(columns)
+        self._max: List[Any] = [None] * len(columns)
+        self._sum = [0.0] * len(columns)
+        self._numeric = [True] * len(columns)
+        self._values = [Counter() for _ in columns]
+
+    def update(self, rows: Iterable[tuple]):
+        """
+        Add a batch of rows to the summary.
+
+        :param rows: Row tuples in column order.
+        """
+        for row in rows:
+            self.row_count += 1
+            for i, value in enumerate(row):
+                if value is None:
+                    continue
+                self._non_null[i] += 1
+                if self._numeric[i] and isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self._sum[i] += value
+                    self._min[i] = value if self._min[i] is None else min(self._min[i], value)
+                    self._max[i] = value if self._max[i] is None else max(self._max[i], value)
+                else:
+                    self._numeric[i] = False
+                counter = self._values[i]
+                if value in counter or len(counter) < MAX_TRACKED_VALUES:
+                    counter[value] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the summary as a JSON-serializable dictionary.
+
+        :return: Dictionary with the row count and per-column statistics.
+        """
+        columns = {}
+        for i, column in enumerate(self.columns):
+            stats: Dict[str, Any] = {"non_null": self._non_null[i]}
+            if self._numeric[i] and self._non_null[i]:
+                stats.update(min=self._min[i], max=self._max[i], mean=round(self._sum[i] / self._non_null[i], 4))
+            else:
+                counter = self._values[i]
+                stats["distinct"] = len(counter) if len(counter) < MAX_TRACKED_VALUES else f">={MAX_TRACKED_VALUES}"
+                stats["top"] = [[str(value), count] for value, count in counter.most_common(self.top_k)]
+            columns[column] = stats
+        return {"row_count": self.row_count, "columns": columns}
+
+def parse_truncation(output: str) -> Optional[Tuple[int, str]]:
+    """
+    Read the total row count and result handle from a capped query result.
+
+    :param output: sql_db_query tool output.
+    :return: Tuple of total row count and handle, or None if the result was not capped.
+    """
+    match = TRUNCATION_PATTERN.search(output) if isinstance(output, str) else None
+    return (int(match.group(1)), match.group(2)) if match else None
+
+def split_result_handle(output: Any) -> Tuple[Optional[str], Any]:
+    """
+    Separate the handle line from a query result.
+
+    :param output: sql_db_query tool output.
+    :return: Tuple of the handle (None if the result has no handle line) and the rest of the output.
+    """
+    match = RESULT_HANDLE_PATTERN.match(output) if isinstance(output, str) else None
+    return (match.group(1), output[match.end():]) if match else (None, output)
+
+def result_handle(version: Optional[str], sql: str) -> str:
+    """
+    Get the handle of a query result.
+    The handle depends only on the data version and the query, so running the same query
+    again yields the same tool output, and prompts built from it stay cacheable.
+
+    :param version: Data version the query runs on.
+    :param sql: SQL query as run.
+    :return: 16-character hexadecimal handle.
+    """
+    return hashlib.sha256(f"{version}\n{sql}".encode("utf-8")).hexdigest()[:16]
+
+class ResultStore:
+    """
+    Stores full query results in a separate SQLite file under a short handle (see result_handle).
+    Rows are kept as JSON arrays keyed by (handle, seq), so pages are read with a
+    primary key range scan and exports stream in batches. Results expire after `ttl` seconds;
+    saving a result under the handle of an expired one replaces it. Expired results are
+    deleted every `purge_every` saves, in a transaction of their own.
+    """
+
+    def __init__(self, path: str = RESULT_STORE_PATH, ttl: int = RESULT_TTL, purge_every: int = 100):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._saves = 0
+        self.stored = 0
+        self.rows_stored = 0
+        self.reused = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS results (handle TEXT PRIMARY KEY, sql TEXT, "
+                        "columns TEXT NOT NULL, row_count INTEGER NOT NULL, created_at REAL NOT NULL, summary TEXT)"
+                    )
+                    # Stores created before summaries were kept
+                    if "summary" not in [row[1] for row in conn.execute("PRAGMA table_info(results)")]:
+                        conn.execute("ALTER TABLE results ADD COLUMN summary TEXT")
+                    conn.execute("CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at)")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS result_rows (handle TEXT NOT NULL, seq INTEGER NOT NULL, "
+                        "data TEXT NOT NULL, PRIMARY KEY (handle, seq)) WITHOUT ROWID"
+                    )
+                    self._initialized = True
+        return conn
+
+    def purge_expired(self, conn: sqlite3.Connection):
+        """
+        Delete results older than the TTL.
+
+        :param conn: Open connection to the result store, outside a transaction.
+        """
+        cutoff = time.time() - self.ttl
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM result_rows WHERE handle IN (SELECT handle FROM results WHERE created_at < ?)", (cutoff,)
+            )
+            purged = conn.execute("DELETE FROM results WHERE created_at < ?", (cutoff,)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if purged:
+            logger.info(f"Purged {purged} expired query results")
+
+    def save(self, handle: str, sql: str, columns: List[str], batches: Iterable[List[tuple]],
+             summary: ResultSummary = None) -> int:
+        """
+        Store a full query result.
+
+        :param handle: Handle from result_handle.
+        :param sql: The query that produced the result.
+        :param columns: Column names.
+        :param batches: Iterable of row batches, consumed once.
+        :param summary: Summary updated while the batches are consumed, stored with the result.
+        :return: The number of rows stored.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # An expired result, or one saved concurrently by another worker, is replaced
+            conn.execute("DELETE FROM result_rows WHERE handle = ?", (handle,))
+            row_count = 0
+            for batch in batches:
+                conn.executemany(
+                    "INSERT INTO result_rows VALUES (?, ?, ?)",
+                    ((handle, row_count + i, json.dumps(list(row), default=str)) for i, row in enumerate(batch)),
+                )
+                row_count += len(batch)
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (handle, sql, json.dumps(columns), row_count, time.time(),
+                 json.dumps(summary.to_dict(), default=str) if summary is not None else None),
+            )
+            conn.execute("COMMIT")
+            with self._lock:
+                self._saves += 1
+                purge = self._saves % self.purge_every == 0
+            if purge:
+                try:
+                    self.purge_expired(conn)
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not purge expired query results: {str(e)}")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.stored += 1
+            self.rows_stored += row_count
+        return row_count
+
+    def reuse(self, meta: Dict[str, Any]):
+        """
+        Record that a stored result is shown again instead of being saved anew. Its TTL is
+        restarted once half of it has passed, so the handle outlives the answer citing it.
+
+        :param meta: Description of the result from get_meta.
+        """
+        if meta["created_at"] < time.time() - self.ttl / 2:
+            conn = self._connect()
+            try:
+                conn.execute("UPDATE results SET created_at = ? WHERE handle = ?", (time.time(), meta["handle"]))
+            finally:
+                conn.close()
+        with self._lock:
+            self.reused += 1
+
+    def get_meta(self, handle: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the description of a stored result.
+
+        :param handle: Result handle.
+        :return: Dictionary with the query, columns, row count, summary (None for results saved
+            without one) and creation time, or None if unknown or expired.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT sql, columns, row_count, created_at, summary FROM results WHERE handle = ?", (handle,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None or row[3] < time.time() - self.ttl:
+            return None
+        return {
+            "handle": handle,
+            "sql": row[0],
+            "columns": json.loads(row[1]),
+            "row_count": row[2],
+            "summary": json.loads(row[4]) if row[4] else None,
+            "created_at": row[3],
+        }
+
+    def page(self, handle: str, offset: int = 0, limit: int = 100) -> Optional[Dict[str, Any]]:
+        """
+        Read one page of a stored result.
+
+        :param handle: Result handle.
+        :param offset: Index of the first row.
+        :param limit: Maximum number of rows.
+        :return: Dictionary with the result description, rows and next offset, or None if unknown.
+        """
+        meta = self.get_meta(handle)
+        if meta is None:
+            return None
+        conn = self._connect()
+        try:
+            rows = [
+                json.loads(data) for (data,) in conn.execute(
+                    "SELECT data FROM result_rows WHERE handle = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                    (handle, offset, offset + limit),
+                )
+            ]
+        finally:
+            conn.close()
+        next_offset = offset + len(rows)
+        return {
+            **meta,
+            "offset": offset,
+            "limit": limit,
+            "rows": rows,
+            "next_offset": next_offset if next_offset < meta["row_count"] else None,
+        }
+
+    def iter_batches(self, handle: str, batch_size: int = 5000) -> Iterator[List[list]]:
+        """
+        Iterate over a stored result in batches, for exports.
+
+        :param handle: Result handle.
+        :param batch_size: Rows per batch.
+        :yield: Lists of rows.
+        """
+        offset = 0
+        while True:
+            page = self.page(handle, offset, batch_size)
+            if page is None or not page["rows"]:
+                return
+            yield page["rows"]
+            if page["next_offset"] is None:
+                return
+            offset = page["next_offset"]
+
+    def iter_csv(self, handle: str) -> Iterator[str]:
+        """
+        Export a stored result as CSV text chunks, header first.
+
+        :param handle: Result handle.
+        :yield: CSV text chunks.
+        """
+        meta = self.get_meta(handle)
+        if meta is None:
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(meta["columns"])
+        for rows in self.iter_batches(handle):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def arrow_schema(self, handle: str):
+        """
+        Build the Arrow schema of a stored result from all of its rows.
+        Each column gets the type of its non-NULL values: integers widen to float when
+        floats are mixed in, and any other mix of types falls back to string.
+        Requires the optional pyarrow package.
+
+        :param handle: Result handle.
+        :return: pyarrow Schema, or None if the result is not found or expired.
+        """
+        import pyarrow as pa
+
+        meta = self.get_meta(handle)
+        if meta is None:
+            return None
+        kinds = [set() for _ in meta["columns"]]
+        for rows in self.iter_batches(handle):
+            for row in rows:
+                for i, value in enumerate(row):
+                    if value is not None:
+                        kinds[i].add(type(value))
+        types = []
+        for seen in kinds:
+            if seen == {bool}:
+                types.append(pa.bool_())
+            elif seen == {int}:
+                types.append(pa.int64())
+            elif seen and seen <= {int, float}:
+                types.append(pa.float64())
+            else:
+                types.append(pa.string())
+        return pa.schema([pa.field(name, type_) for name, type_ in zip(meta["columns"], types)])
+
+    def iter_arrow(self, handle: str, schema) -> Iterator[bytes]:
+        """
+        Export a stored result as an Arrow IPC stream, one record batch per chunk.
+        Requires the optional pyarrow package.
+
+        :param handle: Result handle.
+        :param schema: Schema of the result, from arrow_schema.
+        :yield: Arrow IPC stream bytes.
+        """
+        import pyarrow as pa
+
+        buffer = io.BytesIO()
+        sink = pa.PythonFile(buffer, mode="w")
+        writer = pa.ipc.new_stream(sink, schema)
+        for rows in self.iter_batches(handle):
+            arrays = []
+            for column, field in zip(zip(*rows), schema):
+                if pa.types.is_string(field.type):
+                    column = [None if value is None else str(value) for value in column]
+                arrays.append(pa.array(column, type=field.type))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        writer.close()
+        yield buffer.getvalue()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get result store statistics.
+
+        :return: Dictionary with the number of results and rows stored and results reused by this process.
+        """
+        with self._lock:
+            return {"stored": self.stored, "rows_stored": self.rows_stored, "reused": self.reused, "ttl": self.ttl}
+
+# Shared result store used by the SQL tools and the /results endpoints
+result_store = ResultStore()
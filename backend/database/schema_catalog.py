@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_community.utilities import SQLDatabase
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+class SchemaCatalog:
+    """
+    Schema information for the tables exposed to the agent, computed once per data version.
+    Holds each table's DDL with sample rows (as produced by SQLDatabase.get_table_info),
+    its row count and per-column type, min/max, null count and cardinality. The SQL tools
+    and get_columns_descriptions read it from memory instead of querying SQLite.
+    """
+
+    def __init__(self, db: SQLDatabase, version_provider=None):
+        self._db = db
+        self._version_provider = version_provider
+        self._lock = threading.Lock()
+        self._version = None
+        self._tables: Dict[str, Dict[str, Any]] = {}
+        self.builds = 0
+        self.build_seconds = 0.0
+
+    def _column_stats(self, table: str, columns: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Compute row count and per-column statistics in a single scan.
+
+        :param table: Table name.
+        :param columns: Column descriptions from the SQLAlchemy inspector.
+        :return: Dictionary with row_count and a columns dictionary.
+        """
+        expressions = ["COUNT(*)"]
+        for column in columns:
+            name = _quote(column["name"])
+            expressions += [f"MIN({name})", f"MAX({name})", f"COUNT(*) - COUNT({name})", f"COUNT(DISTINCT {name})"]
+        with self._db._engine.connect() as conn:
+            row = conn.exec_driver_sql(f"SELECT {', '.join(expressions)} FROM {_quote(table)}").fetchone()
+
+        stats = {}
+        for i, column in enumerate(columns):
+            minimum, maximum, nulls, distinct = row[1 + 4 * i: 5 + 4 * i]
+            stats[column["name"]] = {
+                "type": str(column["type"]),
+                "min": minimum,
+                "max": maximum,
+                "nulls": nulls,
+                "distinct": distinct,
+            }
+        return {"row_count": row[0], "columns": stats}
+
+    def _build(self) -> Dict[str, Dict[str, Any]]:
+        started = time.perf_counter()
+        tables = {}
+        for table in self._db.get_usable_table_names():
+            columns = self._db._inspector.get_columns(table)
+            tables[table] = {
+                # Bypass the catalog-backed override to get the DDL and sample rows from SQLite
+                "table_info": SQLDatabase.get_table_info(self._db, [table]),
+                **self._column_stats(table, columns),
+            }
+        self.builds += 1
+        self.build_seconds = time.perf_counter() - started
+        logger.info(f"Built schema catalog for {list(tables)} in {self.build_seconds:.3f}s")
+        return tables
+
+    def tables(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the catalog for the current data version, rebuilding it when the data changed.
+
+        :return: Dictionary of table name -> table_info, row_count and column statistics.
+        """
+        version = self._version_provider() if self._version_provider is not None else None
+        with self._lock:
+            if not self._tables or version != self._version:
+                self._tables = self._build()
+                self._version = version
+            return self._tables
+
+    def table_info(self, table_names: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Get the DDL and sample rows of the given tables, followed by column statistics.
+
+        :param table_names: Tables to describe; all catalog tables if omitted.
+        :return: Table information string, or None if a table is not in the catalog.
+        """
+        tables = self.tables()
+        table_names = list(tables) if table_names is None else table_names
+        if any(table not in tables for table in table_names):
+            return None
+        parts = []
+        for table in table_names:
+            entry = tables[table]
+            stats = "\n".join(
+                f"{column}: min={stats['min']!r}, max={stats['max']!r}, nulls={stats['nulls']}, distinct={stats['distinct']}"
+                for column, stats in entry["columns"].items()
+            )
+            parts.append(f"{entry['table_info']}\n\n/*\n{table} has {entry['row_count']} rows. Column statistics:\n{stats}\n*/")
+        return "\n\n".join(parts)
+
+    def compact_summary(self) -> str:
+        """
+        Get a short schema summary suitable for the agent prompt.
+
+        :return: One line per column with its type, range or cardinality.
+        """
+        lines = []
+        for table, entry in self.tables().items():
+            lines.append(f"Table {table} ({entry['row_count']} rows), columns:")
+            for column, stats in entry["columns"].items():
+                if stats["type"] in ("REAL", "INTEGER", "TIMESTAMP", "FLOAT", "DATETIME"):
+                    detail = f"{stats['min']} to {stats['max']}"
+                else:
+                    detail = f"{stats['distinct']} distinct values"
+                lines.append(f"- `{column}` {stats['type']}: {detail}")
+        return "\n".join(lines)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get catalog statistics.
+
+        :return: Dictionary with the data version, number of builds and last build time.
+        """
+        with self._lock:
+            return {
+                "data_version": self._version,
+                "tables": list(self._tables),
+                "builds": self.builds,
+                "build_seconds": self.build_seconds,
+            }
@@ -1,48 +1,251 @@
 from langchain_community.utilities import SQLDatabase
-from sqlalchemy import create_engine
-import pandas as pd
+from langchain_community.utilities.sql_database import truncate_word
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 from functools import lru_cache
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import DB_PATH, RESULT_MAX_ROWS, MAX_RETRIES, ANALYTICS_BACKEND, RESULT_TABLE_PLACEHOLDERS, SQL_AUTO_LIMIT
+from database.connection import StatementBudget, create_sqlite_engine, create_duckdb_engine
+from database.parquet_store import ParquetDataset
+from database.plan_advisor import QueryPlanAdvisor
+from database.result_store import ResultStore, ResultSummary, result_store, result_handle
+from database.schema_catalog import SchemaCatalog
+from database.sql_validator import SQLValidator
+from metrics import timed
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# SQLAlchemy URL of the retail database
+DATABASE_URL = DB_PATH or "sqlite:///retail_data.db"
+
+# Time and VM-step limits enforced on agent queries
+statement_budget = StatementBudget()
+
+# Connection held to notice commits to the database file, with the data version last read through it
+_version_lock = threading.Lock()
+_version_conn = None
+_version_cache = (None, None)
 
 # Caching the database engine to ensure only one instance is created
 @lru_cache(maxsize=1)
 def get_engine():
     """
     Get the database engine instance with caching.
-    Uses LRU cache to store one instance of the engine.
+    Uses LRU cache to store one instance of the engine. Connections are read-write,
+    with the performance PRAGMAs applied (see database.connection).
     
     :return: SQLAlchemy engine connected to the SQLite database.
     """
-    return create_engine("sqlite:///retail_data.db")
+    return create_sqlite_engine(get_database_file())
 
-def init_db():
-    """
-    Initialize the database with data from a CSV file.
-    Converts and cleans the data before storing it in the database.
+@lru_cache(maxsize=1)
+def get_readonly_engine():
     """
-    # Read data from CSV file
-    df = pd.read_csv("Noodify-AI/backend/database/retail_data.csv")
-    
-    # Convert 'Period' column to datetime format
-    df["Period"] = pd.to_datetime(df["Period"], format="%b-%y")
+    Get the read-only engine used for agent queries.
+    Connections are pooled and every statement runs under the statement budget.
     
-    # Convert 'Unit_Price' column to float, removing commas
-    df["Unit_Price"] = df["Unit_Price"].str.replace(",", "").astype(float)
+    :return: SQLAlchemy engine with read-only connections to the SQLite database.
+    """
+    return create_sqlite_engine(get_database_file(), read_only=True, budget=statement_budget)
+
+@lru_cache(maxsize=1)
+def get_analytics_engine():
+    """
+    Get the engine agent queries run on, selected by ANALYTICS_BACKEND:
+    the read-only SQLite engine, or DuckDB over the Parquet copy written by ingestion.
     
-    # Convert 'Sales_Volume(KG_LTRS)' column to float, removing commas
-    df["Sales_Volume(KG_LTRS)"] = df["Sales_Volume(KG_LTRS)"].str.replace(",", "").astype(float)
+    :return: SQLAlchemy engine for agent queries.
+    """
+    if ANALYTICS_BACKEND == "sqlite":
+        return get_readonly_engine()
+    elif ANALYTICS_BACKEND == "duckdb":
+        return create_duckdb_engine(ParquetDataset("retail_data"), budget=statement_budget)
+    else:
+        raise ValueError(f"Unsupported analytics backend: {ANALYTICS_BACKEND}")
+
+@lru_cache(maxsize=1)
+def get_database_file() -> str:
+    """
+    Get the filesystem path of the SQLite database.
+    Relative paths are resolved once, so the database does not move if the working directory changes.
     
-    # Convert 'Sales_Value' column to float, removing commas
-    df["Sales_Value"] = df["Sales_Value"].str.replace(",", "").astype(float)
+    :return: Absolute path to the database file.
+    """
+    return os.path.abspath(make_url(DATABASE_URL).database)
+
+def get_data_version():
+    """
+    Get the version stamp of the data loaded into retail_data.
+    The stamp is recorded by the ingestion pipeline and changes whenever different
+    source data is loaded or appended. It is read again only when `PRAGMA data_version`
+    shows that another connection, in any process, has committed to the database since.
     
-    # Get the database engine
-    engine = get_engine()
+    :return: Data version string, or None if the data has not been loaded.
+    """
+    global _version_conn, _version_cache
+    with _version_lock:
+        if _version_conn is None:
+            _version_conn = sqlite3.connect(get_database_file(), timeout=30, check_same_thread=False)
+        counter = _version_conn.execute("PRAGMA data_version").fetchone()[0]
+        if counter == _version_cache[0]:
+            return _version_cache[1]
+        try:
+            row = _version_conn.execute("SELECT version FROM ingest_log ORDER BY rowid DESC LIMIT 1").fetchone()
+            version = row[0] if row else None
+        except sqlite3.Error:
+            version = None
+        _version_cache = (counter, version)
+        return version
+
+def init_db(force: bool = False):
+    """
+    Initialize the database with data from the CSV file.
+    The load is skipped when the source data is unchanged; see database.ingest.
     
-    # Write the DataFrame to the SQL database
-    df.to_sql("retail_data", engine, index=False, if_exists="replace")
+    :param force: Reload even if the source checksum is unchanged.
+    :return: Dictionary describing the ingestion outcome.
+    """
+    from database.ingest import ingest
+    return ingest(force=force)
+
+class RetailSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase used by the agent's SQL tools.
+    Every query the agent runs is passed to the query plan advisor before execution.
+    Results larger than `max_rows` are not returned in full: the LLM receives the first
+    rows and a statistical summary, and the full result is saved in the result store
+    under a handle the client can page through or export.
+    Table info is served from a schema catalog rebuilt once per data version.
+    Queries are validated locally before they run: only a single read-only SELECT over the
+    exposed tables is accepted, and a LIMIT is added when missing unless results go to the
+    result store. They run on read-only connections under a statement budget, and are
+    retried when the database is busy.
+    With `store_all_results`, every non-empty result is stored and returned after a
+    "Result handle:" line, so the agent can show it as a server-rendered table.
+    """
+
+    def __init__(self, *args, plan_advisor: QueryPlanAdvisor = None, result_store: ResultStore = None,
+                 max_rows: int = RESULT_MAX_ROWS, store_all_results: bool = RESULT_TABLE_PLACEHOLDERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.plan_advisor = plan_advisor
+        self.result_store = result_store
+        self.max_rows = max_rows
+        self.store_all_results = store_all_results
+        self.truncated_results = 0
+        self.schema_catalog = SchemaCatalog(self, version_provider=get_data_version)
+        # With a result store, full results are stored and only `max_rows` reach the LLM, so an
+        # automatic LIMIT would only make the stored result, its summary and exports incomplete
+        self.sql_validator = SQLValidator(self, auto_limit=0 if result_store is not None else SQL_AUTO_LIMIT)
+
+    def get_table_info(self, table_names=None) -> str:
+        table_info = self.schema_catalog.table_info(table_names)
+        return table_info if table_info is not None else super().get_table_info(table_names)
+
+    def run(self, command, fetch="all", include_columns=False, **kwargs):
+        with timed("sql"):
+            if isinstance(command, str):
+                command = self.sql_validator.validate(command)
+            if self.plan_advisor is not None and isinstance(command, str):
+                self.plan_advisor.inspect(command)
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    if self.result_store is None or fetch != "all" or not isinstance(command, str) or any(kwargs.values()):
+                        return super().run(command, fetch, include_columns, **kwargs)
+                    return self._run_capped(command, include_columns)
+                except OperationalError as e:
+                    if attempt == MAX_RETRIES or not any(busy in str(e) for busy in ("locked", "busy")):
+                        raise
+                    logger.warning(f"Database busy, retrying query (attempt {attempt + 1}): {str(e)}")
+                    time.sleep(0.1 * 2 ** attempt)
+
+    def _format_rows(self, columns, rows, include_columns: bool):
+        res = [tuple(truncate_word(value, length=self._max_string_length) for value in row) for row in rows]
+        if include_columns:
+            res = [dict(zip(columns, row)) for row in res]
+        return str(res) if res else ""
+
+    def _run_capped(self, command: str, include_columns: bool = False) -> str:
+        """
+        Run a query, streaming rows beyond the cap into the result store.
+        
+        :param command: SQL query.
+        :param include_columns: Whether to return rows as dictionaries keyed by column.
+        :return: The result rows as a string, after the handle line when stored, followed by a
+            truncation note and summary when capped.
+        """
+        # Results of the same query on the same data keep their handle and are stored once
+        handle = result_handle(get_data_version(), command)
+        stored = self.result_store.get_meta(handle)
+        with self._engine.begin() as conn:
+            cursor = conn.exec_driver_sql(command)
+            if not cursor.returns_rows:
+                return ""
+            columns = list(cursor.keys())
+            head = [tuple(row) for row in cursor.fetchmany(self.max_rows + 1)]
+            if len(head) <= self.max_rows:
+                rows = self._format_rows(columns, head, include_columns)
+                if not self.store_all_results or not head:
+                    return rows
+                if stored is None:
+                    self.result_store.save(handle, command, columns, [head])
+                else:
+                    self.result_store.reuse(stored)
+                return f"Result handle: {handle}\n{rows}"
 
-# Create an instance of SQLDatabase with the cached engine
-db = SQLDatabase(engine=get_engine())
+            if stored is not None and stored["summary"] is not None:
+                self.result_store.reuse(stored)
+                row_count, summary = stored["row_count"], stored["summary"]
+            else:
+                # Stream the full result into the store while summarizing it
+                result_summary = ResultSummary(columns)
+
+                def batches():
+                    batch = head
+                    while batch:
+                        result_summary.update(batch)
+                        yield batch
+                        batch = [tuple(row) for row in cursor.fetchmany(5000)]
+
+                row_count = self.result_store.save(handle, command, columns, batches(), result_summary)
+                summary = result_summary.to_dict()
+
+        self.truncated_results += 1
+        return (
+            (f"Result handle: {handle}\n" if self.store_all_results else "")
+            + self._format_rows(columns, head[:self.max_rows], include_columns)
+            + f"\nResult truncated: showing {self.max_rows} of {row_count} rows. Full result handle: {handle}"
+            + f"\nSummary of all rows: {json.dumps(summary, default=str)}"
+        )
+
+# Function to get the LangChain SQLDatabase with caching
+@lru_cache(maxsize=1)
+def get_sql_database() -> RetailSQLDatabase:
+    """
+    Get the SQLDatabase instance used by the SQL toolkit.
+    Created on first use so that table reflection sees the ingested data;
+    only retail_data is exposed to the agent. Agent queries use the analytics engine;
+    the plan advisor keeps the read-write SQLite engine so it can create indexes, and is
+    only used when queries run on SQLite.
+    
+    :return: SQLDatabase connected to the cached analytics engine.
+    """
+    engine = get_analytics_engine()
+    on_sqlite = engine.dialect.name == "sqlite"
+    return RetailSQLDatabase(
+        engine=engine,
+        include_tables=["retail_data"],
+        # On DuckDB, retail_data is a view over the Parquet parts
+        view_support=not on_sqlite,
+        plan_advisor=QueryPlanAdvisor(get_engine()) if on_sqlite else None,
+        result_store=result_store,
+    )
 
 # Configure sessionmaker with the engine
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
@@ -59,6 +262,3 @@ def get_db():
         yield db
     finally:
         db.close()
-
-# Initialize the database
-init_db()
@@ -0,0 +1,260 @@
+import difflib
+import json
+import logging
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import SQL_AUTO_LIMIT
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# String literals, comments and quoted identifiers, which may contain keywords, semicolons or parentheses
+SKIPPED_PATTERN = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/|`[^`]*`|\"(?:[^\"]|\"\")*\"|\[[^\]]*\]", re.DOTALL)
+WORD_PATTERN = re.compile(r"[A-Za-z_]+|[();]")
+# Unknown-name errors of SQLite and DuckDB
+MISSING_NAME_PATTERNS = [
+    re.compile(r"no such (column|table): (\S+)"),
+    re.compile(r"Referenced (column) \"?([^\"\s]+)\"? not found"),
+    re.compile(r"(Table) with name (\S+) does not exist"),
+]
+# DuckDB functions that read files, the environment or the catalog; on SQLite the authorizer covers this
+FILE_FUNCTION_PATTERN = re.compile(r"READ_\w+|\w+_SCAN|GLOB|SNIFF_CSV|QUERY|QUERY_TABLE|GETENV|DUCKDB_\w+|PRAGMA_\w+")
+
+# Authorizer actions a read-only SELECT needs; everything else is denied
+ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, getattr(sqlite3, "SQLITE_RECURSIVE", 33)}
+DENIED_ACTION_NAMES = [
+    "INSERT", "UPDATE", "DELETE", "CREATE_TABLE", "CREATE_INDEX", "CREATE_VIEW", "DROP_TABLE",
+    "DROP_INDEX", "DROP_VIEW", "ALTER_TABLE", "PRAGMA", "ATTACH", "DETACH", "TRANSACTION",
+]
+ACTION_NAMES = {getattr(sqlite3, f"SQLITE_{name}"): name.replace("_", " ") for name in DENIED_ACTION_NAMES}
+
+class SQLValidationError(SQLAlchemyError):
+    """
+    Raised when agent-generated SQL is rejected by the validator.
+    Derives from SQLAlchemyError so SQLDatabase.run_no_throw returns it to the agent as an error message.
+    """
+
+def _keywords(sql: str) -> List[str]:
+    return [word.upper() for word in WORD_PATTERN.findall(SKIPPED_PATTERN.sub(" ", sql))]
+
+def _nodes(tree: Any) -> Iterator[Dict[str, Any]]:
+    # Every object of a serialized DuckDB parse tree, depth first
+    if isinstance(tree, dict):
+        yield tree
+        tree = list(tree.values())
+    if isinstance(tree, list):
+        for child in tree:
+            yield from _nodes(child)
+
+class SQLValidator:
+    """
+    Deterministic checker for agent-generated SQL, used in place of the LLM query checker.
+    A query must be a single SELECT (or WITH ... SELECT) statement. It is compiled, but not
+    run, by SQLite on a read-only connection with an authorizer that only permits reading
+    the tables exposed to the agent, so unknown tables and columns (including backticked
+    names such as `Sales_Volume(KG_LTRS)`) are reported exactly as SQLite resolves them.
+    A LIMIT is added to queries without one. On other backends (DuckDB) the statement is
+    compiled with EXPLAIN through the agent's engine after its parse tree is checked:
+    only the exposed tables and the query's own CTEs may be scanned, so table functions and
+    replacement scans of file paths (`FROM '/etc/passwd'`) are rejected however they are
+    quoted, and backticked identifiers are rewritten to double quotes.
+    """
+
+    def __init__(self, db, auto_limit: int = SQL_AUTO_LIMIT):
+        self._db = db
+        self.auto_limit = auto_limit
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.validated = 0
+        self.limits_added = 0
+        self.rejected: Counter = Counter()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One read-only connection per thread; compiling a statement takes no write lock
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self._db._engine.url.database}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def _columns(self) -> List[str]:
+        tables = self._db.schema_catalog.tables()
+        return [column for table in tables.values() for column in table["columns"]]
+
+    def _reject(self, reason: str, message: str):
+        with self._lock:
+            self.rejected[reason] += 1
+        logger.info(f"Rejected agent query ({reason}): {message}")
+        raise SQLValidationError(message)
+
+    def _check_statement(self, sql: str) -> List[str]:
+        keywords = _keywords(sql)
+        if not keywords:
+            self._reject("empty", "The query is empty.")
+        if ";" in keywords:
+            self._reject("multiple_statements", "Only a single SQL statement is allowed; remove the other statements.")
+        if keywords[0] not in ("SELECT", "WITH"):
+            self._reject(
+                "not_select",
+                f"Only read-only SELECT queries are allowed, but the query starts with {keywords[0]}.",
+            )
+        return keywords
+
+    def _to_dialect(self, sql: str) -> str:
+        # Backticks are SQLite/MySQL quoting; other dialects use double quotes
+        def quote(match):
+            token = match.group(0)
+            if token.startswith("`"):
+                return '"' + token[1:-1].replace('"', '""') + '"'
+            return token
+        return SKIPPED_PATTERN.sub(quote, sql)
+
+    def _check_scans(self, conn, sql: str):
+        # DuckDB serializes the parse tree of a SELECT; names in it are unquoted and resolved
+        serialized = conn.execute(text("SELECT json_serialize_sql(CAST(:sql AS VARCHAR))"), {"sql": sql}).scalar()
+        tree = json.loads(serialized) if isinstance(serialized, str) else serialized
+        if tree.get("error"):
+            # Not a SELECT the parser accepts; EXPLAIN reports why
+            return
+        nodes = list(_nodes(tree["statements"]))
+        tables: Set[str] = {table.lower() for table in self._db.get_usable_table_names()}
+        for node in nodes:
+            for cte in (node.get("cte_map") or {}).get("map", []):
+                tables.add(cte["key"].lower())
+        for node in nodes:
+            if node.get("type") == "TABLE_FUNCTION":
+                name = node.get("function", {}).get("function_name", "table function")
+                self._reject("not_authorized", f"Query rejected: {name} is not allowed; query the available tables.")
+            if node.get("type") == "BASE_TABLE" and (
+                node.get("schema_name") or node.get("catalog_name") or node["table_name"].lower() not in tables
+            ):
+                self._reject(
+                    "not_authorized",
+                    f"Query rejected: table {node['table_name']} is not available; "
+                    f"use {', '.join(self._db.get_usable_table_names())}.",
+                )
+            if node.get("class") == "FUNCTION" and FILE_FUNCTION_PATTERN.fullmatch(node.get("function_name", "").upper()):
+                self._reject("not_authorized", f"Query rejected: {node['function_name']} is not allowed.")
+
+    def _explain(self, sql: str):
+        try:
+            with self._db._engine.connect() as conn:
+                self._check_scans(conn, sql)
+                conn.exec_driver_sql(f"EXPLAIN {sql}")
+        except SQLAlchemyError as e:
+            if isinstance(e, SQLValidationError):
+                raise
+            message = str(getattr(e, "orig", None) or e).splitlines()[0]
+            self._reject(*self._describe_error(message))
+
+    def _compile(self, sql: str):
+        tables = {table.lower() for table in self._db.get_usable_table_names()}
+        denied: List[str] = []
+
+        def authorize(action, arg1, arg2, db_name, trigger):
+            if arg1 and arg1.lower().startswith(("sqlite_", "pragma_")):
+                denied.append("system tables and pragmas are not available")
+                return sqlite3.SQLITE_DENY
+            if action not in ALLOWED_ACTIONS:
+                denied.append(f"{ACTION_NAMES.get(action, 'this operation')} is not allowed in a read-only query")
+                return sqlite3.SQLITE_DENY
+            if action == sqlite3.SQLITE_READ and arg1 and arg1.lower() not in tables:
+                denied.append(f"table {arg1} is not available; use {', '.join(sorted(tables))}")
+                return sqlite3.SQLITE_DENY
+            return sqlite3.SQLITE_OK
+
+        conn = self._connection()
+        conn.set_authorizer(authorize)
+        try:
+            conn.execute(f"EXPLAIN {sql}")
+        except sqlite3.Error as e:
+            if denied:
+                self._reject("not_authorized", f"Query rejected: {denied[0]}.")
+            self._reject(*self._describe_error(str(e)))
+        finally:
+            conn.set_authorizer(None)
+
+    def _describe_error(self, message: str) -> Tuple[str, str]:
+        missing = next((found for found in (pattern.search(message) for pattern in MISSING_NAME_PATTERNS) if found), None)
+        if missing is None:
+            return "invalid", f"Invalid SQL: {message}."
+        kind, name = missing.group(1).lower(), missing.group(2)
+        if kind == "table":
+            return "unknown_table", f"Unknown table {name}; available tables: {', '.join(self._db.get_usable_table_names())}."
+        columns = self._columns()
+        suggestions = difflib.get_close_matches(name, columns, n=3, cutoff=0.5)
+        if not suggestions:
+            suggestions = [column for column in columns if column.lower().startswith(name.lower()[:4])]
+        quote = "`" if self._db.dialect == "sqlite" else '"'
+        hint = f" Did you mean {', '.join(f'{quote}{column}{quote}' for column in suggestions)}?" if suggestions else ""
+        return "unknown_column", (
+            f"Unknown column {name}.{hint} Quote names with special characters or spaces, "
+            f"e.g. {quote}Sales_Volume(KG_LTRS){quote} or {quote}Item Name{quote}."
+        )
+
+    def _add_limit(self, sql: str, keywords: List[str]) -> str:
+        depth = 0
+        for word in keywords:
+            if word == "(":
+                depth += 1
+            elif word == ")":
+                depth -= 1
+            elif word == "LIMIT" and depth == 0:
+                return sql
+        with self._lock:
+            self.limits_added += 1
+        return f"{sql}\nLIMIT {self.auto_limit}"
+
+    def validate(self, sql: str) -> str:
+        """
+        Validate a query and add a LIMIT if it has none.
+
+        :param sql: SQL query generated by the agent.
+        :return: The query to run.
+        :raises SQLValidationError: If the query is not a single valid read-only SELECT.
+        """
+        sql = sql.strip().rstrip(";").strip()
+        keywords = self._check_statement(sql)
+        if self._db.dialect == "sqlite":
+            self._compile(sql)
+        else:
+            sql = self._to_dialect(sql)
+            self._explain(sql)
+        if self.auto_limit:
+            sql = self._add_limit(sql, keywords)
+        with self._lock:
+            self.validated += 1
+        return sql
+
+    def check(self, sql: str) -> str:
+        """
+        Validate a query for the sql_db_query_checker tool.
+
+        :param sql: SQL query generated by the agent.
+        :return: The query to run, or an error message.
+        """
+        try:
+            return self.validate(sql)
+        except SQLValidationError as e:
+            return f"Error: {e}"
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get validator statistics.
+
+        :return: Dictionary with the number of validated queries, added limits and rejections by reason.
+        """
+        with self._lock:
+            return {
+                "validated": self.validated,
+                "limits_added": self.limits_added,
+                "auto_limit": self.auto_limit,
+                "rejected": dict(self.rejected),
+            }
@@ -0,0 +1,392 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from langchain_core.outputs import ChatResult
+
+from config import (
+    LLM_MAX_CONNECTIONS, LLM_KEEPALIVE_CONNECTIONS, LLM_REQUEST_TIMEOUT, LLM_MAX_RETRIES, LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX, LLM_MAX_WAIT, LLM_RATE_LIMITS,
+)
+from concurrency import provider_limiter, llm_provider, is_rate_limited
+from context_budget import context_budget, TOKENS_PER_MESSAGE
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: rate limits and transient server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Errors raised without an HTTP status when the provider cannot be reached
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "RemoteProtocolError"}
+# Set while a managed _generate/_agenerate runs; providers that stream inside it (ChatOpenAI
+# with streaming=True) reach _stream/_astream, which must not manage the same call again
+_managed_call: ContextVar[bool] = ContextVar("managed_call", default=False)
+
+class LLMThrottled(Exception):
+    """
+    Raised when a model's rate budget cannot be granted within LLM_MAX_WAIT seconds.
+    Chat models with a fallback switch to it on this error.
+    """
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute / 60` units per second, holding at
+    most a minute's worth. Reservations are taken immediately and may drive the balance
+    negative; the caller then waits until the balance would have recovered.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Take units from the bucket.
+
+        :param amount: Units to take (capped at the capacity).
+        :param now: Current monotonic time.
+        :return: Seconds to wait before the units are available.
+        """
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+class ModelRateLimiter:
+    """
+    Client-side rate limits of one model: requests per minute and tokens per minute.
+    A call reserves one request and its estimated prompt tokens before it is sent; the
+    completion tokens are charged once the response arrives. Calls also wait out the
+    provider's rate-limit pause (ProviderLimiter.backoff), so after a 429 concurrent calls
+    and agent runs back off together. A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, model_name: str, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 max_wait: float = LLM_MAX_WAIT):
+        self.model_name = model_name
+        self.provider = llm_provider(model_name)
+        self.max_wait = max_wait
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.throttled = 0
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = provider_limiter.paused_for(self.provider)
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            if wait > self.max_wait:
+                # Give the reservation back; the caller fails over instead of waiting
+                if self._requests is not None:
+                    self._requests.refund(1)
+                if self._tokens is not None:
+                    self._tokens.refund(tokens)
+                self.throttled += 1
+                raise LLMThrottled(f"Rate budget of {self.model_name} exhausted for the next {wait:.1f}s")
+            self.calls += 1
+            if wait > 0:
+                self.waits += 1
+                self.wait_seconds_total += wait
+            return wait
+
+    def acquire(self, tokens: int):
+        """
+        Wait until a call of the given size fits in the rate limits.
+
+        :param tokens: Estimated prompt tokens of the call.
+        :raises LLMThrottled: If the wait would exceed max_wait.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int):
+        """
+        Async counterpart of acquire.
+
+        :param tokens: Estimated prompt tokens of the call.
+        :raises LLMThrottled: If the wait would exceed max_wait.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def charge(self, tokens: int):
+        """
+        Charge tokens that were not reserved up front (the completion).
+
+        :param tokens: Number of tokens.
+        """
+        if self._tokens is not None and tokens > 0:
+            with self._lock:
+                self._tokens.reserve(tokens, time.monotonic())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get rate limiter statistics.
+
+        :return: Dictionary with the limits, calls, waits and throttled calls.
+        """
+        with self._lock:
+            return {
+                "requests_per_minute": self._requests.capacity if self._requests else None,
+                "tokens_per_minute": self._tokens.capacity if self._tokens else None,
+                "calls": self.calls,
+                "waits": self.waits,
+                "wait_seconds_total": round(self.wait_seconds_total, 3),
+                "throttled": self.throttled,
+            }
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Parse rate limits configured as "model=rpm:tpm,model=rpm:tpm".
+
+    :param spec: Rate limit specification.
+    :return: Dictionary of (requests per minute, tokens per minute) by model name.
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        model_name, _, values = entry.partition("=")
+        requests, _, tokens = values.partition(":")
+        limits[model_name.strip()] = (int(requests or 0), int(tokens or 0))
+    return limits
+
+# Shared rate limiters by model name, used by all chat models of this worker
+_rate_limits = parse_rate_limits(LLM_RATE_LIMITS)
+_rate_limiters: Dict[str, ModelRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(model_name: str) -> ModelRateLimiter:
+    """
+    Get the rate limiter of a model, creating it on first use.
+
+    :param model_name: Name of the LLM.
+    :return: ModelRateLimiter (unlimited for models without configured limits).
+    """
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(model_name)
+        if limiter is None:
+            limiter = ModelRateLimiter(model_name, *_rate_limits.get(model_name, (0, 0)))
+            _rate_limiters[model_name] = limiter
+        return limiter
+
+@lru_cache(maxsize=1)
+def get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    Get the HTTP clients shared by all OpenAI chat models.
+    Connections are kept alive and reused across calls, up to the configured pool size.
+
+    :return: Tuple of the sync and async httpx clients.
+    """
+    limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS)
+    timeout = httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=10.0)
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Check whether a failed LLM call may succeed if retried.
+
+    :param error: Exception raised by the provider client.
+    :return: True for rate limits, transient server errors and connection failures.
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    return type(error).__name__ in RETRYABLE_ERRORS or type(error).__name__ == "ResourceExhausted"
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Get the delay before retrying a failed call: the provider's Retry-After when given,
+    otherwise exponential backoff with full jitter, capped at LLM_BACKOFF_MAX.
+
+    :param error: Exception raised by the provider client.
+    :param attempt: Number of the failed attempt, starting at 0.
+    :return: Seconds to wait.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return min(float(headers["retry-after-ms"]) / 1000, LLM_BACKOFF_MAX)
+        if headers.get("retry-after"):
+            return min(float(headers["retry-after"]), LLM_BACKOFF_MAX)
+    except ValueError:
+        pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+def estimate_prompt_tokens(messages: List[Any], model_name: str, functions: Optional[List[Any]] = None) -> int:
+    tokens = sum(TOKENS_PER_MESSAGE + context_budget.count_tokens(str(message.content), model_name) for message in messages)
+    if functions:
+        tokens += context_budget.count_tokens(json.dumps(functions, default=str), model_name)
+    return tokens
+
+def completion_tokens(result: ChatResult, model_name: str) -> int:
+    usage = (result.llm_output or {}).get("token_usage") or {}
+    if usage.get("completion_tokens"):
+        return usage["completion_tokens"]
+    return sum(context_budget.count_tokens(generation.text, model_name) for generation in result.generations)
+
+class ManagedChatModel:
+    """
+    Mixin for chat models adding client-side rate limiting and retries around provider calls.
+    Each call waits for the model's rate budget (see ModelRateLimiter) and is retried on
+    rate limits and transient errors with bounded, jittered backoff. A rate limit from
+    the provider pauses all calls to that provider; if the budget cannot be granted
+    within LLM_MAX_WAIT, LLMThrottled is raised so a fallback model can take over.
+    Streamed calls (used whenever a streaming callback is attached, e.g. under astream_events)
+    are managed the same way and retried until their first chunk; a stream failing after
+    that raises, since its tokens have already been emitted.
+    Calls answered by the prompt cache never reach these methods.
+    """
+
+    @property
+    def managed_model_name(self) -> str:
+        return getattr(self, "model_name", None) or getattr(self, "model", "unknown")
+
+    def _prepare_call(self, messages, kwargs) -> Tuple[str, ModelRateLimiter, int]:
+        model_name = self.managed_model_name
+        return model_name, get_rate_limiter(model_name), estimate_prompt_tokens(messages, model_name, kwargs.get("functions"))
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        # Delay before retrying a failed call, or None when it should be raised
+        if not is_retryable(error) or attempt == LLM_MAX_RETRIES:
+            return None
+        delay = retry_delay(error, attempt)
+        model_name = self.managed_model_name
+        if is_rate_limited(error):
+            provider_limiter.backoff(llm_provider(model_name), delay)
+        logger.warning(f"{model_name} call failed ({type(error).__name__}), retrying in {delay:.2f}s (attempt {attempt + 1})")
+        return delay
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        model_name, limiter, prompt_tokens = self._prepare_call(messages, kwargs)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            limiter.acquire(prompt_tokens)
+            token = _managed_call.set(True)
+            try:
+                result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            finally:
+                _managed_call.reset(token)
+            limiter.charge(completion_tokens(result, model_name))
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        model_name, limiter, prompt_tokens = self._prepare_call(messages, kwargs)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await limiter.aacquire(prompt_tokens)
+            token = _managed_call.set(True)
+            try:
+                result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                _managed_call.reset(token)
+            limiter.charge(completion_tokens(result, model_name))
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if _managed_call.get():
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return
+        model_name, limiter, prompt_tokens = self._prepare_call(messages, kwargs)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            limiter.acquire(prompt_tokens)
+            chunks = super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                # The request is sent when the first chunk is pulled
+                first = next(chunks)
+            except StopIteration:
+                return
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            break
+        text = [first.text]
+        yield first
+        for chunk in chunks:
+            text.append(chunk.text)
+            yield chunk
+        limiter.charge(context_budget.count_tokens("".join(text), model_name))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if _managed_call.get():
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+            return
+        model_name, limiter, prompt_tokens = self._prepare_call(messages, kwargs)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await limiter.aacquire(prompt_tokens)
+            chunks = super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            break
+        text = [first.text]
+        yield first
+        async for chunk in chunks:
+            text.append(chunk.text)
+            yield chunk
+        limiter.charge(context_budget.count_tokens("".join(text), model_name))
+
+    def to_json(self):
+        # Pooled HTTP clients are not part of the model's identity, and their repr changes in
+        # every process, which would change the prompt cache keys derived from the model
+        serialized = super().to_json()
+        for key in ("http_client", "http_async_client"):
+            serialized.get("kwargs", {}).pop(key, None)
+        return serialized
+
+def llm_client_stats() -> Dict[str, Any]:
+    """
+    Get statistics of the LLM client layer.
+
+    :return: Dictionary with the HTTP pool limits and the rate limiter statistics per model.
+    """
+    with _rate_limiters_lock:
+        limiters = dict(_rate_limiters)
+    return {
+        "max_connections": LLM_MAX_CONNECTIONS,
+        "max_keepalive_connections": LLM_KEEPALIVE_CONNECTIONS,
+        "models": {model_name: limiter.stats() for model_name, limiter in limiters.items()},
+    }
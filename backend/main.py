@@ -1,17 +1,39 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
+# Imported first so the time to ready is measured from the start of the application import
+from warmup import warmup
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from langserve.pydantic_v1 import BaseModel, Field
+from langchain_core.pydantic_v1 import BaseModel, Field
 import asyncio
-from typing import Any, List
-from sqlalchemy.orm import Session
+import json
+import time
+from typing import Any, Dict, List, Optional
 from contextlib import asynccontextmanager
 import logging
 
-from sql_agent.agent import create_retail_agent, run_agent
-from database.sql_db_langchain import get_db
-from config import TOOL_LLM_NAME, AGENT_LLM_NAME
+from sql_agent.agent import arun_agent, astream_agent
+from sql_agent.agent_pool import agent_pool
+from sql_agent.intent_router import intent_router
+from database.sql_db_langchain import init_db, get_sql_database, statement_budget
+from database.result_store import result_store
+from database.entity_index import entity_index
+from config import TOOL_LLM_NAME, AGENT_LLM_NAME, BATCH_CONCURRENCY, BATCH_MAX_QUESTIONS, MAX_RETRIES
+from response_cache import response_cache
+from sessions import session_store
+from context_budget import context_budget, load_encodings
+from prompt_cache import prompt_cache
+from tools.retriever import few_shot_index
+from streaming import format_sse, stream_stats
+from metrics import registry, REQUEST_SECONDS, start_request_timings
+from concurrency import (
+    query_limiter, query_flights, provider_limiter, llm_provider, OverloadedError,
+)
+from starlette.background import BackgroundTask
+from tools.chart_renderer import chart_renderer
+from tools.result_tables import result_tables
 from utils import setup_logging
+from structured_logging import query_fields, log_sampled_payload
+from llm_clients import llm_client_stats
 
 # Setup logging configuration
 setup_logging()
@@ -22,22 +44,46 @@ class Input(BaseModel):
     input: str = Field(..., description="The retail insights query")
     tool_llm_name: str = Field(default=TOOL_LLM_NAME, description="LLM for SQL tools")
     agent_llm_name: str = Field(default=AGENT_LLM_NAME, description="LLM for the agent")
-    chat_history: List[str] = Field(default=[], description="Chat history")
+    chat_history: List[str] = Field(default=[], description="Chat history (ignored when session_id is set)")
+    session_id: Optional[str] = Field(default=None, description="Server-side session holding the conversation; a new one is started if omitted")
+    include_timings: bool = Field(default=False, description="Return a per-stage timing breakdown")
 
 # Define output data model for the API
 class Output(BaseModel):
     output: Any = Field(..., description="The response from the Retail Insights Chatbot")
     tokens_used: int = Field(..., description="Number of tokens used in the query")
     cost: float = Field(..., description="Cost of the query")
+    metadata: Dict[str, Any] = Field(default={}, description="Per-request execution details")
+    session_id: Optional[str] = Field(default=None, description="Session to send with the next question")
+
+# Define input data model for batch queries
+class BatchInput(BaseModel):
+    questions: List[str] = Field(..., min_items=1, max_items=BATCH_MAX_QUESTIONS, description="The retail insights queries")
+    tool_llm_name: str = Field(default=TOOL_LLM_NAME, description="LLM for SQL tools")
+    agent_llm_name: str = Field(default=AGENT_LLM_NAME, description="LLM for the agent")
+    max_concurrency: int = Field(default=BATCH_CONCURRENCY, ge=1, le=BATCH_CONCURRENCY, description="Questions answered at once")
 
 # Context manager to handle application lifespan events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Application is starting up...")
+    # Warm up in the background so the server answers health checks meanwhile; /readyz reports progress
+    warmup_task = asyncio.create_task(warmup.run([
+        # Load the tokenizers; the first load may download the BPE files
+        ("tokenizers", lambda: load_encodings([TOOL_LLM_NAME, AGENT_LLM_NAME])),
+        # Load the data if the source changed (a no-op when run.py already ingested it)
+        ("database", init_db),
+        # Prebuild the default agent executor so the first request does not pay for it
+        ("agent", lambda: agent_pool.warm([(TOOL_LLM_NAME, AGENT_LLM_NAME)])),
+        # Build the entity index used to resolve values mentioned in questions
+        ("entity_index", entity_index.refresh),
+    ]))
     yield
     # Shutdown
     logger.info("Application is shutting down...")
+    warmup_task.cancel()
+    chart_renderer.shutdown()
 
 # Create FastAPI application instance
 app = FastAPI(
@@ -47,6 +93,15 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Reject overloaded requests quickly with a Retry-After hint
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # CORS configuration to allow specific origins
 origins = [
     "http://localhost:3000",
@@ -60,47 +115,350 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Function to truncate chat history to fit within token limit
-def truncate_chat_history(history, max_tokens=1000):
-    truncated_history = []
-    current_tokens = 0
-    for message in reversed(history):
-        message_tokens = len(message.split())  # Simple approximation
-        if current_tokens + message_tokens > max_tokens:
-            break
-        truncated_history.insert(0, message)
-        current_tokens += message_tokens
-    return truncated_history
+# Function to get the chat history of a request from its session or its payload
+def resolve_history(input: Input):
+    """
+    Get the chat history to answer a request with.
+    Requests sending chat_history without a session_id keep the stateless behavior;
+    otherwise the history comes from the session, which is started if none was given.
+
+    Reads the session store and counts tokens, so handlers call it in a thread.
+
+    :param input: The request body.
+    :return: Tuple of the session id (None for stateless requests) and the truncated chat history.
+    """
+    if input.session_id is None and input.chat_history:
+        return None, context_budget.truncate_history(input.chat_history, input.agent_llm_name)
+    session_id = input.session_id or session_store.create()
+    history = session_store.history(session_id, input.agent_llm_name)
+    if history is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return session_id, history
+
+# Function to answer a question from the response cache, the intent router or the agent
+async def answer_question(question: str, truncated_history: List[str], tool_llm_name: str, agent_llm_name: str):
+    """
+    Answer a question without streaming.
+    Repeated questions are served from the response cache and template questions by the
+    intent router. Other questions run the agent, sharing the run with identical questions
+    already in flight.
+
+    :param question: The retail insights query.
+    :param truncated_history: Chat history within the history token budget.
+    :param tool_llm_name: Name of the tool LLM.
+    :param agent_llm_name: Name of the agent LLM.
+    :return: Tuple of the route and a dictionary with the output, tokens, cost and route-specific metadata.
+    """
+    # Serve repeated questions from the response cache
+    cache_key = await asyncio.to_thread(
+        response_cache.make_key, question, truncated_history, tool_llm_name, agent_llm_name
+    )
+    cached = await response_cache.aget(cache_key)
+    if cached is not None:
+        logger.info("Serving response from cache")
+        return "cache", {"output": cached["output"]}
+
+    # Answer template questions directly without the LLM agent
+    routed = await asyncio.to_thread(intent_router.route, question)
+    if routed is not None:
+        await response_cache.aset(cache_key, {"output": routed["output"], "tokens_used": 0, "cost": 0.0})
+        return "router", {"output": routed["output"], "router": routed}
+
+    async def run():
+        # Wait for a free slot and a provider slot; raises OverloadedError when saturated
+        async with query_limiter.slot(), provider_limiter.slot(llm_provider(agent_llm_name)):
+            # Get a pooled retail agent with request-scoped memory; a pool miss or a data version
+            # change builds the agent, so it runs in a thread
+            agent = await asyncio.to_thread(agent_pool.acquire, tool_llm_name, agent_llm_name, truncated_history)
+
+            # Run the agent asynchronously
+            agent_started = time.perf_counter()
+            result = await arun_agent(agent, question, truncated_history)
+            intent_router.record_agent_latency(time.perf_counter() - agent_started)
+
+        await response_cache.aset(cache_key, {"output": result[0], "tokens_used": result[1], "cost": result[2]})
+        return result
+
+    # Identical queries already being answered share that agent run
+    (response, tokens, cost, context), shared = await query_flights.run(cache_key, run)
+    if shared:
+        logger.info("Serving response from an in-flight agent run")
+        query_flights.record_saved(tokens, cost)
+        return "coalesced", {"output": response}
+    return "agent", {"output": response, "tokens": tokens, "cost": cost, "context": context}
 
 # Root endpoint
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Retail Insights Chatbot API"}
 
+# Liveness endpoint: the worker is up and serving requests
+@app.get("/healthz")
+def read_health():
+    return {"status": "ok"}
+
+# Readiness endpoint: the worker finished warming up; returns 503 with the progress until then
+@app.get("/readyz")
+def read_ready():
+    progress = warmup.stats()
+    return JSONResponse(status_code=200 if progress["ready"] else 503, content=progress)
+
+# Endpoint to report runtime statistics
+@app.get("/stats")
+def read_stats():
+    return {
+        "agent_pool": agent_pool.stats(),
+        "intent_router": intent_router.stats(),
+        "context_budget": context_budget.stats(),
+        "sessions": session_store.stats(),
+        "prompt_cache": prompt_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "streaming": stream_stats.stats(),
+        "concurrency": query_limiter.stats(),
+        "providers": provider_limiter.stats(),
+        "llm_clients": llm_client_stats(),
+        "coalescing": query_flights.stats(),
+        "query_plans": get_sql_database().plan_advisor.stats(),
+        "schema_catalog": get_sql_database().schema_catalog.stats(),
+        "entity_index": entity_index.stats(),
+        "sql_validator": get_sql_database().sql_validator.stats(),
+        "statement_budget": statement_budget.stats(),
+        "charts": chart_renderer.stats(),
+        "results": dict(result_store.stats(), truncated_queries=get_sql_database().truncated_results),
+        "result_tables": result_tables.stats(),
+        "few_shot_index": few_shot_index.stats(),
+        "warmup": warmup.stats(),
+    }
+
+# Endpoint to expose metrics in Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+# Endpoint to serve rendered charts by content hash
+@app.get("/charts/{chart_id}")
+def read_chart(chart_id: str):
+    chart = chart_renderer.get(chart_id)
+    if chart is None:
+        raise HTTPException(status_code=404, detail="Chart not found")
+    image, media_type = chart
+    # Chart ids are content hashes, so the response never changes
+    return Response(content=image, media_type=media_type, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+# Endpoint to page through a stored query result
+@app.get("/results/{handle}")
+def read_result(handle: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    page = result_store.page(handle, offset, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    return page
+
+# Endpoint to export a stored query result as CSV or Arrow
+@app.get("/results/{handle}/export")
+def export_result(handle: str, format: str = Query("csv", pattern="^(csv|arrow)$")):
+    if result_store.get_meta(handle) is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    if format == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Arrow export requires the pyarrow package")
+        # Column types come from the whole result, before the response starts
+        schema = result_store.arrow_schema(handle)
+        if schema is None:
+            raise HTTPException(status_code=404, detail="Result not found or expired")
+        content, media_type = result_store.iter_arrow(handle, schema), "application/vnd.apache.arrow.stream"
+    else:
+        content, media_type = result_store.iter_csv(handle), "text/csv"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={handle}.{format}"},
+    )
+
+# Endpoint to end a conversation session
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return {"deleted": session_id}
+
 # Endpoint to process retail insights queries
 @app.post("/query", response_model=Output)
 async def query_retail_insights(
     request: Request,
-    input: Input,
-    db: Session = Depends(get_db)
+    input: Input
 ):
+    started = time.perf_counter()
+    timings = start_request_timings() if input.include_timings else None
+
+    # Chat history from the session, or the payload truncated to the history token budget
+    session_id, truncated_history = await asyncio.to_thread(resolve_history, input)
+
+    async def respond(route, output, tokens=0, cost=0.0, **metadata):
+        elapsed = time.perf_counter() - started
+        REQUEST_SECONDS.observe(elapsed, endpoint="/query", route=route)
+        metadata["route"] = route
+        if timings is not None:
+            metadata["timings"] = dict(timings, total=elapsed)
+        if session_id is not None:
+            await session_store.record_turn(session_id, input.input, output, input.agent_llm_name)
+        return {"output": output, "tokens_used": tokens, "cost": cost, "metadata": metadata, "session_id": session_id}
+
     try:
-        logger.info(f"Received query: {input.input}")
-        logger.info(f"Chat history: {input.chat_history}")
-
-        # Truncate chat history to manage token usage
-        truncated_history = truncate_chat_history(input.chat_history)
-        
-        # Create retail agent
-        agent = create_retail_agent(input.tool_llm_name, input.agent_llm_name, db)
-        
-        # Run the agent asynchronously
-        response, tokens, cost = await asyncio.to_thread(
-            run_agent, agent, input.input, truncated_history
-        )
+        logger.info("Received query", extra=query_fields(input.input, truncated_history))
+        log_sampled_payload(logger, "Chat history", truncated_history)
+
+        route, answer = await answer_question(input.input, truncated_history, input.tool_llm_name, input.agent_llm_name)
 
         # Return the response
-        return {"output": response, "tokens_used": tokens, "cost": cost}
+        return await respond(route, **answer)
+    except OverloadedError:
+        raise
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+# Endpoint to answer a list of questions, streaming each result as newline-delimited JSON
+@app.post("/query/batch")
+async def batch_retail_insights(input: BatchInput):
+    started = time.perf_counter()
+    logger.info(f"Received batch of {len(input.questions)} queries")
+
+    # Build the agent executor, and with it the schema summary, once for the whole batch
+    try:
+        await asyncio.to_thread(agent_pool.get, input.tool_llm_name, input.agent_llm_name)
+    except Exception as e:
+        logger.error(f"Error preparing batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    semaphore = asyncio.Semaphore(input.max_concurrency)
+
+    async def answer_item(index: int, question: str) -> Dict[str, Any]:
+        async with semaphore:
+            item_started = time.perf_counter()
+            item = {"index": index, "input": question}
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    route, answer = await answer_question(question, [], input.tool_llm_name, input.agent_llm_name)
+                    item.update(output=answer["output"], tokens_used=answer.get("tokens", 0),
+                                cost=answer.get("cost", 0.0), route=route)
+                    break
+                except Exception as e:
+                    # Rate-limited LLM calls are already retried by the client layer, which pauses
+                    # the provider; only runs turned away by a full queue are started again
+                    if not isinstance(e, OverloadedError) or attempt == MAX_RETRIES:
+                        logger.error(f"Error processing batch query {index}: {str(e)}")
+                        item["error"] = str(e)
+                        break
+                    logger.warning(f"Batch query {index} was throttled, retrying in {e.retry_after}s (attempt {attempt + 1})")
+                    await asyncio.sleep(e.retry_after)
+            item["elapsed"] = time.perf_counter() - item_started
+            return item
+
+    async def results():
+        tasks = [asyncio.create_task(answer_item(index, question)) for index, question in enumerate(input.questions)]
+        totals = {"questions": len(tasks), "failed": 0, "tokens_used": 0, "cost": 0.0, "routes": {}}
+        try:
+            for finished in asyncio.as_completed(tasks):
+                item = await finished
+                if "error" in item:
+                    totals["failed"] += 1
+                else:
+                    totals["tokens_used"] += item["tokens_used"]
+                    totals["cost"] += item["cost"]
+                    totals["routes"][item["route"]] = totals["routes"].get(item["route"], 0) + 1
+                yield json.dumps(item, default=str) + "\n"
+        finally:
+            # Stop the remaining questions if the client went away
+            for task in tasks:
+                task.cancel()
+
+        totals["total_time"] = time.perf_counter() - started
+        REQUEST_SECONDS.observe(totals["total_time"], endpoint="/query/batch", route="batch")
+        yield json.dumps({"summary": totals}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+# Endpoint to stream retail insights queries as Server-Sent Events
+@app.post("/query/stream")
+async def stream_retail_insights(request: Request, input: Input):
+    started = time.perf_counter()
+    timings = start_request_timings() if input.include_timings else None
+
+    # Chat history from the session, or the payload truncated to the history token budget
+    session_id, truncated_history = await asyncio.to_thread(resolve_history, input)
+    logger.info("Received streaming query", extra=query_fields(input.input, truncated_history))
+    log_sampled_payload(logger, "Chat history", truncated_history)
+    cache_key = await asyncio.to_thread(
+        response_cache.make_key, input.input, truncated_history, input.tool_llm_name, input.agent_llm_name
+    )
+
+    # Answer from the cache or the intent router when possible
+    cached = await response_cache.aget(cache_key)
+    route = "cache" if cached is not None else "agent"
+    if cached is None:
+        routed = await asyncio.to_thread(intent_router.route, input.input)
+        if routed is not None:
+            cached = {"output": routed["output"]}
+            route = "router"
+            await response_cache.aset(cache_key, {"output": routed["output"], "tokens_used": 0, "cost": 0.0})
+
+    # Admit agent runs before the 200 response starts; raises OverloadedError when saturated
+    slot = await query_limiter.acquire() if cached is None else None
+
+    async def event_stream():
+        ttfb = None
+        time_to_first_token = None
+        output = None
+
+        def emit(event, data):
+            nonlocal ttfb, time_to_first_token
+            elapsed = time.perf_counter() - started
+            if ttfb is None:
+                ttfb = elapsed
+            if event == "token" and time_to_first_token is None:
+                time_to_first_token = elapsed
+            return format_sse(event, data)
+
+        try:
+            if cached is not None:
+                logger.info("Serving streamed response without the agent")
+                output = cached["output"]
+                yield emit("final", {"output": output, "tokens_used": 0, "cost": 0.0})
+            else:
+                # Agent runs hold a provider slot, as in answer_question
+                async with provider_limiter.slot(llm_provider(input.agent_llm_name)):
+                    agent = await asyncio.to_thread(
+                        agent_pool.acquire, input.tool_llm_name, input.agent_llm_name, truncated_history
+                    )
+                    async for event, data in astream_agent(agent, input.input, truncated_history):
+                        if event == "final":
+                            await response_cache.aset(cache_key, data)
+                            output = data["output"]
+                        yield emit(event, data)
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}")
+            yield emit("error", {"detail": str(e)})
+        finally:
+            if slot is not None:
+                slot.release()
+
+        if session_id is not None and output is not None:
+            await session_store.record_turn(session_id, input.input, output, input.agent_llm_name)
+
+        total_time = time.perf_counter() - started
+        stream_stats.record(ttfb, time_to_first_token)
+        REQUEST_SECONDS.observe(total_time, endpoint="/query/stream", route=route)
+        done = {"ttfb": ttfb, "time_to_first_token": time_to_first_token, "total_time": total_time, "session_id": session_id}
+        if timings is not None:
+            done["timings"] = dict(timings, total=total_time)
+        yield format_sse("done", done)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Safety net in case the stream is never iterated
+        background=BackgroundTask(slot.release) if slot is not None else None,
+    )
@@ -0,0 +1,241 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STEP_BUCKETS = (1, 2, 3, 5, 8, 13, 21)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    """
+    Monotonic counter with labels, rendered in Prometheus text format.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """
+    Cumulative histogram with labels, rendered in Prometheus text format.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            # Per-bucket counts, then +Inf, sum and count
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 3))
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(series[-1])}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Collection of metrics exposed at /metrics.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        :return: Metrics text.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Shared registry and the application's metrics
+registry = MetricsRegistry()
+STAGE_SECONDS = registry.histogram(
+    "retail_stage_duration_seconds",
+    "Duration of request stages (agent_build, router, queue_wait, llm, tool, sql, chart).",
+    ("stage", "name"),
+)
+REQUEST_SECONDS = registry.histogram(
+    "retail_request_duration_seconds", "End-to-end duration of query requests.", ("endpoint", "route")
+)
+LLM_TOKENS = registry.counter("retail_llm_tokens_total", "LLM tokens used, per model.", ("model", "kind"))
+AGENT_STEPS = registry.histogram(
+    "retail_agent_steps", "Tool calls made by the agent per run.", (), buckets=STEP_BUCKETS
+)
+
+# Stage timings of the current request, when a breakdown was requested
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+def start_request_timings() -> Dict[str, float]:
+    """
+    Start collecting a per-stage timing breakdown for the current request.
+    The returned dictionary is filled in by observe_stage as stages complete,
+    including stages that run in worker threads.
+
+    :return: Dictionary of stage name -> total seconds.
+    """
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+def observe_stage(stage: str, seconds: float, name: str = ""):
+    """
+    Record the duration of a stage.
+
+    :param stage: Stage name, e.g. llm, tool, sql or chart.
+    :param seconds: Duration of the stage.
+    :param name: Model, tool or other detail label.
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage, name=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage: str, name: str = ""):
+    """
+    Time a block of code as a stage.
+
+    :param stage: Stage name.
+    :param name: Model, tool or other detail label.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started, name)
+
+def record_token_usage(report: Dict[str, Any]):
+    """
+    Add the per-step token counts of an agent run to the token counters.
+
+    :param report: Token report from TokenUsageTracker.report().
+    """
+    for step in report.get("steps", []):
+        LLM_TOKENS.inc(step["prompt_tokens"], model=step["model"], kind="prompt")
+        LLM_TOKENS.inc(step["completion_tokens"], model=step["model"], kind="completion")
+
+class AgentMetricsHandler(BaseCallbackHandler):
+    """
+    Callback handler timing every LLM call and tool call of an agent run.
+    """
+
+    def __init__(self):
+        self._started: Dict[Any, Tuple[str, str, float]] = {}
+        self._lock = threading.Lock()
+        self.steps = 0
+
+    def _start(self, run_id, stage: str, name: str):
+        with self._lock:
+            self._started[run_id] = (stage, name, time.perf_counter())
+
+    def _end(self, run_id):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is not None:
+            stage, name, start = started
+            observe_stage(stage, time.perf_counter() - start, name)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        self._start(run_id, "llm", params.get("model_name") or params.get("model") or "unknown")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        self._start(run_id, "llm", params.get("model_name") or params.get("model") or "unknown")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", (serialized or {}).get("name") or kwargs.get("name") or "unknown")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        with self._lock:
+            self.steps += 1
+
+    def finish(self):
+        """
+        Record the number of agent steps once the run is complete.
+        """
+        AGENT_STEPS.observe(self.steps)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+from config import PROMPT_CACHE_SIZE, PROMPT_CACHE_PATH
+from context_budget import context_budget
+from database.sql_db_langchain import get_data_version
+from sql_agent.agent_constants import CUSTOM_SUFFIX
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+def _model_name(llm_string: str) -> str:
+    match = re.search(r"'model(?:_name)?', '([^']+)'", llm_string)
+    return match.group(1) if match else "unknown"
+
+class PromptCache(BaseCache):
+    """
+    LLM call cache attached to the chat models.
+    LangChain looks up every call by its serialized messages and the model parameters
+    (model, temperature, function schemas); the key adds a namespace made of the prompt
+    suffix hash and the data version, so editing CUSTOM_SUFFIX or reloading retail_data
+    invalidates all entries. Entries are kept in a bounded LRU and, when `path` is set,
+    in a SQLite file shared by workers and restarts.
+    """
+
+    def __init__(self, max_entries: int = PROMPT_CACHE_SIZE, path: Optional[str] = PROMPT_CACHE_PATH):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._namespace = None
+        self._disk_initialized = False
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    def namespace(self) -> str:
+        """
+        Get the current cache namespace, clearing the in-memory entries when it changes.
+
+        :return: Namespace string combining the prompt suffix hash and the data version.
+        """
+        suffix_hash = hashlib.sha256(CUSTOM_SUFFIX.encode("utf-8")).hexdigest()[:12]
+        namespace = f"{suffix_hash}:{get_data_version()}"
+        with self._lock:
+            if namespace != self._namespace:
+                if self._namespace is not None:
+                    logger.info(f"Prompt cache namespace changed ({self._namespace} -> {namespace}), clearing entries")
+                self._entries.clear()
+                self._namespace = namespace
+        return namespace
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        payload = "\0".join([self.namespace(), llm_string, prompt])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        if not self._disk_initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS prompt_cache (key TEXT PRIMARY KEY, namespace TEXT NOT NULL, "
+                "value TEXT NOT NULL, tokens INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._disk_initialized = True
+        return conn
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value, tokens FROM prompt_cache WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {"generations": loads(row[0]), "tokens": row[1]}
+
+    def _write_disk(self, key: str, namespace: str, generations: RETURN_VAL_TYPE, tokens: int):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO prompt_cache VALUES (?, ?, ?, ?, ?)",
+                (key, namespace, dumps(generations), tokens, time.time()),
+            )
+            # Drop entries from old namespaces and keep the newest max_entries
+            conn.execute("DELETE FROM prompt_cache WHERE namespace != ?", (namespace,))
+            conn.execute(
+                "DELETE FROM prompt_cache WHERE key IN (SELECT key FROM prompt_cache "
+                "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        finally:
+            conn.close()
+
+    def _count_tokens(self, prompt: str, llm_string: str, generations: Sequence[Any]) -> int:
+        model_name = _model_name(llm_string)
+        tokens = 0
+        try:
+            for message in loads(prompt):
+                if isinstance(getattr(message, "content", None), str):
+                    tokens += context_budget.count_tokens(message.content, model_name)
+        except Exception:
+            tokens += context_budget.count_tokens(prompt, model_name)
+        for generation in generations:
+            tokens += context_budget.count_tokens(generation.text, model_name)
+            message = getattr(generation, "message", None)
+            function_call = message.additional_kwargs.get("function_call") if message is not None else None
+            if function_call:
+                tokens += context_budget.count_tokens(json.dumps(function_call), model_name)
+        return tokens
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.path:
+            try:
+                entry = self._read_disk(key)
+            except Exception as e:
+                logger.error(f"Error reading prompt cache: {str(e)}")
+            if entry is not None:
+                self._remember(key, entry)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.tokens_saved += entry["tokens"]
+        # Mark the generations so token accounting does not bill cached calls
+        return [
+            generation.copy(update={"generation_info": dict(generation.generation_info or {}, prompt_cache=True)})
+            for generation in entry["generations"]
+        ]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        namespace = self.namespace()
+        key = self._key(prompt, llm_string)
+        entry = {"generations": return_val, "tokens": self._count_tokens(prompt, llm_string, return_val)}
+        self._remember(key, entry)
+        if self.path:
+            try:
+                self._write_disk(key, namespace, return_val, entry["tokens"])
+            except Exception as e:
+                logger.error(f"Error writing prompt cache: {str(e)}")
+
+    def clear(self, **kwargs: Any):
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM prompt_cache")
+            finally:
+                conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get prompt cache statistics.
+
+        :return: Dictionary with size, hits, misses, hit rate and tokens saved.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "persistent": bool(self.path),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "tokens_saved": self.tokens_saved,
+            }
+
+# Shared prompt cache attached to the chat models
+prompt_cache = PromptCache()
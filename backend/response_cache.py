@@ -0,0 +1,344 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import config
+from constants import CACHE_TYPE, CACHE_DEFAULT_TIMEOUT, CACHE_THRESHOLD, CACHE_KEY_PREFIX
+from database.sql_db_langchain import get_data_version
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+class CacheBackend:
+    """
+    Minimal key/value interface implemented by all cache backends.
+    Values must be JSON-serializable.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, timeout: int = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+class NullCache(CacheBackend):
+    """
+    Backend that never stores anything, used to disable caching.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any, timeout: int = None):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+    def clear(self):
+        pass
+
+class SimpleCache(CacheBackend):
+    """
+    In-process cache with per-entry TTL and LRU eviction once `threshold` entries are stored.
+    Each uvicorn worker holds its own copy.
+    """
+
+    def __init__(self, threshold: int = CACHE_THRESHOLD, default_timeout: int = CACHE_DEFAULT_TIMEOUT):
+        self._threshold = threshold
+        self._default_timeout = default_timeout
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: int = None):
+        timeout = self._default_timeout if timeout is None else timeout
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._threshold:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class RedisCache(CacheBackend):
+    """
+    Shared cache stored in Redis so all uvicorn workers share hits.
+    Any client exposing the redis-py `get`, `set(ex=...)`, `delete` and `scan_iter`
+    methods (for example a local fakeredis instance) can be passed in place of a server.
+    Eviction is left to the server's maxmemory policy; entries expire by TTL.
+    """
+
+    def __init__(self, client=None, url: str = None, key_prefix: str = CACHE_KEY_PREFIX,
+                 default_timeout: int = CACHE_DEFAULT_TIMEOUT):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("The redis package is required for CACHE_TYPE=RedisCache") from e
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self._client = client
+        self._key_prefix = key_prefix
+        self._default_timeout = default_timeout
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(self._key_prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, timeout: int = None):
+        timeout = self._default_timeout if timeout is None else timeout
+        self._client.set(self._key_prefix + key, json.dumps(value), ex=timeout)
+
+    def delete(self, key: str):
+        self._client.delete(self._key_prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self._key_prefix + "*"):
+            self._client.delete(key)
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache stored in a SQLite file, so all uvicorn workers on a host share entries without a
+    Redis server. Expired entries are never returned; every `purge_every` writes they are
+    deleted, along with the entries closest to expiry beyond `threshold`.
+    """
+
+    def __init__(self, path: str, threshold: int = CACHE_THRESHOLD, default_timeout: int = CACHE_DEFAULT_TIMEOUT,
+                 purge_every: int = 100):
+        self.path = path
+        self._threshold = threshold
+        self._default_timeout = default_timeout
+        self._purge_every = purge_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers proceed while another worker writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, value: Any, timeout: int = None):
+        timeout = self._default_timeout if timeout is None else timeout
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, json.dumps(value), time.time() + timeout))
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self._purge_every == 0
+        if purge:
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self._threshold,),
+            )
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+def get_cache_backend(cache_type: str = None, threshold: int = CACHE_THRESHOLD,
+                      default_timeout: int = CACHE_DEFAULT_TIMEOUT, key_prefix: str = CACHE_KEY_PREFIX) -> CacheBackend:
+    """
+    Create the cache backend selected by configuration.
+
+    :param cache_type: SimpleCache, RedisCache or NullCache. Defaults to the configured type.
+    :param threshold: Entries kept by SimpleCache before LRU eviction.
+    :param default_timeout: TTL of entries in seconds.
+    :param key_prefix: Prefix of the keys stored by RedisCache.
+    :return: CacheBackend instance.
+    """
+    cache_type = cache_type or config.CACHE_TYPE or CACHE_TYPE
+    if cache_type == "SimpleCache":
+        return SimpleCache(threshold=threshold, default_timeout=default_timeout)
+    elif cache_type == "RedisCache":
+        return RedisCache(url=config.CACHE_REDIS_URL, key_prefix=key_prefix, default_timeout=default_timeout)
+    elif cache_type == "NullCache":
+        return NullCache()
+    else:
+        raise ValueError(f"Unsupported cache type: {cache_type}")
+
+# Function to normalize a question so trivially different phrasings share a cache entry
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question for use in cache keys.
+    Lowercases, collapses whitespace and strips surrounding punctuation.
+
+    :param question: The user question.
+    :return: Normalized question string.
+    """
+    return re.sub(r"\s+", " ", question).strip().strip("?!. ").lower()
+
+def history_fingerprint(chat_history: List[str]) -> str:
+    """
+    Compute a stable fingerprint of the (already truncated) chat history.
+
+    :param chat_history: List of chat history messages.
+    :return: Hex digest identifying the history.
+    """
+    digest = hashlib.sha256()
+    for message in chat_history:
+        digest.update(message.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class ResponseCache:
+    """
+    Answer cache placed in front of run_agent.
+    Keys combine the normalized question, the chat history fingerprint, the model pair
+    and the data version, so reloading retail_data invalidates every cached answer.
+    """
+
+    def __init__(self, backend: CacheBackend = None):
+        self._backend = backend if backend is not None else get_cache_backend()
+        self._data_version = get_data_version()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_data_version(self):
+        """
+        Drop all entries when the loaded data has changed since they were stored.
+        """
+        data_version = get_data_version()
+        if data_version != self._data_version:
+            logger.info(f"Data version changed ({self._data_version} -> {data_version}), clearing response cache")
+            self._backend.clear()
+            self._data_version = data_version
+
+    def make_key(self, question: str, chat_history: List[str], tool_llm_name: str, agent_llm_name: str) -> str:
+        """
+        Build the cache key for a query.
+
+        :param question: The user question.
+        :param chat_history: Truncated chat history sent with the question.
+        :param tool_llm_name: Name of the tool LLM.
+        :param agent_llm_name: Name of the agent LLM.
+        :return: Cache key string.
+        """
+        payload = json.dumps([
+            normalize_question(question),
+            history_fingerprint(chat_history),
+            tool_llm_name,
+            agent_llm_name,
+            get_data_version(),
+        ])
+        return "query:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached response.
+
+        :param key: Cache key from make_key.
+        :return: Cached response dictionary, or None on a miss.
+        """
+        self._check_data_version()
+        try:
+            value = self._backend.get(key)
+        except Exception as e:
+            logger.error(f"Error reading response cache: {str(e)}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """
+        Store a response.
+
+        :param key: Cache key from make_key.
+        :param value: JSON-serializable response dictionary.
+        """
+        try:
+            self._backend.set(key, value)
+        except Exception as e:
+            logger.error(f"Error writing response cache: {str(e)}")
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Async counterpart of get; the lookup (a network round trip with Redis, and a full
+        clear after a data version change) runs in a thread.
+
+        :param key: Cache key from make_key.
+        :return: Cached response dictionary, or None on a miss.
+        """
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Dict[str, Any]):
+        """
+        Async counterpart of set; the write runs in a thread.
+
+        :param key: Cache key from make_key.
+        :param value: JSON-serializable response dictionary.
+        """
+        await asyncio.to_thread(self.set, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        :return: Dictionary with backend name, hits, misses and hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self._backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+# Shared response cache used by the API
+response_cache = ResponseCache()
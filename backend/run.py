@@ -1,12 +1,38 @@
+import argparse
 import uvicorn
+from config import RUN_MODE, WORKERS, FEW_SHOT_RETRIEVER_ENABLED, TOOL_LLM_NAME, AGENT_LLM_NAME
+from database.ingest import ingest
+
+# Function to build the shared read-only state once, before the workers start
+def preload():
+    """
+    Build the state every worker reads from disk, so workers load it instead of each building it:
+    the database (and its Parquet copy for DuckDB), the persisted few-shot index and the
+    tokenizer files, which tiktoken downloads once into its disk cache.
+    """
+    # Load the data once before the workers start; workers skip it when unchanged
+    ingest()
+    if FEW_SHOT_RETRIEVER_ENABLED:
+        from tools.retriever import few_shot_index
+        few_shot_index.ensure_loaded()
+    from context_budget import load_encodings
+    load_encodings([TOOL_LLM_NAME, AGENT_LLM_NAME])
 
 # Entry point for running the FastAPI application
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Retail Insights Chatbot API.")
+    parser.add_argument("--mode", choices=["dev", "prod"], default=RUN_MODE,
+                        help="dev: one worker reloading on code changes; prod: WORKERS workers without reload")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Worker processes in prod mode")
+    args = parser.parse_args()
+
+    preload()
+
     # Run the application using Uvicorn server
     uvicorn.run(
         "main:app",  # Path to the ASGI application
         host="0.0.0.0",  # Host address to bind the server
         port=8000,  # Port number to listen on
-        workers=4,  # Number of worker processes for handling requests
-        reload=True  # Enable auto-reload for development (reload on code changes)
+        workers=args.workers if args.mode == "prod" else 1,  # Number of worker processes for handling requests
+        reload=args.mode == "dev",  # Enable auto-reload for development (reload on code changes)
     )
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from config import SESSION_TTL, SESSION_MAX_SESSIONS, SESSION_STORE_PATH, SESSION_RECENT_TURNS, SESSION_SUMMARY_TOKENS
+from constants import CACHE_TYPE, CACHE_KEY_PREFIX
+from context_budget import context_budget, TokenUsageTracker
+from response_cache import CacheBackend, SQLiteCache, get_cache_backend
+from sql_agent.agent import get_agent_llm
+from sql_agent.agent_constants import SESSION_SUMMARY_TEMPLATE
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# Tokens of each answer passed to the summarizer; answers often carry HTML tables and chart data
+SUMMARY_ANSWER_TOKENS = 400
+
+# Unsummarized turns kept per session, as a multiple of the recent turns, if summarization falls behind
+MAX_PENDING_FACTOR = 4
+
+class SessionStore:
+    """
+    Server-side conversation state, so clients send a session id instead of their full chat history.
+    A session holds a rolling summary of earlier turns and the latest turns verbatim, so the
+    history placed in the prompt stays the same size however long the conversation gets.
+    Turns beyond the `recent_turns` latest (every turn when it is 0) are folded into the
+    summary by an LLM call that runs after the response is returned. Sessions are stored where every worker can read
+    them, as consecutive turns of a conversation may reach different workers: in Redis
+    when CACHE_TYPE is RedisCache, otherwise in a SQLite file on the host. They expire after
+    `ttl` seconds without a new turn. Storage I/O and token counting run in threads, off
+    the event loop. Updates are serialized within a worker; concurrent turns of one
+    session on different workers are last-writer-wins.
+    """
+
+    def __init__(self, backend: CacheBackend = None, ttl: int = SESSION_TTL, recent_turns: int = SESSION_RECENT_TURNS,
+                 summary_tokens: int = SESSION_SUMMARY_TOKENS):
+        if backend is None:
+            if (config.CACHE_TYPE or CACHE_TYPE) == "RedisCache":
+                backend = get_cache_backend("RedisCache", default_timeout=ttl, key_prefix=CACHE_KEY_PREFIX + "session:")
+            else:
+                # An in-process cache would lose the conversation when the next turn reaches another worker
+                backend = SQLiteCache(SESSION_STORE_PATH, threshold=SESSION_MAX_SESSIONS, default_timeout=ttl)
+        self._backend = backend
+        self.ttl = ttl
+        self.recent_turns = max(recent_turns, 0)
+        self.summary_tokens = summary_tokens
+        self._lock = threading.Lock()
+        self._summarizing = set()
+        self._tasks = set()
+        self.created = 0
+        self.not_found = 0
+        self.turns_recorded = 0
+        self.turns_dropped = 0
+        self.summaries = 0
+        self.summary_failures = 0
+        self.summary_tokens_used = 0
+
+    def _load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._backend.get(session_id)
+        except Exception as e:
+            logger.error(f"Error reading session {session_id}: {str(e)}")
+            return None
+
+    def _save(self, session_id: str, session: Dict[str, Any]):
+        # Every write renews the TTL, so sessions expire after `ttl` seconds of inactivity
+        try:
+            self._backend.set(session_id, session, timeout=self.ttl)
+        except Exception as e:
+            logger.error(f"Error writing session {session_id}: {str(e)}")
+
+    def create(self) -> str:
+        """
+        Start a new session.
+
+        :return: Session id.
+        """
+        session_id = uuid.uuid4().hex
+        self._save(session_id, {"summary": "", "turns": [], "next_turn": 1})
+        with self._lock:
+            self.created += 1
+        return session_id
+
+    def delete(self, session_id: str) -> bool:
+        """
+        End a session.
+
+        :param session_id: Session id.
+        :return: Whether the session existed.
+        """
+        if self._load(session_id) is None:
+            return False
+        self._backend.delete(session_id)
+        return True
+
+    def history(self, session_id: str, model_name: str) -> Optional[List[str]]:
+        """
+        Build the chat history for the next turn of a session.
+        The summary comes first as a "summary: ..." message, followed by the turns not yet
+        summarized, truncated to what the history budget leaves after the summary.
+
+        :param session_id: Session id.
+        :param model_name: Name of the agent LLM.
+        :return: List of chat history messages, or None if the session does not exist or expired.
+        """
+        session = self._load(session_id)
+        if session is None:
+            with self._lock:
+                self.not_found += 1
+            return None
+
+        messages = []
+        for turn in session["turns"]:
+            messages += [f"user: {turn['user']}", f"bot: {turn['bot']}"]
+        budget = context_budget.history_tokens
+        if session["summary"]:
+            budget -= context_budget.count_tokens(session["summary"], model_name)
+        messages = context_budget.truncate_history(messages, model_name, max(budget, 0))
+        if session["summary"]:
+            messages.insert(0, f"summary: {session['summary']}")
+        return messages
+
+    def _append_turn(self, session_id: str, question: str, answer: Any) -> bool:
+        # Store a turn; returns whether the session's older turns should be summarized
+        with self._lock:
+            session = self._load(session_id) or {"summary": "", "turns": [], "next_turn": 1}
+            session["turns"].append({"n": session["next_turn"], "user": question, "bot": str(answer)})
+            session["next_turn"] += 1
+            overflow = len(session["turns"]) - max(self.recent_turns, 1) * MAX_PENDING_FACTOR
+            if overflow > 0:
+                logger.warning(f"Summarization of session {session_id} is behind, dropping {overflow} turns")
+                del session["turns"][:overflow]
+                self.turns_dropped += overflow
+            self._save(session_id, session)
+            self.turns_recorded += 1
+
+            if len(session["turns"]) <= self.recent_turns or session_id in self._summarizing:
+                return False
+            self._summarizing.add(session_id)
+            return True
+
+    async def record_turn(self, session_id: str, question: str, answer: Any, llm_name: str):
+        """
+        Append a question and its answer to a session, then schedule summarization of the
+        older turns if needed. The turn is stored before this returns, so the next question
+        of the session sees it on any worker.
+
+        :param session_id: Session id.
+        :param question: The user question.
+        :param answer: The answer returned to the user.
+        :param llm_name: Name of the LLM used to summarize.
+        """
+        if not await asyncio.to_thread(self._append_turn, session_id, question, answer):
+            return
+        task = asyncio.get_running_loop().create_task(self._summarize(session_id, llm_name))
+        # Keep a reference until the task finishes so it is not garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _apply_summary(self, session_id: str, last_folded: int, summary: str, tokens: int):
+        with self._lock:
+            # Turns recorded while the summary was generated are kept
+            current = self._load(session_id)
+            if current is not None:
+                current["turns"] = [turn for turn in current["turns"] if turn["n"] > last_folded]
+                current["summary"] = summary
+                self._save(session_id, current)
+            self.summaries += 1
+            self.summary_tokens_used += tokens
+
+    def _summary_prompt(self, session_id: str, llm_name: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        # The turns to fold and the summarization prompt, or no prompt when there is nothing to fold
+        session = self._load(session_id)
+        folded = session["turns"][:len(session["turns"]) - self.recent_turns] if session is not None else []
+        if not folded:
+            return folded, None
+        new_lines = "\n".join(
+            f"Human: {turn['user']}\nAI: {context_budget.truncate_text(turn['bot'], llm_name, SUMMARY_ANSWER_TOKENS)}"
+            for turn in folded
+        )
+        prompt = SESSION_SUMMARY_TEMPLATE.format(
+            summary=session["summary"] or "(none)",
+            new_lines=new_lines,
+            max_words=self.summary_tokens * 3 // 4,
+        )
+        return folded, prompt
+
+    async def _summarize(self, session_id: str, llm_name: str):
+        """
+        Fold the turns older than the recent ones into the session summary.
+
+        :param session_id: Session id.
+        :param llm_name: Name of the LLM used to summarize.
+        """
+        try:
+            folded, prompt = await asyncio.to_thread(self._summary_prompt, session_id, llm_name)
+            if prompt is None:
+                return
+            usage = TokenUsageTracker()
+            message = await get_agent_llm(llm_name).ainvoke(prompt, config={"callbacks": [usage]})
+            summary = await asyncio.to_thread(
+                context_budget.truncate_text, message.content.strip(), llm_name, self.summary_tokens
+            )
+
+            await asyncio.to_thread(self._apply_summary, session_id, folded[-1]["n"], summary, usage.total_tokens)
+            logger.info(f"Folded {len(folded)} turns into the summary of session {session_id}")
+        except Exception as e:
+            logger.error(f"Error summarizing session {session_id}: {str(e)}")
+            with self._lock:
+                self.summary_failures += 1
+        finally:
+            with self._lock:
+                self._summarizing.discard(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get session statistics.
+
+        :return: Dictionary with the backend name, session and turn counters and summarization counters.
+        """
+        with self._lock:
+            return {
+                "backend": type(self._backend).__name__,
+                "created": self.created,
+                "not_found": self.not_found,
+                "turns_recorded": self.turns_recorded,
+                "turns_dropped": self.turns_dropped,
+                "summaries": self.summaries,
+                "summary_failures": self.summary_failures,
+                "summary_tokens": self.summary_tokens_used,
+                "summaries_pending": len(self._summarizing),
+            }
+
+# Shared session store used by the API
+session_store = SessionStore()
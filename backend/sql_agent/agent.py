@@ -1,17 +1,30 @@
-from langchain_openai.chat_models import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
 from langchain.agents.agent_types import AgentType
-from langchain_community.agent_toolkits import create_sql_agent, SQLDatabaseToolkit
+from langchain_community.agent_toolkits import create_sql_agent
+from langchain_community.agent_toolkits.sql.prompt import SQL_PREFIX
 from langchain_community.callbacks.manager import get_openai_callback
+from langchain_core.messages import AIMessage, SystemMessage
+from langchain_core.prompts import (
+    ChatPromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder, SystemMessagePromptTemplate,
+)
 from typing import List, Any
 import logging
+import asyncio
+import ast
 import json
 import re
 from tools.functions_tools import create_chart_image
-#from tools.retriever import get_retriever_tool
-from utils import get_chat_openai, get_chat_gemini
+from tools.retriever import get_retriever_tool
+from utils import get_chat_openai, get_chat_gemini, get_chat_model
 from tools.functions_tools import sql_agent_tools
-from database.sql_db_langchain import db
+from tools.sql_tools import RetailSQLDatabaseToolkit
+from tools.result_tables import result_tables
+from database.sql_db_langchain import get_sql_database
+from database.result_store import parse_truncation, split_result_handle
+from database.entity_index import entity_index
+from config import FEW_SHOT_RETRIEVER_ENABLED, ENTITY_RESOLUTION_ENABLED, AGENT_VERBOSE
+from context_budget import context_budget, TokenUsageTracker, resolve_usage
+from metrics import AgentMetricsHandler, record_token_usage
 from .agent_constants import CUSTOM_SUFFIX
 
 # Set up the logger for this module
@@ -22,7 +35,7 @@ def get_sql_toolkit(tool_llm_name: str):
     Retrieve the SQL toolkit for the specified tool LLM name.
     
     :param tool_llm_name: Name of the tool LLM.
-    :return: Configured SQLDatabaseToolkit instance.
+    :return: Configured RetailSQLDatabaseToolkit instance (queries are checked locally, not by the tool LLM).
     """
     if tool_llm_name == "gpt-4o":
         llm_tool = get_chat_openai(model_name=tool_llm_name)
@@ -31,68 +44,135 @@ def get_sql_toolkit(tool_llm_name: str):
     else:
         raise ValueError(f"Unsupported tool LLM: {tool_llm_name}")
     
-    return SQLDatabaseToolkit(db=db, llm=llm_tool)
+    return RetailSQLDatabaseToolkit(db=get_sql_database(), llm=llm_tool)
+
+def get_schema_prefix() -> str:
+    """
+    Build the agent's system prompt: the standard SQL agent instructions followed by
+    a compact schema summary, so the agent can skip schema discovery round trips.
+    
+    :return: Prefix template with the dialect and top_k variables.
+    """
+    summary = get_sql_database().schema_catalog.compact_summary()
+    # The prefix is a prompt template, so literal braces must be escaped
+    summary = summary.replace("{", "{{").replace("}", "}}")
+    return (
+        f"{SQL_PREFIX}\n"
+        "The database schema is summarized below; use `sql_db_schema` only if you need sample rows.\n"
+        f"{summary}\n"
+    )
+
+def get_agent_prompt() -> ChatPromptTemplate:
+    """
+    Build the agent's chat prompt.
+    Same layout as create_sql_agent's OPENAI_FUNCTIONS prompt, with the conversation
+    history inserted as chat messages before the question (the default prompt has no
+    slot for it, so the memory would never reach the model).
+    
+    :return: Chat prompt with the input, history and agent_scratchpad variables.
+    """
+    return ChatPromptTemplate.from_messages([
+        SystemMessagePromptTemplate.from_template(get_schema_prefix()),
+        MessagesPlaceholder(variable_name="history", optional=True),
+        HumanMessagePromptTemplate.from_template("{input}"),
+        AIMessage(content=CUSTOM_SUFFIX),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ])
 
 def get_agent_llm(agent_llm_name: str):
     """
     Retrieve the agent LLM for the specified agent LLM name.
     
     :param agent_llm_name: Name of the agent LLM.
-    :return: Configured agent LLM instance.
+    :return: Configured agent LLM instance, failing over to the other provider when configured.
     """
-    if agent_llm_name == "gpt-4o":
-        return get_chat_openai(model_name=agent_llm_name)
-    elif agent_llm_name == "gemini-pro":
-        return get_chat_gemini(model_name=agent_llm_name)
+    if agent_llm_name in ("gpt-4o", "gemini-pro"):
+        return get_chat_model(agent_llm_name)
     else:
         raise ValueError(f"Unsupported agent LLM: {agent_llm_name}")
 
+def build_agent_memory(chat_history: List[str] = None) -> ConversationBufferMemory:
+    """
+    Create a fresh conversation memory, optionally seeded with prior chat history.
+    History entries are expected in the "user: ..." / "bot: ..." format sent by the frontend;
+    a "summary: ..." entry (from a server-side session) is added as a system message.
+    
+    :param chat_history: List of chat history messages.
+    :return: ConversationBufferMemory instance for a single request.
+    """
+    memory = ConversationBufferMemory(memory_key="history", input_key="input", return_messages=True)
+    for message in chat_history or []:
+        sender, _, text = message.partition(": ")
+        if sender == "summary":
+            memory.chat_memory.add_message(SystemMessage(content=f"Summary of the earlier conversation: {text}"))
+        elif sender == "bot":
+            memory.chat_memory.add_ai_message(text)
+        elif sender == "user":
+            memory.chat_memory.add_user_message(text)
+        else:
+            memory.chat_memory.add_user_message(message)
+    return memory
+
 def create_retail_agent(
     tool_llm_name: str = "gpt-4o",
     agent_llm_name: str = "gpt-4o",
-    db_session: Any = None
+    memory: ConversationBufferMemory = None
 ):
     """
-    Create a retail agent with specified tool and agent LLM names and a database session.
+    Create a retail agent with specified tool and agent LLM names.
     
     :param tool_llm_name: Name of the tool LLM.
     :param agent_llm_name: Name of the agent LLM.
-    :param db_session: Database session.
+    :param memory: Conversation memory to attach; a fresh one is created if omitted.
     :return: Configured retail agent instance.
     """
-    agent_tools = sql_agent_tools(db_session)  # Get the SQL agent tools
-    #retriever_tools = get_retriever_tool() # This too will be used later after manually testing all the pre-defined SQL query on the dataset.
+    agent_tools = sql_agent_tools()  # Get the SQL agent tools
+    if FEW_SHOT_RETRIEVER_ENABLED:
+        agent_tools = agent_tools + [get_retriever_tool()]  # Few-shot examples from the persisted index
     llm_agent = get_agent_llm(agent_llm_name)  # Get the agent LLM
     toolkit = get_sql_toolkit(tool_llm_name)  # Get the SQL toolkit
-    memory = ConversationBufferMemory(memory_key="history", input_key="input")  # Create conversation memory
+    if memory is None:
+        memory = build_agent_memory()  # Create conversation memory
 
     return create_sql_agent(
         llm=llm_agent,
         toolkit=toolkit,
         agent_type=AgentType.OPENAI_FUNCTIONS,
-        input_variables=["input", "agent_scratchpad", "history"],
-        suffix=CUSTOM_SUFFIX,
-        agent_executor_kwargs={"memory": memory, "handle_parsing_errors": True},
+        prompt=get_agent_prompt(),
+        agent_executor_kwargs={
+            "memory": memory,
+            "handle_parsing_errors": True,
+            "trim_intermediate_steps": context_budget.step_trimmer(agent_llm_name),
+        },
         extra_tools=agent_tools,
-        # extra_tools=agent_tools + [retriever_tools],
-        verbose=True,
+        # Invoke (not stream) the agent LLM so calls go through the prompt cache;
+        # tokens are still streamed to astream_events callbacks
+        stream_runnable=False,
+        verbose=AGENT_VERBOSE,
     )
 
-def run_agent(agent, input_text: str, chat_history: list):
+def prepare_input(input_text: str) -> str:
     """
-    Run the agent with the given input text and chat history.
-    Processes the response to detect and handle chart data.
+    Prepare the question sent to the agent.
+    Values of the dimension columns mentioned in the question are resolved up front,
+    so the first SQL query can filter on exact literals.
     
-    :param agent: The agent instance.
-    :param input_text: Input text for the agent.
-    :param chat_history: List of chat history messages.
-    :return: Tuple containing the output, total tokens used, and total cost.
+    :param input_text: The user question.
+    :return: The question, annotated with the resolved values when enabled.
     """
-    with get_openai_callback() as cb:
-        response = agent.invoke(input=input_text, chat_history=chat_history)
-    
-    output = response['output']
+    if not ENTITY_RESOLUTION_ENABLED:
+        return input_text
+    return entity_index.annotate(input_text)
+
+def process_chart_output(output):
+    """
+    Detect chart data in an agent response and replace it with the rendered chart.
     
+    :param output: The agent output.
+    :return: Tuple containing the processed output and the chart HTML (None if no chart was rendered).
+    """
+    chart_html = None
+
     # Check if the response contains chart data
     if isinstance(output, str) and "Chart data:" in output:
         logger.info("Chart data detected in response")
@@ -112,6 +192,7 @@ def run_agent(agent, input_text: str, chat_history: list):
                     # Provide a fallback message
                     chart_replacement = "Sorry, there was an error generating the chart. Here's the data instead:\n\n" + chart_data_str
                 else:
+                    chart_html = chart_image
                     chart_replacement = "Here's the generated chart:\n\n" + chart_image
                 
                 # Replace the chart data in the response
@@ -126,4 +207,143 @@ def run_agent(agent, input_text: str, chat_history: list):
     else:
         logger.info("No chart data detected in response")
 
-    return output, cb.total_tokens, cb.total_cost
+    return output, chart_html
+
+def run_agent(agent, input_text: str, chat_history: list):
+    """
+    Run the agent with the given input text and chat history.
+    Processes the response to detect and handle chart data, and renders the tables it cites.
+    
+    :param agent: The agent instance.
+    :param input_text: Input text for the agent.
+    :param chat_history: List of chat history messages.
+    :return: Tuple containing the output, total tokens used, total cost, and the per-step token report.
+    """
+    usage = TokenUsageTracker()
+    timing = AgentMetricsHandler()
+    with get_openai_callback() as cb:
+        response = agent.invoke(
+            {"input": prepare_input(input_text), "chat_history": chat_history}, config={"callbacks": [usage, timing]}
+        )
+    timing.finish()
+    record_token_usage(usage.report())
+    
+    output, _ = process_chart_output(response['output'])
+    output, _ = result_tables.expand(output)
+    tokens, cost = resolve_usage(cb, usage)
+
+    return output, tokens, cost, usage.report()
+
+async def arun_agent(agent, input_text: str, chat_history: list):
+    """
+    Async counterpart of run_agent.
+    LLM calls are awaited natively, so no thread is held during provider round trips.
+    
+    :param agent: The agent instance.
+    :param input_text: Input text for the agent.
+    :param chat_history: List of chat history messages.
+    :return: Tuple containing the output, total tokens used, total cost, and the per-step token report.
+    """
+    # Entity annotation may rebuild the index under its lock, keep it off the event loop
+    agent_input = await asyncio.to_thread(prepare_input, input_text)
+    usage = TokenUsageTracker()
+    timing = AgentMetricsHandler()
+    with get_openai_callback() as cb:
+        response = await agent.ainvoke(
+            {"input": agent_input, "chat_history": chat_history}, config={"callbacks": [usage, timing]}
+        )
+    timing.finish()
+    record_token_usage(usage.report())
+
+    # Chart rendering is CPU-bound, keep it off the event loop
+    output, _ = await asyncio.to_thread(process_chart_output, response['output'])
+    output, _ = await asyncio.to_thread(result_tables.expand, output)
+    tokens, cost = resolve_usage(cb, usage)
+
+    return output, tokens, cost, usage.report()
+
+def count_result_rows(result: Any):
+    """
+    Count the rows in a sql_db_query tool result.
+    
+    :param result: Tool output, normally the string form of a list of row tuples.
+    :return: Number of rows, or None if the output is not a row list (e.g. an error message).
+    """
+    truncation = parse_truncation(result)
+    if truncation is not None:
+        return truncation[0]
+    _, result = split_result_handle(result)
+    if isinstance(result, str):
+        if result == "":
+            return 0
+        try:
+            result = ast.literal_eval(result)
+        except (ValueError, SyntaxError):
+            return None
+    return len(result) if isinstance(result, (list, tuple)) else None
+
+async def astream_agent(agent, input_text: str, chat_history: list):
+    """
+    Run the agent and yield its intermediate events as they happen.
+    Events are (name, data) tuples: tool_start, sql, tool_end, token, chart, table and final.
+    Table events carry the cited query results as JSON; the final output has them as HTML.
+    
+    :param agent: The agent instance.
+    :param input_text: Input text for the agent.
+    :param chat_history: List of chat history messages.
+    :yield: Tuples of event name and JSON-serializable event data.
+    """
+    output = None
+    active_tools = 0
+    # Entity annotation may rebuild the index under its lock, keep it off the event loop
+    agent_input = await asyncio.to_thread(prepare_input, input_text)
+    usage = TokenUsageTracker()
+    timing = AgentMetricsHandler()
+    with get_openai_callback() as cb:
+        async for event in agent.astream_events(
+            {"input": agent_input, "chat_history": chat_history}, config={"callbacks": [usage, timing]}, version="v2"
+        ):
+            kind = event["event"]
+            name = event.get("name")
+            data = event.get("data", {})
+            if kind == "on_tool_start":
+                active_tools += 1
+                tool_input = data.get("input")
+                yield "tool_start", {"tool": name, "input": tool_input}
+                if name == "sql_db_query":
+                    query = tool_input.get("query") if isinstance(tool_input, dict) else tool_input
+                    yield "sql", {"query": query}
+            elif kind == "on_tool_end":
+                active_tools = max(active_tools - 1, 0)
+                tool_output = data.get("output")
+                event_data = {"tool": name}
+                if name == "sql_db_query":
+                    event_data["row_count"] = count_result_rows(tool_output)
+                    handle, _ = split_result_handle(tool_output)
+                    truncation = parse_truncation(tool_output)
+                    if truncation is not None:
+                        handle = truncation[1]
+                    if handle is not None:
+                        event_data["result_handle"] = handle
+                yield "tool_end", event_data
+            elif kind == "on_chat_model_stream" and active_tools == 0:
+                # Tokens from LLM calls made inside tools (e.g. the query checker) are not part of the answer
+                content = data["chunk"].content
+                if content:
+                    yield "token", {"text": content}
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                output = data.get("output", {}).get("output")
+
+    timing.finish()
+    record_token_usage(usage.report())
+
+    # Render the chart after the answer has been streamed
+    output, chart_html = await asyncio.to_thread(process_chart_output, output)
+    if chart_html is not None:
+        yield "chart", {"html": chart_html}
+    output, tables = await asyncio.to_thread(result_tables.expand, output)
+    for table in tables:
+        yield "table", table
+
+    tokens, cost = resolve_usage(cb, usage)
+    yield "final", {"output": output, "tokens_used": tokens, "cost": cost, "context": usage.report()}
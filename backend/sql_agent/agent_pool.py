@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+from metrics import observe_stage
+from database.sql_db_langchain import get_data_version
+from .agent import create_retail_agent, build_agent_memory
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+class AgentPool:
+    """
+    Registry of prebuilt SQL agent executors keyed by (tool_llm_name, agent_llm_name).
+
+    Building an executor (toolkit, tools, prompt and create_sql_agent) is done once per
+    model pair. Each request receives a shallow copy of the shared executor with its own
+    conversation memory, so concurrent requests never share memory state. The prompt embeds
+    a schema summary, so executors are rebuilt when the data version changes.
+    """
+
+    def __init__(self, builder=create_retail_agent):
+        self._builder = builder
+        self._executors: Dict[Tuple[str, str], Any] = {}
+        self._build_seconds: Dict[Tuple[str, str], float] = {}
+        self._data_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds_total = 0.0
+        self.build_seconds_saved = 0.0
+
+    def _build(self, key: Tuple[str, str]):
+        """
+        Build and register the executor for the given model pair.
+        Must be called with the pool lock held.
+
+        :param key: Tuple of (tool_llm_name, agent_llm_name).
+        :return: The newly built agent executor.
+        """
+        start = time.perf_counter()
+        executor = self._builder(key[0], key[1])
+        elapsed = time.perf_counter() - start
+        self._executors[key] = executor
+        self._build_seconds[key] = elapsed
+        self.build_seconds_total += elapsed
+        observe_stage("agent_build", elapsed, f"{key[0]}/{key[1]}")
+        logger.info(f"Built agent executor for {key} in {elapsed:.3f}s")
+        return executor
+
+    def _check_data_version(self):
+        """
+        Drop all executors when the loaded data has changed since they were built.
+        Must be called with the pool lock held.
+        """
+        data_version = get_data_version()
+        if data_version != self._data_version:
+            if self._executors:
+                logger.info(f"Data version changed ({self._data_version} -> {data_version}), rebuilding agent executors")
+            self._executors.clear()
+            self._build_seconds.clear()
+            self._data_version = data_version
+
+    def warm(self, model_pairs: Iterable[Tuple[str, str]]):
+        """
+        Prebuild executors for the given model pairs, typically at application startup.
+        Warm-up builds are not counted as pool misses.
+
+        :param model_pairs: Iterable of (tool_llm_name, agent_llm_name) tuples.
+        """
+        for key in model_pairs:
+            with self._lock:
+                self._check_data_version()
+                if key in self._executors:
+                    continue
+                try:
+                    self._build(key)
+                except Exception as e:
+                    logger.warning(f"Could not warm agent executor for {key}: {str(e)}")
+
+    def get(self, tool_llm_name: str, agent_llm_name: str):
+        """
+        Get the shared executor for a model pair, building it on first use.
+
+        :param tool_llm_name: Name of the tool LLM.
+        :param agent_llm_name: Name of the agent LLM.
+        :return: Shared agent executor (without per-request memory).
+        """
+        key = (tool_llm_name, agent_llm_name)
+        with self._lock:
+            self._check_data_version()
+            executor = self._executors.get(key)
+            if executor is not None:
+                self.hits += 1
+                self.build_seconds_saved += self._build_seconds[key]
+                return executor
+            self.misses += 1
+            return self._build(key)
+
+    def acquire(self, tool_llm_name: str, agent_llm_name: str, chat_history: List[str] = None):
+        """
+        Get a request-scoped executor for a model pair.
+        The returned executor shares the agent, tools and LLMs with the pool but owns
+        a fresh memory seeded with the given chat history.
+
+        :param tool_llm_name: Name of the tool LLM.
+        :param agent_llm_name: Name of the agent LLM.
+        :param chat_history: List of chat history messages.
+        :return: Agent executor safe to use for a single request.
+        """
+        executor = self.get(tool_llm_name, agent_llm_name)
+        # Shallow copy that keeps excluded fields (e.g. callbacks) which `.copy()` would drop
+        fields = dict(executor.__dict__, memory=build_agent_memory(chat_history))
+        return executor.__class__.construct(_fields_set=executor.__fields_set__, **fields)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get pool statistics.
+
+        :return: Dictionary with pool size, hits, misses, hit rate and build times.
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._executors),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "build_seconds_total": round(self.build_seconds_total, 6),
+                "build_seconds_saved": round(self.build_seconds_saved, 6),
+            }
+
+# Shared pool instance used by the API
+agent_pool = AgentPool()
@@ -0,0 +1,264 @@
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from database.sql_db_langchain import get_engine
+from database.entity_index import entity_index
+from metrics import observe_stage
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+def _format_number(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+def _list_answer(intro: str) -> Callable:
+    def answer(rows: List[tuple], entities: Dict[str, str]) -> str:
+        items = [str(row[0]) for row in rows if row[0] is not None]
+        if not items:
+            return intro.format(**entities) + " none were found."
+        return intro.format(**entities) + "\n" + "\n".join(f"- {item}" for item in items)
+    return answer
+
+def _value_answer(template: str) -> Callable:
+    def answer(rows: List[tuple], entities: Dict[str, str]) -> str:
+        value = rows[0][0] if rows else None
+        if value is None:
+            return "No matching data was found for this question."
+        return template.format(value=_format_number(value), **entities)
+    return answer
+
+def _top_answer(template: str) -> Callable:
+    def answer(rows: List[tuple], entities: Dict[str, str]) -> str:
+        if not rows:
+            return "No matching data was found for this question."
+        label, value = rows[0]
+        return template.format(label=label, value=_format_number(value), **entities)
+    return answer
+
+@dataclass
+class IntentTemplate:
+    """
+    A parameterized question pattern answered by a single SQL statement.
+    Named groups in the patterns are retail_data column names; their captured text
+    is resolved against the distinct values of that column and bound as SQL parameters.
+    """
+    name: str
+    patterns: List[str]
+    sql: str
+    answer: Callable[[List[tuple], Dict[str, str]], str]
+
+# Patterns are matched against the normalized question (lowercase, no quotes or trailing punctuation)
+INTENT_TEMPLATES = [
+    IntentTemplate(
+        name="brands_in_city",
+        patterns=[r"(?:list|show|what are)(?: all)?(?: the)? brands(?: available| sold)? in (?P<City>.+)"],
+        sql="SELECT DISTINCT Brand FROM retail_data WHERE City = :City ORDER BY Brand",
+        answer=_list_answer("Brands available in {City}:"),
+    ),
+    IntentTemplate(
+        name="sales_value_for_brand",
+        patterns=[
+            r"what is the total sales value (?:for|of) (?:the )?brand (?P<Brand>.+)",
+            r"what is the total sales value (?:for|of) (?:the )?(?P<Brand>.+?) brand",
+        ],
+        sql="SELECT SUM(Sales_Value) FROM retail_data WHERE Brand = :Brand",
+        answer=_value_answer("The total sales value for the brand {Brand} is {value}."),
+    ),
+    IntentTemplate(
+        name="sales_value_for_channel",
+        patterns=[r"what is the total sales value (?:for|of|in) (?:the )?(?P<Channel>.+?) channels?"],
+        sql="SELECT SUM(Sales_Value) FROM retail_data WHERE Channel = :Channel",
+        answer=_value_answer("The total sales value for the {Channel} channel is {value}."),
+    ),
+    IntentTemplate(
+        name="average_price_for_manufacturer",
+        patterns=[r"what is the average unit price of (?:all )?(?:items|products) (?:in|from|by|of) (?:the )?(?P<Manufacturer>.+?)(?: manufacturer)?"],
+        sql="SELECT AVG(Unit_Price) FROM retail_data WHERE Manufacturer = :Manufacturer",
+        answer=_value_answer("The average unit price of items from {Manufacturer} is {value}."),
+    ),
+    IntentTemplate(
+        name="brands_by_manufacturer",
+        patterns=[r"how many brands are (?:produced|made|sold) by (?:the )?(?P<Manufacturer>.+?)(?: manufacturer)?"],
+        sql="SELECT COUNT(DISTINCT Brand) FROM retail_data WHERE Manufacturer = :Manufacturer",
+        answer=_value_answer("{Manufacturer} produces {value} brands."),
+    ),
+    IntentTemplate(
+        name="unique_items_in_category",
+        patterns=[r"how many unique items are sold in the (?P<Category>.+?) category"],
+        sql="SELECT COUNT(DISTINCT `Item Name`) FROM retail_data WHERE Category = :Category",
+        answer=_value_answer("There are {value} unique items sold in the {Category} category."),
+    ),
+    IntentTemplate(
+        name="sales_volume_for_pack_size",
+        patterns=[r"what is the total sales volume for (?:all )?(?:items )?(?:in|with) (?:a |the )?(?P<Pack_Size>\S+) pack size"],
+        sql="SELECT SUM(`Sales_Volume(KG_LTRS)`) FROM retail_data WHERE Pack_Size = :Pack_Size",
+        answer=_value_answer("The total sales volume for items in the {Pack_Size} pack size is {value} KG/LTRS."),
+    ),
+    IntentTemplate(
+        name="list_manufacturers",
+        patterns=[r"list all(?: the)? manufacturers(?: in alphabetical order)?"],
+        sql="SELECT DISTINCT Manufacturer FROM retail_data ORDER BY Manufacturer",
+        answer=_list_answer("Manufacturers in alphabetical order:"),
+    ),
+    IntentTemplate(
+        name="packaging_type_count",
+        patterns=[r"how many (?:different |distinct )?packaging types are (?:used|there)"],
+        sql="SELECT COUNT(DISTINCT Packaging) FROM retail_data",
+        answer=_value_answer("There are {value} different packaging types."),
+    ),
+    IntentTemplate(
+        name="top_city_by_volume",
+        patterns=[r"which city has the highest (?:total )?sales volume"],
+        sql="SELECT City, SUM(`Sales_Volume(KG_LTRS)`) AS total_volume FROM retail_data GROUP BY City ORDER BY total_volume DESC LIMIT 1",
+        answer=_top_answer("{label} has the highest total sales volume, with {value} KG/LTRS."),
+    ),
+    IntentTemplate(
+        name="top_manufacturer_by_value",
+        patterns=[r"(?:who|which) is the manufacturer with the highest (?:total )?sales value"],
+        sql="SELECT Manufacturer, SUM(Sales_Value) AS total_sales FROM retail_data GROUP BY Manufacturer ORDER BY total_sales DESC LIMIT 1",
+        answer=_top_answer("{label} is the manufacturer with the highest sales value, at {value}."),
+    ),
+]
+
+def normalize_text(value: str) -> str:
+    """
+    Normalize text for matching: lowercase, no quotes, single spaces, no trailing punctuation.
+
+    :param value: Text to normalize.
+    :return: Normalized text.
+    """
+    value = re.sub(r"[\"'`]", "", value.lower())
+    return re.sub(r"\s+", " ", value).strip().rstrip("?.!").strip()
+
+class IntentRouter:
+    """
+    Answers template questions directly with SQL, bypassing the LLM agent.
+    Entities are resolved through the entity index against the distinct values actually
+    present in retail_data, so a question only routes when every captured entity matches
+    a real value (allowing for case, plurals and small misspellings).
+    """
+
+    def __init__(self, templates: List[IntentTemplate] = None):
+        self._templates = [
+            (template, [re.compile(pattern) for pattern in template.patterns])
+            for template in (templates if templates is not None else INTENT_TEMPLATES)
+        ]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved_total = 0.0
+        self._agent_latency_avg = None
+
+    def resolve_entity(self, column: str, mention: str) -> Optional[str]:
+        """
+        Resolve a mentioned value to the value stored in retail_data.
+
+        :param column: retail_data column name.
+        :param mention: Text captured from the question.
+        :return: Stored value, or None if there is no match.
+        """
+        return entity_index.resolve(column, mention)
+
+    def match(self, question: str) -> Optional[Tuple[IntentTemplate, Dict[str, str]]]:
+        """
+        Match a question against the templates and resolve its entities.
+
+        :param question: The user question.
+        :return: Tuple of the matched template and resolved entities, or None.
+        """
+        normalized = normalize_text(question)
+        for template, patterns in self._templates:
+            for pattern in patterns:
+                found = pattern.fullmatch(normalized)
+                if found is None:
+                    continue
+                entities = {}
+                for column, mention in found.groupdict().items():
+                    value = self.resolve_entity(column, mention)
+                    if value is None:
+                        break
+                    entities[column] = value
+                else:
+                    return template, entities
+        return None
+
+    def route(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Answer a question directly if it matches a template.
+
+        :param question: The user question.
+        :return: Dictionary with the output and routing details, or None to fall back to the agent.
+        """
+        started = time.perf_counter()
+        try:
+            matched = self.match(question)
+            if matched is not None:
+                template, entities = matched
+                with get_engine().connect() as conn:
+                    rows = [tuple(row) for row in conn.execute(text(template.sql), entities)]
+                output = template.answer(rows, entities)
+        except Exception as e:
+            logger.error(f"Error in intent router: {str(e)}")
+            matched = None
+
+        latency = time.perf_counter() - started
+        observe_stage("router", latency)
+        with self._lock:
+            if matched is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            latency_saved = max((self._agent_latency_avg or 0.0) - latency, 0.0)
+            self.latency_saved_total += latency_saved
+            hit_rate = self.hits / (self.hits + self.misses)
+
+        logger.info(f"Question answered by intent template {template.name}")
+        return {
+            "output": output,
+            "template": template.name,
+            "entities": entities,
+            "latency": latency,
+            "latency_saved": latency_saved,
+            "hit_rate": hit_rate,
+        }
+
+    def record_agent_latency(self, seconds: float):
+        """
+        Record the latency of an agent run, used to estimate the latency saved by routing.
+
+        :param seconds: Duration of the agent run.
+        """
+        with self._lock:
+            if self._agent_latency_avg is None:
+                self._agent_latency_avg = seconds
+            else:
+                self._agent_latency_avg = 0.9 * self._agent_latency_avg + 0.1 * seconds
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get router statistics.
+
+        :return: Dictionary with hits, misses, hit rate and latency saved.
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "latency_saved_total": self.latency_saved_total,
+                "agent_latency_avg": self._agent_latency_avg or 0.0,
+            }
+
+# Shared router used by the API
+intent_router = IntentRouter()
@@ -0,0 +1,61 @@
+import json
+import threading
+from typing import Any, Dict
+
+# Function to format a Server-Sent Events message
+def format_sse(event: str, data: Any) -> str:
+    """
+    Format an event as a Server-Sent Events message.
+
+    :param event: Event name.
+    :param data: JSON-serializable event payload.
+    :return: SSE-formatted string.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+class StreamStats:
+    """
+    Aggregates time-to-first-byte and time-to-first-token for streamed queries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.ttfb_total = 0.0
+        self.ttfb_max = 0.0
+        self.first_token_count = 0
+        self.first_token_total = 0.0
+
+    def record(self, ttfb: float, time_to_first_token: float = None):
+        """
+        Record the timings of one completed stream.
+
+        :param ttfb: Seconds from request receipt to the first event sent.
+        :param time_to_first_token: Seconds from request receipt to the first answer token, if any.
+        """
+        with self._lock:
+            self.streams += 1
+            self.ttfb_total += ttfb
+            self.ttfb_max = max(self.ttfb_max, ttfb)
+            if time_to_first_token is not None:
+                self.first_token_count += 1
+                self.first_token_total += time_to_first_token
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get streaming statistics.
+
+        :return: Dictionary with stream count and average/max latencies in seconds.
+        """
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "ttfb_avg": self.ttfb_total / self.streams if self.streams else 0.0,
+                "ttfb_max": self.ttfb_max,
+                "time_to_first_token_avg": (
+                    self.first_token_total / self.first_token_count if self.first_token_count else 0.0
+                ),
+            }
+
+# Shared streaming statistics used by the API
+stream_stats = StreamStats()
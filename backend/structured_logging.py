@@ -0,0 +1,95 @@
+import json
+import logging
+import random
+from logging.handlers import QueueHandler
+from typing import Any, Dict, Iterable
+
+from config import LOG_PAYLOAD_MAX_CHARS, LOG_PAYLOAD_SAMPLE_RATE
+
+# Attributes every LogRecord has; any other attribute was passed with `extra` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line: time, level, logger and message, followed by
+    the fields passed with `extra` (e.g. `logger.info("...", extra={"route": "cache"})`).
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES}
+
+class TextFormatter(logging.Formatter):
+    """
+    Human-readable format for the console: the usual line followed by the `extra` fields as key=value.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if not fields:
+            return line
+        return line + " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+
+class LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler for a QueueListener in the same process. Records are enqueued as they are,
+    so the message, extra fields and traceback are formatted by the listener's handlers,
+    off the request path, and tracebacks reach the JSON formatter intact.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def truncate(value: Any, max_chars: int = LOG_PAYLOAD_MAX_CHARS) -> str:
+    """
+    Cap a value logged as text.
+
+    :param value: Value to log.
+    :param max_chars: Characters kept.
+    :return: The text, cut at max_chars with the number of characters left out.
+    """
+    text = str(value)
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text) - max_chars} more chars]"
+
+def query_fields(question: str, history: Iterable[Any]) -> Dict[str, Any]:
+    """
+    Describe a query for a log record without its full payload.
+
+    :param question: The retail insights query.
+    :param history: Chat history the query is answered with.
+    :return: Dictionary with the capped question and the size of the history.
+    """
+    history = list(history)
+    return {
+        "question": truncate(question),
+        "history_turns": len(history),
+        "history_chars": sum(len(str(entry)) for entry in history),
+    }
+
+def log_sampled_payload(logger: logging.Logger, message: str, payload: Iterable[Any],
+                        sample_rate: float = LOG_PAYLOAD_SAMPLE_RATE):
+    """
+    Log a large payload (e.g. a chat history) at DEBUG for a sample of calls, each entry capped.
+    Nothing is formatted when DEBUG is disabled or the call is not sampled.
+
+    :param logger: Logger to write to.
+    :param message: Log message.
+    :param payload: Entries to log.
+    :param sample_rate: Fraction of calls logged.
+    """
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < sample_rate:
+        logger.debug(message, extra={"payload": [truncate(entry) for entry in payload]})
@@ -0,0 +1,224 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from metrics import timed
+from config import CHART_FORMAT, CHART_DPI, CHART_DELIVERY, CHART_STORE_DIR, CHART_RENDER_PROCESSES, PUBLIC_BASE_URL
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# Output formats supported by the renderer: file extension -> MIME type
+CHART_MIME_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "webp": "image/webp",
+}
+
+def render_chart(chart_data: Dict[str, Any], fmt: str = "png", dpi: int = 100) -> bytes:
+    """
+    Render a chart to image bytes using the object-oriented Figure API.
+    Uses no global pyplot state, so it is safe to call from threads and worker processes.
+
+    :param chart_data: Dictionary with 'columns', 'data' and 'chart_type'.
+    :param fmt: Output format (png, svg or webp).
+    :param dpi: Resolution for raster formats.
+    :return: Encoded image bytes.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    columns = chart_data['columns']
+    data = chart_data['data']
+    chart_type = chart_data['chart_type']
+    labels = [row[0] for row in data]
+    values = [row[1] for row in data]
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    if chart_type == "bar":
+        ax.bar([str(label) for label in labels], values)
+    elif chart_type == "line":
+        ax.plot(labels, values)
+    elif chart_type == "pie":
+        ax.pie(values, labels=labels, autopct='%1.1f%%')
+    elif chart_type == "scatter":
+        ax.scatter(labels, values)
+    else:
+        raise ValueError(f"Unsupported chart type: {chart_type}")
+
+    ax.set_title(f"{chart_type.capitalize()} Chart")
+    if chart_type != "pie":
+        ax.set_xlabel(columns[0])
+        ax.set_ylabel(columns[1])
+        if len(labels) > 6:
+            ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        from PIL import Image
+        png_buffer = io.BytesIO()
+        fig.savefig(png_buffer, format="png", dpi=dpi)
+        png_buffer.seek(0)
+        Image.open(png_buffer).save(buffer, format="WEBP", quality=85)
+    else:
+        fig.savefig(buffer, format=fmt, dpi=dpi)
+    return buffer.getvalue()
+
+class ChartRenderer:
+    """
+    Renders charts with a content-hash cache.
+    Identical chart payloads (same data, type, format and DPI) are rendered once.
+    Charts are kept in a bounded in-memory LRU and written to `store_dir` so any worker
+    can serve them from /charts/{chart_id}. Rendering runs in a process pool when
+    `processes` > 0, otherwise in the calling thread.
+    """
+
+    def __init__(self, fmt: str = CHART_FORMAT, dpi: int = CHART_DPI, delivery: str = CHART_DELIVERY,
+                 store_dir: str = CHART_STORE_DIR, processes: int = CHART_RENDER_PROCESSES,
+                 base_url: str = PUBLIC_BASE_URL, max_cached: int = 128):
+        if fmt not in CHART_MIME_TYPES:
+            raise ValueError(f"Unsupported chart format: {fmt}")
+        if delivery not in ("inline", "url"):
+            raise ValueError(f"Unsupported chart delivery: {delivery}")
+        self.fmt = fmt
+        self.dpi = dpi
+        self.delivery = delivery
+        self.store_dir = store_dir
+        self.processes = processes
+        self.base_url = (base_url or "").rstrip("/")
+        self._max_cached = max_cached
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.renders = 0
+        self.cache_hits = 0
+
+    def chart_id(self, chart_data: Dict[str, Any]) -> str:
+        """
+        Compute the content hash identifying a rendered chart.
+
+        :param chart_data: Chart payload.
+        :return: Hex chart id.
+        """
+        payload = json.dumps(chart_data, sort_keys=True, default=str) + f"|{self.fmt}|{self.dpi}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.processes <= 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _path(self, chart_id: str) -> str:
+        return os.path.join(self.store_dir, f"{chart_id}.{self.fmt}")
+
+    def _remember(self, chart_id: str, image: bytes):
+        with self._lock:
+            self._cache[chart_id] = image
+            self._cache.move_to_end(chart_id)
+            while len(self._cache) > self._max_cached:
+                self._cache.popitem(last=False)
+        if self.delivery == "url":
+            os.makedirs(self.store_dir, exist_ok=True)
+            tmp_path = self._path(chart_id) + f".{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image)
+            os.replace(tmp_path, self._path(chart_id))
+
+    def _lookup(self, chart_id: str) -> Optional[bytes]:
+        with self._lock:
+            image = self._cache.get(chart_id)
+            if image is not None:
+                self._cache.move_to_end(chart_id)
+                self.cache_hits += 1
+                return image
+        return None
+
+    def _to_html(self, chart_id: str, image: bytes, chart_type: str) -> str:
+        alt = f"{chart_type.capitalize()} Chart"
+        if self.delivery == "url":
+            src = f"{self.base_url}/charts/{chart_id}"
+        else:
+            src = f"data:{CHART_MIME_TYPES[self.fmt]};base64,{base64.b64encode(image).decode()}"
+        return f"<img src='{src}' alt='{alt}' />"
+
+    def render(self, chart_data: Dict[str, Any]) -> str:
+        """
+        Render a chart (or reuse a cached rendering) and return an HTML img tag.
+
+        :param chart_data: Chart payload.
+        :return: HTML img tag with an inline data URI or a /charts URL.
+        """
+        chart_id = self.chart_id(chart_data)
+        image = self._lookup(chart_id)
+        if image is None:
+            executor = self._get_executor()
+            with timed("chart", self.fmt):
+                if executor is not None:
+                    image = executor.submit(render_chart, chart_data, self.fmt, self.dpi).result()
+                else:
+                    image = render_chart(chart_data, self.fmt, self.dpi)
+            self.renders += 1
+            self._remember(chart_id, image)
+        return self._to_html(chart_id, image, chart_data['chart_type'])
+
+    def get(self, chart_id: str) -> Optional[Tuple[bytes, str]]:
+        """
+        Fetch a rendered chart by id, from memory or the shared store.
+
+        :param chart_id: Chart id from a /charts URL.
+        :return: Tuple of image bytes and MIME type, or None if unknown.
+        """
+        if not chart_id.isalnum():
+            return None
+        image = self._lookup(chart_id)
+        if image is None:
+            try:
+                with open(self._path(chart_id), "rb") as f:
+                    image = f.read()
+            except FileNotFoundError:
+                return None
+        return image, CHART_MIME_TYPES[self.fmt]
+
+    def shutdown(self):
+        """
+        Stop the render process pool, if one was started.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get renderer statistics.
+
+        :return: Dictionary with output settings, renders and cache hits.
+        """
+        with self._lock:
+            return {
+                "format": self.fmt,
+                "dpi": self.dpi,
+                "delivery": self.delivery,
+                "renders": self.renders,
+                "cache_hits": self.cache_hits,
+                "cached": len(self._cache),
+            }
+
+# Shared renderer used by the agent and the /charts endpoint
+chart_renderer = ChartRenderer()
@@ -1,21 +1,14 @@
 import json
 from datetime import datetime
 from langchain.tools import Tool
-from sqlalchemy.orm import Session
 from sqlalchemy import text
 import logging
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # Use a non-interactive backend
-import matplotlib.pyplot as plt
-import io
-import base64
 from typing import List, Any, Dict
 from pydantic import BaseModel
-from functools import lru_cache
 from langchain.tools import StructuredTool
 from pydantic import BaseModel, Field
-from typing import List, Union
+from typing import List, Optional, Union
+from tools.chart_renderer import chart_renderer
 
 # Set up the logger for this module
 logger = logging.getLogger(__name__)
@@ -36,17 +29,44 @@ class ChartInput(BaseModel):
     data: List[List[Any]]
     chart_type: str
 
+# Define the input model for entity value lookup
+class EntityLookupInput(BaseModel):
+    mention: str = Field(description="Name or value as written by the user, e.g. 'abidjan' or 'capra pasta'")
+    column: Optional[str] = Field(default=None, description="Restrict the lookup to this column, e.g. 'Brand'")
+
 
-@lru_cache(maxsize=1)
 def get_columns_descriptions() -> str:
     """
-    Get the descriptions of the columns in the table.
-    Results are cached to avoid repeated executions.
+    Get the descriptions of the columns in the table, with their type, range,
+    null count and cardinality from the schema catalog.
     
     :return: JSON string of column descriptions.
     """
     from tools.tools_constants import COLUMNS_DESCRIPTIONS
-    return json.dumps(COLUMNS_DESCRIPTIONS, ensure_ascii=False)
+    from database.sql_db_langchain import get_sql_database
+    catalog = get_sql_database().schema_catalog.tables().get("retail_data", {})
+    columns = catalog.get("columns", {})
+    descriptions = {
+        column: {"description": description, **columns.get(column, {})}
+        for column, description in COLUMNS_DESCRIPTIONS.items()
+    }
+    return json.dumps(descriptions, ensure_ascii=False, default=str)
+
+
+def find_entity_values(mention: str, column: Optional[str] = None) -> str:
+    """
+    Find the values stored in retail_data that match a user mention,
+    tolerating case, punctuation, plurals and misspellings.
+    
+    :param mention: Name or value as written by the user.
+    :param column: Optional column to restrict the lookup to.
+    :return: JSON string of matches with column, value and similarity score.
+    """
+    from database.entity_index import entity_index
+    matches = entity_index.lookup(mention, column=column)
+    if not matches:
+        return f"No value similar to '{mention}' was found."
+    return json.dumps(matches, ensure_ascii=False)
 
 
 # Generate chart data from input
@@ -94,22 +114,54 @@ def generate_chart(input_data: Union[str, dict, ChartInput] = None, **kwargs):
         logger.error(f"Error in generate_chart: {str(e)}", exc_info=True)
         return f"Error preparing chart data: {str(e)}"
 
+async def aget_columns_descriptions(_: str = "") -> str:
+    """
+    Async wrapper for get_columns_descriptions so the agent does not hop to a thread.
+    
+    :return: JSON string of column descriptions.
+    """
+    return get_columns_descriptions()
+
+async def afind_entity_values(mention: str, column: Optional[str] = None) -> str:
+    """
+    Async wrapper for find_entity_values; lookups are served from memory.
+    
+    :return: JSON string of matches with column, value and similarity score.
+    """
+    return find_entity_values(mention, column)
+
+async def agenerate_chart(input_data: Union[str, dict, ChartInput] = None, **kwargs):
+    """
+    Async wrapper for generate_chart so the agent does not hop to a thread.
+    
+    :return: Dictionary with processed data for chart generation.
+    """
+    return generate_chart(input_data, **kwargs)
+
 # Define the SQL agent tools
-def sql_agent_tools(db: Session):
+def sql_agent_tools():
     """
     Define and configure the tools for the SQL agent.
     
-    :param db: SQLAlchemy session object.
     :return: List of configured tools.
     """
     tools = [
         Tool.from_function(
             func=lambda _: get_columns_descriptions(),
+            coroutine=aget_columns_descriptions,
             name="get_columns_descriptions",
             description="Useful for getting the descriptions of columns in the table.",
         ),
+        StructuredTool.from_function(
+            func=find_entity_values,
+            coroutine=afind_entity_values,
+            name="find_entity_values",
+            description="Finds the exact values stored in retail_data (City, Channel, Category, Segment, Manufacturer, Brand, Item Name, Pack_Size, Packaging) for a name mentioned by the user. Use it before filtering on a value that returned no rows. Returns: JSON list of column, value and score.",
+            args_schema=EntityLookupInput
+        ),
         StructuredTool.from_function(
             func=generate_chart,
+            coroutine=agenerate_chart,
             name="generate_chart",
             description="Prepares data for chart generation. Input: JSON, dict, or args for columns, data, and chart_type. Returns: Dict with processed data for later chart creation.",
             args_schema=ChartInput
@@ -121,38 +173,12 @@ def sql_agent_tools(db: Session):
 def create_chart_image(chart_data):
     """
     Create a chart image from the provided data.
+    Rendering is delegated to the shared ChartRenderer, which caches by content hash.
     
     :param chart_data: Dictionary containing the chart data.
-    :return: Base64-encoded string of the chart image or error message.
+    :return: HTML img tag for the chart (inline data URI or /charts URL) or error message.
     """
     try:
-        columns = chart_data['columns']
-        data = chart_data['data']
-        chart_type = chart_data['chart_type']
-
-        # Create a DataFrame from the data
-        df = pd.DataFrame(data, columns=columns)
-
-        plt.figure(figsize=(10, 6))  # Increased figure size
-        if chart_type == "bar":
-            df.plot(kind="bar", x=columns[0], y=columns[1])
-        elif chart_type == "line":
-            df.plot(kind="line", x=columns[0], y=columns[1])
-        elif chart_type == "pie":
-            plt.pie(df[columns[1]], labels=df[columns[0]], autopct='%1.1f%%')
-        elif chart_type == "scatter":
-            plt.scatter(df[columns[0]], df[columns[1]])
-        
-        plt.title(f"{chart_type.capitalize()} Chart")
-        plt.xlabel(columns[0])
-        plt.ylabel(columns[1])
-        
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format="png", dpi=300)  # Increased DPI for better quality
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        plt.close()  # Close the figure to free up memory
-
-        return f"<img src='data:image/png;base64,{image_base64}' alt='{chart_type.capitalize()} Chart' />"
+        return chart_renderer.render(chart_data)
     except Exception as e:
         return f"Error creating chart: {str(e)}"
@@ -0,0 +1,117 @@
+import html
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import RESULT_TABLE_MAX_ROWS, PUBLIC_BASE_URL
+from database.result_store import ResultStore, result_store
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+# Placeholder the agent writes where a query result should be shown as a table
+TABLE_PLACEHOLDER = re.compile(r"\[table:(\w+)\]")
+
+def format_cell(value: Any) -> str:
+    """
+    Format a result value for display, independently of the model.
+    Integers get thousands separators and other numbers two decimals; text is HTML-escaped.
+
+    :param value: Value from a stored result row.
+    :return: Cell text.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return html.escape(str(value))
+
+class ResultTableRenderer:
+    """
+    Renders the tables of an agent answer from stored query results.
+    The agent cites a result with `[table:<handle>]` instead of typing its rows; each
+    placeholder is replaced by an HTML table of the first `max_rows` rows, formatted with
+    format_cell. Tables carry the handle (`data-result-handle`), so clients can page the
+    full result as JSON from /results/{handle}. Unknown or expired handles are dropped.
+    """
+
+    def __init__(self, store: ResultStore = result_store, max_rows: int = RESULT_TABLE_MAX_ROWS,
+                 base_url: str = PUBLIC_BASE_URL):
+        self.store = store
+        self.max_rows = max_rows
+        self.base_url = (base_url or "").rstrip("/")
+        self._lock = threading.Lock()
+        self.tables = 0
+        self.rows = 0
+        self.missing = 0
+
+    def _to_html(self, page: Dict[str, Any]) -> str:
+        header = "".join(f"<th>{html.escape(str(column))}</th>" for column in page["columns"])
+        body = "".join(
+            "<tr>" + "".join(f"<td>{format_cell(value)}</td>" for value in row) + "</tr>" for row in page["rows"]
+        )
+        table = (
+            f'<table data-result-handle="{page["handle"]}">'
+            f"<thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>"
+        )
+        if page["row_count"] > len(page["rows"]):
+            export_url = f"{self.base_url}/results/{page['handle']}/export"
+            table += (
+                f"\n<p>Showing {len(page['rows'])} of {page['row_count']:,} rows. "
+                f'<a href="{export_url}">Download the full result</a></p>'
+            )
+        return table
+
+    def expand(self, output: Any) -> Tuple[Any, List[Dict[str, Any]]]:
+        """
+        Replace the table placeholders of an agent answer.
+
+        :param output: The agent output.
+        :return: Tuple of the output with HTML tables and the tables as JSON (handle, columns, rows, row_count).
+        """
+        if not isinstance(output, str) or "[table:" not in output:
+            return output, []
+        pages: Dict[str, Optional[Dict[str, Any]]] = {}
+        for handle in TABLE_PLACEHOLDER.findall(output):
+            if handle not in pages:
+                pages[handle] = self.store.page(handle, 0, self.max_rows)
+
+        def replace(match: re.Match) -> str:
+            page = pages[match.group(1)]
+            return self._to_html(page) if page is not None else ""
+
+        output = TABLE_PLACEHOLDER.sub(replace, output)
+        tables = [
+            {key: page[key] for key in ("handle", "columns", "rows", "row_count")}
+            for page in pages.values() if page is not None
+        ]
+        missing = [handle for handle, page in pages.items() if page is None]
+        if missing:
+            logger.warning(f"Dropped table placeholders with unknown result handles: {missing}")
+        with self._lock:
+            self.tables += len(tables)
+            self.rows += sum(len(table["rows"]) for table in tables)
+            self.missing += len(missing)
+        return output, tables
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get renderer statistics.
+
+        :return: Dictionary with the tables and rows rendered and the placeholders dropped.
+        """
+        with self._lock:
+            return {
+                "max_rows": self.max_rows,
+                "tables": self.tables,
+                "rows": self.rows,
+                "missing_handles": self.missing,
+            }
+
+# Shared renderer of answer tables used by the agent
+result_tables = ResultTableRenderer()
@@ -1,41 +1,236 @@
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.schema import Document
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
 from langchain.tools import Tool
+from config import FEW_SHOT_EMBEDDINGS, FEW_SHOT_INDEX_DIR, FEW_SHOT_K
 from .tools_constants import retriever_tool_description, few_shots_examples
 
-def get_retriever_tool():
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+class HashingEmbeddings(Embeddings):
     """
-    Create and configure a retriever tool for few-shot learning examples.
-    
-    :return: Configured Tool instance for retrieving few-shot examples.
+    Local embeddings based on feature hashing, requiring no model or network access.
+    Word unigrams, word bigrams and character trigrams are hashed into a fixed number
+    of dimensions, weighted by sublinear term frequency and L2-normalized, so inner
+    product equals cosine similarity.
     """
-    # Initialize OpenAI embeddings
-    embeddings = OpenAIEmbeddings()
 
-    # Create Document instances for few-shot examples
-    few_shot_docs = [
-        Document(
-            page_content=question, metadata={"sql_query": few_shots_examples[question]}
+    def __init__(self, dimensions: int = 1024):
+        self.dimensions = dimensions
+
+    @property
+    def name(self) -> str:
+        return f"hashing-{self.dimensions}"
+
+    def _features(self, text: str) -> List[str]:
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        features = [f"w:{word}" for word in words]
+        features += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+        for word in words:
+            padded = f" {word} "
+            features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return features
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of texts into one float32 matrix.
+
+        :param texts: Texts to embed.
+        :return: Array of shape (len(texts), dimensions).
+        """
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dimensions] += 1.0 if value >> 63 else -1.0
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+def get_embeddings(backend: str = FEW_SHOT_EMBEDDINGS) -> Embeddings:
+    """
+    Get the embedding backend used by the few-shot index.
+
+    :param backend: "hashing" for local embeddings or "openai" for OpenAIEmbeddings.
+    :return: Embeddings instance.
+    """
+    if backend == "hashing":
+        return HashingEmbeddings()
+    elif backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings()
+    else:
+        raise ValueError(f"Unsupported few-shot embeddings: {backend}")
+
+def _embedding_name(embeddings: Embeddings) -> str:
+    return getattr(embeddings, "name", None) or getattr(embeddings, "model", None) or type(embeddings).__name__
+
+def _embed_batch(embeddings: Embeddings, texts: List[str]) -> np.ndarray:
+    if isinstance(embeddings, HashingEmbeddings):
+        return embeddings.embed_array(texts)
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+class FewShotIndex:
+    """
+    FAISS index over the few-shot example questions, persisted to disk.
+    The index file name carries a content hash of the examples and the embedding
+    backend, so it is built once, memory-mapped on later starts and rebuilt only
+    when the examples or the embeddings change.
+    """
+
+    def __init__(self, examples: Dict[str, str] = None, embeddings: Embeddings = None,
+                 index_dir: str = FEW_SHOT_INDEX_DIR):
+        self.examples = examples if examples is not None else few_shots_examples
+        self.embeddings = embeddings or get_embeddings()
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._index = None
+        self._questions: List[str] = []
+        self.source = None
+        self.load_seconds = 0.0
+        self.searches = 0
+        self.queries = 0
+
+    def content_hash(self) -> str:
+        """
+        Compute the hash identifying the examples and the embedding backend.
+
+        :return: Hex digest used in the index file name.
+        """
+        payload = json.dumps(
+            {"examples": self.examples, "embeddings": _embedding_name(self.embeddings)}, sort_keys=True
         )
-        for question in few_shots_examples.keys()
-    ]
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def _paths(self) -> Tuple[str, str]:
+        base = os.path.join(self.index_dir, f"few_shots_{self.content_hash()}")
+        return base + ".faiss", base + ".json"
+
+    def _load(self):
+        import faiss
+
+        started = time.perf_counter()
+        index_path, questions_path = self._paths()
+        if os.path.exists(index_path) and os.path.exists(questions_path):
+            self._index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            with open(questions_path, "r", encoding="utf-8") as f:
+                self._questions = json.load(f)
+            self.source = "disk"
+        else:
+            self._questions = list(self.examples)
+            vectors = _embed_batch(self.embeddings, self._questions)
+            self._index = faiss.IndexFlatIP(vectors.shape[1])
+            self._index.add(vectors)
+            try:
+                os.makedirs(self.index_dir, exist_ok=True)
+                # Write under temporary names and rename, so concurrent workers never read a partial index
+                suffix = f".{os.getpid()}.tmp"
+                faiss.write_index(self._index, index_path + suffix)
+                with open(questions_path + suffix, "w", encoding="utf-8") as f:
+                    json.dump(self._questions, f)
+                os.replace(questions_path + suffix, questions_path)
+                os.replace(index_path + suffix, index_path)
+            except OSError as e:
+                logger.warning(f"Could not persist few-shot index: {str(e)}")
+            self.source = "built"
+        self.load_seconds = time.perf_counter() - started
+        logger.info(f"Few-shot index ready ({self.source}, {len(self._questions)} examples) in {self.load_seconds:.3f}s")
+
+    def ensure_loaded(self):
+        """
+        Load the index from disk, or build and persist it, on first use.
+        """
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._load()
+
+    def search(self, queries: List[str], k: int = FEW_SHOT_K) -> List[List[Dict[str, Any]]]:
+        """
+        Find the most similar examples for a batch of queries.
+        All queries are embedded in one call and searched in one FAISS lookup.
+
+        :param queries: Query strings.
+        :param k: Number of examples to return per query.
+        :return: For each query, a list of dictionaries with question, sql_query and score.
+        """
+        self.ensure_loaded()
+        k = min(k, len(self._questions))
+        if not queries or k == 0:
+            return [[] for _ in queries]
+        scores, ids = self._index.search(_embed_batch(self.embeddings, queries), k)
+        with self._lock:
+            self.searches += 1
+            self.queries += len(queries)
+        return [
+            [
+                {"question": self._questions[i], "sql_query": self.examples[self._questions[i]], "score": float(score)}
+                for i, score in zip(row_ids, row_scores) if i >= 0
+            ]
+            for row_ids, row_scores in zip(ids, scores)
+        ]
 
-    # Create a FAISS vector store from the documents and embeddings
-    vector_db = FAISS.from_documents(few_shot_docs, embeddings)
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get index statistics.
+
+        :return: Dictionary with the index source, load time and search counts.
+        """
+        with self._lock:
+            return {
+                "embeddings": _embedding_name(self.embeddings),
+                "examples": len(self._questions),
+                "source": self.source,
+                "load_seconds": self.load_seconds,
+                "searches": self.searches,
+                "queries": self.queries,
+            }
+
+# Shared few-shot index used by the retriever tool
+few_shot_index = FewShotIndex()
+
+@lru_cache(maxsize=1)
+def get_retriever_tool():
+    """
+    Create and configure a retriever tool for few-shot learning examples.
+    The tool is shared by all agents and backed by the persistent few-shot index.
 
-    # Create a retriever from the vector store
-    retriever = vector_db.as_retriever()
+    :return: Configured Tool instance for retrieving few-shot examples.
+    """
+    few_shot_index.ensure_loaded()
 
     def retriever_func(query: str) -> str:
         """
-        Retrieve the most relevant few-shot example for the given query.
-        
+        Retrieve the most relevant few-shot examples for the given query.
+
         :param query: The query string.
-        :return: The page content of the most relevant example, or a default message if none found.
+        :return: The matching example questions with their SQL queries, or a default message if none found.
         """
-        results = retriever.get_relevant_documents(query)
-        return results[0].page_content if results else "No relevant examples found."
+        results = few_shot_index.search([query])[0]
+        if not results:
+            return "No relevant examples found."
+        return "\n\n".join(
+            f"Question: {result['question']}\nSQL query: {result['sql_query']}" for result in results
+        )
 
     # Create and return the Tool instance
     return Tool(
@@ -0,0 +1,43 @@
+from typing import List, Optional, Type
+
+from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import BaseSQLDatabaseTool
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from langchain_core.pydantic_v1 import BaseModel, Field
+from langchain_core.tools import BaseTool
+
+# Define the input model for the query checker
+class QueryCheckerInput(BaseModel):
+    query: str = Field(..., description="A detailed and SQL query to be checked.")
+
+class LocalQueryCheckerTool(BaseSQLDatabaseTool, BaseTool):
+    """
+    Checks a query with the database's local SQL validator instead of an LLM call.
+    Returns the query to run (with a LIMIT added if it had none) or a precise error.
+    """
+    name: str = "sql_db_query_checker"
+    description: str = (
+        "Use this tool to double check if your query is correct before executing it. "
+        "Always use this tool before executing a query with sql_db_query! "
+        "Returns the query to execute, or an error explaining what to fix."
+    )
+    args_schema: Type[BaseModel] = QueryCheckerInput
+
+    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        return self.db.sql_validator.check(query)
+
+    async def _arun(self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
+        # Validation only compiles the statement, so it runs inline rather than in a thread
+        return self.db.sql_validator.check(query)
+
+class RetailSQLDatabaseToolkit(SQLDatabaseToolkit):
+    """
+    SQLDatabaseToolkit whose sql_db_query_checker is the local validator,
+    saving one tool LLM round trip per query.
+    """
+
+    def get_tools(self) -> List[BaseTool]:
+        return [
+            LocalQueryCheckerTool(db=self.db) if tool.name == "sql_db_query_checker" else tool
+            for tool in super().get_tools()
+        ]
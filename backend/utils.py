@@ -1,33 +1,70 @@
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
 from functools import lru_cache
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueListener, RotatingFileHandler
 import os
-from config import OPENAI_API_KEY, GOOGLE_API_KEY
+import queue
+import threading
+from config import (
+    OPENAI_API_KEY, GOOGLE_API_KEY, PROMPT_CACHE_ENABLED, OPENAI_BASE_URL, LLM_FALLBACKS, LOG_LEVEL, LOG_FILE_LEVEL,
+    LOG_FORMAT,
+)
+from llm_clients import ManagedChatModel, LLMThrottled, get_http_clients
+from prompt_cache import prompt_cache
+from structured_logging import JsonFormatter, TextFormatter, LocalQueueHandler
+
+# Classes of the managed chat models, defined on first use so a worker only imports the provider packages it calls
+@lru_cache(maxsize=1)
+def _managed_chat_openai_class():
+    from langchain_openai import ChatOpenAI
+
+    class ManagedChatOpenAI(ManagedChatModel, ChatOpenAI):
+        """
+        ChatOpenAI with client-side rate limiting and retries (see llm_clients.ManagedChatModel).
+        """
+
+    return ManagedChatOpenAI
+
+@lru_cache(maxsize=1)
+def _managed_chat_gemini_class():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    class ManagedChatGoogleGenerativeAI(ManagedChatModel, ChatGoogleGenerativeAI):
+        """
+        ChatGoogleGenerativeAI with client-side rate limiting and retries (see llm_clients.ManagedChatModel).
+        """
+
+    return ManagedChatGoogleGenerativeAI
 
 # Function to get OpenAI chat model with caching
 @lru_cache(maxsize=2)
-def get_chat_openai(model_name: str) -> ChatOpenAI:
+def get_chat_openai(model_name: str):
     """
     Get an instance of the OpenAI chat model with specified configurations.
-    Uses LRU cache to store up to 2 instances.
+    Uses LRU cache to store up to 2 instances. All instances share pooled keep-alive
+    HTTP connections; retries are done by the managed layer, not the OpenAI client.
     
     :param model_name: Name of the OpenAI model to use.
     :return: Configured ChatOpenAI instance.
     """
-    return ChatOpenAI(
+    http_client, http_async_client = get_http_clients()
+    return _managed_chat_openai_class()(
         openai_api_key=OPENAI_API_KEY,
+        openai_api_base=OPENAI_BASE_URL,
         model_name=model_name,
         temperature=0.2,
         max_tokens=3000,
         streaming=True,
         verbose=False,
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        cache=prompt_cache if PROMPT_CACHE_ENABLED else None,
     )
 
 # Function to get Google Generative AI chat model with caching
 @lru_cache(maxsize=2)
-def get_chat_gemini(model_name: str) -> ChatGoogleGenerativeAI:
+def get_chat_gemini(model_name: str):
     """
     Get an instance of the Google Generative AI chat model with specified configurations.
     Uses LRU cache to store up to 2 instances.
@@ -35,49 +72,121 @@ def get_chat_gemini(model_name: str) -> ChatGoogleGenerativeAI:
     :param model_name: Name of the Google Generative AI model to use.
     :return: Configured ChatGoogleGenerativeAI instance.
     """
-    return ChatGoogleGenerativeAI(
+    return _managed_chat_gemini_class()(
         google_api_key=GOOGLE_API_KEY,
         model=model_name,
         temperature=0,
         max_output_tokens=3000,
+        cache=prompt_cache if PROMPT_CACHE_ENABLED else None,
+    )
+
+def _provider_chat_model(model_name: str):
+    if model_name.startswith("gemini"):
+        return get_chat_gemini(model_name=model_name)
+    return get_chat_openai(model_name=model_name)
+
+def _failover_errors() -> tuple:
+    # Errors that still fail after the managed retries and are worth sending to the other provider
+    import openai
+    from google.api_core import exceptions as google_exceptions
+
+    return (
+        LLMThrottled,
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
     )
 
+# Function to get a chat model with failover to another provider
+@lru_cache(maxsize=4)
+def get_chat_model(model_name: str):
+    """
+    Get the chat model for a model name, with automatic failover.
+    When a fallback is configured for the model (LLM_FALLBACKS) and its provider's API key
+    is set, calls that are throttled or fail after retries are sent to the fallback model.
+    
+    :param model_name: Name of the LLM (gpt-4o or gemini-pro).
+    :return: Chat model, or a runnable with fallbacks exposing the same interface.
+    """
+    primary = _provider_chat_model(model_name)
+    fallbacks = dict(entry.split("=", 1) for entry in LLM_FALLBACKS.split(",") if "=" in entry)
+    fallback_name = fallbacks.get(model_name, "").strip()
+    if not fallback_name or not (GOOGLE_API_KEY if fallback_name.startswith("gemini") else OPENAI_API_KEY):
+        return primary
+    return primary.with_fallbacks([_provider_chat_model(fallback_name)], exceptions_to_handle=_failover_errors())
+
+# Listener writing the queued application logs, set by the first setup_logging call
+_log_listener = None
+_log_lock = threading.Lock()
+
 # Function to set up logging configuration
 def setup_logging():
     """
     Set up logging configuration for the application.
     Creates log directory and file if they do not exist.
-    Configures logging handlers and formatters.
+    Records from every application logger are put on a queue and written to the console and the
+    rotating log file (JSON lines) by a listener thread, so requests never wait on log I/O.
+    Calling it again is a no-op.
     
     :return: Configured logger instance.
     """
-    log_dir = "logs"
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    global _log_listener
+    logger = logging.getLogger("retail_insights")
+    with _log_lock:
+        if _log_listener is not None:
+            return logger
 
-    log_file = os.path.join(log_dir, "retail_insights.log")
+        log_dir = "logs"
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
 
-    # Create a custom logger
-    logger = logging.getLogger("retail_insights")
-    logger.setLevel(logging.DEBUG)
+        log_file = os.path.join(log_dir, "retail_insights.log")
 
-    # Create handlers for console and file logging
-    c_handler = logging.StreamHandler()
-    f_handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)
-    c_handler.setLevel(logging.INFO)
-    f_handler.setLevel(logging.DEBUG)
+        # Create handlers for console and file logging
+        c_handler = logging.StreamHandler()
+        f_handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)
+        c_handler.setLevel(LOG_LEVEL)
+        f_handler.setLevel(LOG_FILE_LEVEL)
 
-    # Create formatters and add it to handlers
-    c_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    c_handler.setFormatter(c_format)
-    f_handler.setFormatter(f_format)
+        # Create formatters and add it to handlers
+        if LOG_FORMAT == "json":
+            c_handler.setFormatter(JsonFormatter())
+        else:
+            c_handler.setFormatter(TextFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        f_handler.setFormatter(JsonFormatter())
 
-    # Add handlers to the logger
-    logger.addHandler(c_handler)
-    logger.addHandler(f_handler)
+        # The handlers run on the listener's thread; the logger only enqueues records
+        log_queue = queue.SimpleQueue()
+        _log_listener = QueueListener(log_queue, c_handler, f_handler, respect_handler_level=True)
+        _log_listener.start()
+        atexit.register(shutdown_logging)
 
+        # Module loggers (logging.getLogger(__name__)) all reach the queue through the root logger.
+        # Third-party libraries stay at WARNING so their debug output (e.g. full request payloads)
+        # never reaches the log file
+        level = min(c_handler.level, f_handler.level)
+        root = logging.getLogger()
+        root.setLevel(max(level, logging.WARNING))
+        root.addHandler(LocalQueueHandler(log_queue))
+        app_dir = os.path.dirname(os.path.abspath(__file__))
+        app_modules = [
+            os.path.splitext(entry.name)[0] for entry in os.scandir(app_dir)
+            if not entry.name.startswith(("_", ".")) and (entry.is_dir() or entry.name.endswith(".py"))
+        ]
+        for name in ["retail_insights", "__main__"] + app_modules:
+            logging.getLogger(name).setLevel(level)
     return logger
 
-# Initialize the logger
-logger = setup_logging()
+# Function to flush the queued logs and stop the listener thread
+def shutdown_logging():
+    """
+    Write the records still queued and stop the listener. Registered to run at exit;
+    calling it again is a no-op.
+    """
+    global _log_listener
+    with _log_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+            _log_listener = None
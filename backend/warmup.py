@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+# Set up the logger for this module
+logger = logging.getLogger(__name__)
+
+class Warmup:
+    """
+    Start-up steps of a worker (loading data, building the agent, indexes) and their progress.
+    The steps run in order in a background task after the server starts listening, so
+    /healthz answers immediately and /readyz reports progress until every step is done.
+    A failed step stops the warm-up and leaves the worker not ready.
+    """
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        self._steps: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.ready = False
+        self.ready_seconds = None
+
+    def _update(self, name: str, **fields):
+        with self._lock:
+            self._steps[name].update(fields)
+
+    async def run(self, steps: List[Tuple[str, Callable[[], Any]]]):
+        """
+        Run the start-up steps one after another in worker threads.
+
+        :param steps: List of (name, function) tuples.
+        """
+        with self._lock:
+            for name, _ in steps:
+                self._steps[name] = {"status": "pending", "seconds": None}
+        for name, step in steps:
+            self._update(name, status="running")
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(step)
+            except Exception as e:
+                self._update(name, status="failed", seconds=time.perf_counter() - started, error=str(e))
+                logger.exception(f"Warm-up step {name} failed")
+                return
+            self._update(name, status="done", seconds=time.perf_counter() - started)
+        self.ready = True
+        self.ready_seconds = time.perf_counter() - self.created
+        logger.info(f"Worker ready in {self.ready_seconds:.2f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get warm-up progress.
+
+        :return: Dictionary with readiness, the time to ready and the status and duration of each step.
+        """
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "ready_seconds": self.ready_seconds,
+                "uptime_seconds": time.perf_counter() - self.created,
+                "steps": {name: dict(step) for name, step in self._steps.items()},
+            }
+
+# Shared warm-up progress of this worker, reported by the health endpoints
+warmup = Warmup()
@@ -7,6 +7,7 @@ function Chatbot() {
   const [messages, setMessages] = useState([]); // State to keep track of messages
   const [input, setInput] = useState(''); // State to keep track of the current input value
   const [isLoading, setIsLoading] = useState(false); // State to track if a request is in progress
+  const [sessionId, setSessionId] = useState(null); // Server-side session holding the conversation history
   const messagesEndRef = useRef(null); // Reference to the end of the messages container
   const userAvatar = "https://placehold.co/30x30/blue/white?text=U"; // User avatar URL
   const botAvatar = "https://placehold.co/30x30/green/white?text=AI"; // Bot avatar URL
@@ -37,14 +38,12 @@ function Chatbot() {
     setIsLoading(true); // Set loading state to true
     console.log("Sending request to backend...");
 
-    // Prepare chat history for the backend request
-    const chat_history = messages.map(msg => `${msg.sender}: ${msg.text}`);
-    
+    // The backend keeps the chat history in the session, so only its id is sent
     const requestBody = {
       input: input,
       tool_llm_name: "gpt-4o",
       agent_llm_name: "gpt-4o",
-      chat_history: chat_history
+      session_id: sessionId
     };
     console.log("Sending request with body:", JSON.stringify(requestBody));
     
@@ -59,6 +58,10 @@ function Chatbot() {
       });
       console.log("Response received:", response);
       
+      if (response.status === 404 && sessionId) {
+        setSessionId(null); // The session expired; the next question starts a new one
+      }
+
       if (!response.ok) {
         const errorData = await response.json();
         console.error('Error details:', errorData);
@@ -67,6 +70,7 @@ function Chatbot() {
       
       const data = await response.json();
       console.log("Data received:", data);
+      setSessionId(data.session_id);
       
       // Extract only the output from the response
       const botOutput = typeof data.output === 'object' ? data.output.output : data.output;